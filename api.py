@@ -1,13 +1,25 @@
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+import asyncio
+import gc
+import json
+import logging
 import uuid
 from typing import Dict, Optional
-from main import langgraph_entrapeer, State
+import config
+from main import langgraph_entrapeer, State, memory, warm_up, models_ready, initial_state
 from langgraph.types import Command, interrupt
+from checkpointing import create_conversation_store
+from lifecycle import ConversationLifecycleManager
+from metrics import metrics
+from tracing import trace_request, traces
+from batch import parse_questions, run_batch
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
@@ -22,7 +34,17 @@ app.add_middleware(
 
 templates = Jinja2Templates(directory="templates")
 
-conversations: Dict[str, dict] = {}
+if config.PRELOAD_MODELS:
+    warm_up()
+    # Keep the preloaded objects out of future collections so the GC does not
+    # write to (and un-share) their pages in the forked workers
+    gc.freeze()
+
+# Shared with every worker using the same checkpoint backend. Store and
+# lifecycle calls (SQLite, and checkpoint deletes on finish or eviction) run in
+# a worker thread so a locked database never stalls the event loop
+conversations = create_conversation_store()
+lifecycle = ConversationLifecycleManager(conversations, memory)
 
 class Question(BaseModel):
     text: str
@@ -33,6 +55,39 @@ class Response(BaseModel):
     requires_input: bool
     final_answer: Optional[str] = None
 
+def interrupt_value(event):
+    interrupts = event["__interrupt__"]
+    first = interrupts[0] if isinstance(interrupts, (list, tuple)) else interrupts
+    return str(getattr(first, "value", first))
+
+@app.on_event("startup")
+async def start_conversation_sweeper():
+    lifecycle.start_sweeper()
+
+@app.on_event("startup")
+async def warm_up_models():
+    # Runs in the background so the worker accepts requests (and /ready answers) immediately
+    app.state.warm_up_task = None
+    if config.WARM_UP_ON_STARTUP and not all(models_ready().values()):
+        app.state.warm_up_task = asyncio.create_task(asyncio.to_thread(warm_up))
+
+@app.on_event("shutdown")
+async def stop_conversation_sweeper():
+    await lifecycle.stop_sweeper()
+
+@app.get("/ready")
+async def ready():
+    models = models_ready()
+    is_ready = all(models.values())
+    error = None
+    task = app.state.warm_up_task
+    if task is not None and task.done() and not task.cancelled() and task.exception() is not None:
+        error = str(task.exception())
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"ready": is_ready, "models": models, "error": error}
+    )
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
     with open("templates/index.html") as f:
@@ -45,62 +100,29 @@ async def start_conversation(question: Question):
     conversation_id = str(uuid.uuid4())
     thread = {"configurable": {"thread_id": conversation_id}}
 
-    initial_input = {
-        "input": question.text,
-        "company_name": "",
-        "company_detail": "",
-        "company_list": [],
-        "intent_detail": "",
-        "search_input": "",
-        "update_input": "",
-        "needs_refinement": False,
-        "refined_query": "",
-        "evaluation_result": "",
-        "data_retrieval_general_output": "",
-        "intent": "",
-        "intent_ambiguity": "",
-        "feedback": "",
-        "question_to_user": "",
-        "data_retrieval_tavily_input": "",
-        "data_retrieval_wikipedia_input": "",
-        "data_retrieval_tavily_output": "",
-        "data_retrieval_wikipedia_output": "",
-        "dummy_state_input": "",
-        "final_answer": "",
-        "original_company_name": "",
-        "url_summary": ""
-    }
-
-    conversations[conversation_id] = {
-        "thread": thread,
-        "waiting_for_input": False,
-        "last_event": None
-    }
+    initial_input = initial_state(question.text)
+
+    conversation = await asyncio.to_thread(lifecycle.start, conversation_id)
 
     try:
-        for event in langgraph_entrapeer.stream(initial_input, thread, stream_mode="updates"):
+        with trace_request(conversation_id, "start_conversation"):
+            async for event in langgraph_entrapeer.astream(initial_input, thread, stream_mode="updates"):
             
-            if isinstance(event, dict):
-                if "__interrupt__" in event:
-                    conversations[conversation_id]["waiting_for_input"] = True
-                    conversations[conversation_id]["last_event"] = event
-                    interrupt_value = event["__interrupt__"][0]["value"] if isinstance(event["__interrupt__"], list) else event["__interrupt__"]
-                    interrupt_value_str = str(interrupt_value)
-                    # Find the start and end positions
-                    value_start = interrupt_value_str.find("value=") + 7  # length of "value='"
-                    value_end = interrupt_value_str.find(", resumable=")
-                    # Extract the value
-                    interrupt_value_sentence = interrupt_value_str[value_start:value_end-1]
-                    # Add newlines to the message
-                    formatted_message = interrupt_value_sentence.replace(". ", ".\n").replace("?", "?\n")
-                    return Response(
-                        conversation_id=conversation_id,
-                        message=formatted_message,
-                        requires_input=True
-                    )
+                if isinstance(event, dict):
+                    if "__interrupt__" in event:
+                        await asyncio.to_thread(lifecycle.wait_for_input, conversation_id, conversation)
+                        interrupt_value_sentence = interrupt_value(event)
+                        # Add newlines to the message
+                        formatted_message = interrupt_value_sentence.replace(". ", ".\n").replace("?", "?\n")
+                        return Response(
+                            conversation_id=conversation_id,
+                            message=formatted_message,
+                            requires_input=True
+                        )
 
-        state = langgraph_entrapeer.get_state(thread)
+        state = await langgraph_entrapeer.aget_state(thread)
         final_answer = state.values.get("final_answer", "No answer available")
+        await asyncio.to_thread(lifecycle.finish, conversation_id)
         return Response(
             conversation_id=conversation_id,
             message="Conversation complete",
@@ -109,41 +131,44 @@ async def start_conversation(question: Question):
         )
 
     except Exception as e:
+        await asyncio.to_thread(lifecycle.release, conversation_id)
         import traceback
         error_detail = f"Error: {str(e)}\nTraceback:\n{traceback.format_exc()}"
-        print("114", error_detail) 
+        logger.error("start_conversation %s failed: %s", conversation_id, error_detail)
         raise HTTPException(status_code=500, detail=error_detail)
 
 
 @app.post("/continue_conversation/{conversation_id}")
 async def continue_conversation(conversation_id: str, response: Question):
-    if conversation_id not in conversations:
+    conversation = await asyncio.to_thread(conversations.get, conversation_id)
+    if conversation is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
-
-    conversation = conversations[conversation_id]
+    thread = {"configurable": {"thread_id": conversation_id}}
     
     if not conversation["waiting_for_input"]:
         raise HTTPException(status_code=400, detail="No input expected for this conversation")
+    conversation = await asyncio.to_thread(lifecycle.resume, conversation_id)
+    if conversation is None:
+        raise HTTPException(status_code=409, detail="Conversation is already being continued")
    
     try:
-        for event in langgraph_entrapeer.stream(
-            Command(resume=response.text),
-            conversation["thread"],
-            stream_mode="updates"
-        ):
-            if isinstance(event, dict) and "__interrupt__" in event:  
-                conversation["last_event"] = event
-                conversation["waiting_for_input"] = True  
-                return Response(
-                    conversation_id=conversation_id,
-                    message=event["__interrupt__"][0]["value"],
-                    requires_input=True
-                )
+        with trace_request(conversation_id, "continue_conversation"):
+            async for event in langgraph_entrapeer.astream(
+                Command(resume=response.text),
+                thread,
+                stream_mode="updates"
+            ):
+                if isinstance(event, dict) and "__interrupt__" in event:  
+                    await asyncio.to_thread(lifecycle.wait_for_input, conversation_id, conversation)
+                    return Response(
+                        conversation_id=conversation_id,
+                        message=interrupt_value(event),
+                        requires_input=True
+                    )
 
         
-        conversation["waiting_for_input"] = False
-        final_answer = langgraph_entrapeer.get_state(conversation["thread"]).values.get("final_answer")
-        conversations.pop(conversation_id) 
+        final_answer = (await langgraph_entrapeer.aget_state(thread)).values.get("final_answer")
+        await asyncio.to_thread(lifecycle.finish, conversation_id)
 
         return Response(
             conversation_id=conversation_id,
@@ -153,50 +178,123 @@ async def continue_conversation(conversation_id: str, response: Question):
         )
 
     except Exception as e:
-        print("156", e) 
+        await asyncio.to_thread(lifecycle.release, conversation_id)
+        logger.exception("continue_conversation %s failed", conversation_id)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 
+def sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_graph(conversation_id: str, graph_input, conversation: Dict, endpoint: str):
+    """
+    Server-sent events for one run of the graph: `conversation` first, then
+    `progress` and `token` events written by the nodes, and finally either
+    `interrupt` (the conversation waits for /stream_conversation/{id}),
+    `done` with the final answer, or `error`.
+    """
+    thread = {"configurable": {"thread_id": conversation_id}}
+    try:
+        yield sse("conversation", {"conversation_id": conversation_id})
+        with trace_request(conversation_id, endpoint):
+            async for mode, chunk in langgraph_entrapeer.astream(graph_input, thread, stream_mode=["custom", "updates"]):
+                if mode == "custom":
+                    yield sse(chunk.get("type", "progress"), chunk)
+                elif isinstance(chunk, dict) and "__interrupt__" in chunk:
+                    await asyncio.to_thread(lifecycle.wait_for_input, conversation_id, conversation)
+                    yield sse("interrupt", {"conversation_id": conversation_id, "message": interrupt_value(chunk)})
+                    return
+
+        final_answer = (await langgraph_entrapeer.aget_state(thread)).values.get("final_answer")
+        await asyncio.to_thread(lifecycle.finish, conversation_id)
+        yield sse("done", {"conversation_id": conversation_id, "final_answer": final_answer})
+    except Exception as e:
+        logger.exception("stream %s failed", conversation_id)
+        yield sse("error", {"conversation_id": conversation_id, "detail": str(e)})
+    finally:
+        # Also covers clients that disconnect mid-stream
+        await asyncio.to_thread(lifecycle.release, conversation_id)
+
+def event_stream(events) -> StreamingResponse:
+    return StreamingResponse(events, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/stream_conversation")
+async def stream_conversation(question: Question):
+    conversation_id = str(uuid.uuid4())
+    conversation = await asyncio.to_thread(lifecycle.start, conversation_id)
+    return event_stream(stream_graph(conversation_id, initial_state(question.text), conversation, "stream_conversation"))
+
+@app.post("/stream_conversation/{conversation_id}")
+async def continue_stream_conversation(conversation_id: str, response: Question):
+    conversation = await asyncio.to_thread(conversations.get, conversation_id)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    if not conversation["waiting_for_input"]:
+        raise HTTPException(status_code=400, detail="No input expected for this conversation")
+    conversation = await asyncio.to_thread(lifecycle.resume, conversation_id)
+    if conversation is None:
+        raise HTTPException(status_code=409, detail="Conversation is already being continued")
+    return event_stream(stream_graph(conversation_id, Command(resume=response.text), conversation, "continue_stream_conversation"))
+
+
 @app.get("/getResponse")
 async def get_response(msg: str = Query(...)):
     conversation_id = str(uuid.uuid4())
     thread = {"configurable": {"thread_id": conversation_id}}
 
-    initial_input = {
-        "input": msg,
-        "company_name": "",
-        "company_detail": "",
-        "company_list": [],
-        "intent_detail": "",
-        "search_input": "",
-        "update_input": "",
-        "needs_refinement": False,
-        "refined_query": "",
-        "evaluation_result": "",
-        "data_retrieval_general_output": "",
-        "intent": "",
-        "intent_ambiguity": "",
-        "feedback": "",
-        "question_to_user": "",
-        "data_retrieval_tavily_input": "",
-        "data_retrieval_wikipedia_input": "",
-        "data_retrieval_tavily_output": "",
-        "data_retrieval_wikipedia_output": "",
-        "dummy_state_input": "",
-        "final_answer": "",
-        "original_company_name": "",
-        "url_summary": ""
-    }
+    initial_input = initial_state(msg)
 
+    await asyncio.to_thread(lifecycle.start, conversation_id)
     try:
-        for event in langgraph_entrapeer.stream(initial_input, thread, stream_mode="updates"):
-            if type(event).__name__ == "Interrupt":                 
-                return str(event.value) if hasattr(event, "value") else "Please provide more information"
+        with trace_request(conversation_id, "getResponse"):
+            async for event in langgraph_entrapeer.astream(initial_input, thread, stream_mode="updates"):
+                if isinstance(event, dict) and "__interrupt__" in event:
+                    # There is no way to resume a /getResponse thread, so it ends here
+                    return interrupt_value(event) or "Please provide more information"
             
-        final_answer = langgraph_entrapeer.get_state(thread).values.get("final_answer")
+        final_answer = (await langgraph_entrapeer.aget_state(thread)).values.get("final_answer")
         return final_answer if final_answer else "No answer available"
 
     except Exception as e:
-        print("201", e) 
+        logger.exception("getResponse %s failed", conversation_id)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await asyncio.to_thread(lifecycle.finish, conversation_id)
+
+
+@app.post("/batch")
+async def batch_questions(request: Request, concurrency: int = Query(config.BATCH_CONCURRENCY, ge=1)):
+    """
+    Answers a JSONL body of questions (see batch.py) and streams one JSON line
+    per question as it completes.
+    """
+    try:
+        questions = parse_questions((await request.body()).decode("utf-8").splitlines())
+    except (UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def records():
+        async for record in run_batch(questions, min(concurrency, config.BATCH_MAX_CONCURRENCY)):
+            yield json.dumps(record) + "\n"
+
+    return StreamingResponse(records(), media_type="application/x-ndjson")
+
+
+@app.get("/conversations/stats")
+async def conversation_stats():
+    return await asyncio.to_thread(lifecycle.stats)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    # Per worker: every gunicorn worker keeps its own registry
+    return PlainTextResponse(metrics.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/traces/{conversation_id}")
+async def conversation_traces(conversation_id: str):
+    conversation_traces = traces.get(conversation_id)
+    if conversation_traces is None:
+        raise HTTPException(status_code=404, detail="No traces for this conversation")
+    return conversation_traces
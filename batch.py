@@ -0,0 +1,199 @@
+"""
+Bulk question answering over `langgraph_entrapeer`. Questions come as JSON
+lines, one object per question:
+
+    {"id": "tesla-hq", "text": "Where is Tesla headquartered?", "replies": ["Austin"]}
+
+`id` defaults to the line number and `replies` answer the questions the
+graph asks back, in order. Identical questions (same normalized text and
+replies) run once and every copy gets the answer. Answers are written as JSON
+lines in completion order, with the time and tokens each question took:
+
+    python batch.py questions.jsonl answers.jsonl --concurrency 16
+
+Rerunning with the same output file resumes: questions with a record in it
+are skipped, failed ones are retried. POST /batch runs the same over HTTP.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+import uuid
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+import config
+from metrics import metrics
+from scheduler import BATCH, priority
+
+Answer = Callable[[str, List[str]], Awaitable[Dict]]
+
+
+def question_key(text: str, replies: Iterable[str] = ()) -> str:
+    """Case and whitespace insensitive identity of a question and its replies."""
+    parts = [text, *replies]
+    return json.dumps([re.sub(r"\s+", " ", part).strip().casefold() for part in parts])
+
+
+def parse_questions(lines: Iterable[str]) -> List[Dict]:
+    """Questions of a JSONL document; raises ValueError naming the first bad line."""
+    questions = []
+    seen: Set[str] = set()
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"line {number}: invalid JSON ({e.msg})") from None
+        if isinstance(item, str):
+            item = {"text": item}
+        if not isinstance(item, dict) or not isinstance(item.get("text"), str) or not item["text"].strip():
+            raise ValueError(f"line {number}: expected an object with a non-empty \"text\"")
+        replies = item.get("replies") or []
+        if not isinstance(replies, list) or not all(isinstance(reply, str) for reply in replies):
+            raise ValueError(f"line {number}: \"replies\" must be a list of strings")
+        question_id = str(item.get("id", number))
+        if question_id in seen:
+            raise ValueError(f"line {number}: duplicate id {question_id!r}")
+        seen.add(question_id)
+        questions.append({"id": question_id, "text": item["text"], "replies": replies})
+    return questions
+
+
+def read_questions(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return parse_questions(f)
+
+
+def load_completed(path: str) -> Set[str]:
+    """
+    Ids answered in an earlier run of the output file. The file is rewritten
+    without failed records and without a line cut short by an interrupted
+    run, so resuming appends to a clean file.
+    """
+    if not os.path.exists(path):
+        return set()
+    completed, kept = set(), []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict) and record.get("status") != "error" and "id" in record:
+                completed.add(str(record["id"]))
+                kept.append(json.dumps(record))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.writelines(f"{line}\n" for line in kept)
+    os.replace(tmp_path, path)
+    return completed
+
+
+async def answer_question(text: str, replies: List[str]) -> Dict:
+    """
+    Run one question through the graph, answering its interrupts with
+    `replies`. A question still unanswered when the replies run out ends as
+    "needs_input" with the graph's question. The thread's checkpoints are
+    dropped afterwards since a batch conversation is never resumed.
+    """
+    # Imported here so parsing and resuming work without loading the graph
+    from langgraph.types import Command
+    from checkpointing import delete_thread
+    from main import initial_state, langgraph_entrapeer, memory
+    from tracing import trace_request
+
+    conversation_id = str(uuid.uuid4())
+    thread = {"configurable": {"thread_id": conversation_id}}
+    graph_input, replies = initial_state(text), list(replies)
+    try:
+        # Outbound calls of batch questions yield to interactive conversations
+        with priority(BATCH):
+            while True:
+                interrupt = None
+                with trace_request(conversation_id, "batch"):
+                    async for event in langgraph_entrapeer.astream(graph_input, thread, stream_mode="updates"):
+                        if isinstance(event, dict) and "__interrupt__" in event:
+                            interrupt = event["__interrupt__"]
+                if interrupt is None:
+                    break
+                if not replies:
+                    first = interrupt[0] if isinstance(interrupt, (list, tuple)) else interrupt
+                    return {"status": "needs_input", "question": str(getattr(first, "value", first))}
+                graph_input = Command(resume=replies.pop(0))
+            values = (await langgraph_entrapeer.aget_state(thread)).values
+            return {"status": "done", "final_answer": values.get("final_answer"), "tokens_used": values.get("tokens_used", 0)}
+    finally:
+        await asyncio.to_thread(delete_thread, memory, conversation_id)
+
+
+async def run_batch(questions: List[Dict], concurrency: Optional[int] = None,
+                    answer: Answer = answer_question) -> AsyncIterator[Dict]:
+    """Answer records of `questions` as they complete, at most `concurrency` questions at a time."""
+    groups: Dict[str, List[Dict]] = {}
+    for question in questions:
+        groups.setdefault(question_key(question["text"], question["replies"]), []).append(question)
+    semaphore = asyncio.Semaphore(max(1, concurrency or config.BATCH_CONCURRENCY))
+
+    async def run_group(group: List[Dict]) -> List[Dict]:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                result = await answer(group[0]["text"], group[0]["replies"])
+            except Exception as e:
+                result = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+            seconds = round(time.perf_counter() - start, 3)
+        metrics.increment("batch_questions_total", len(group), status=result["status"])
+        metrics.increment("batch_deduplicated_total", len(group) - 1)
+        return [{"id": question["id"], "text": question["text"], **result, "seconds": seconds,
+                 "duplicate_of": None if index == 0 else group[0]["id"]}
+                for index, question in enumerate(group)]
+
+    tasks = [asyncio.create_task(run_group(group)) for group in groups.values()]
+    try:
+        for next_group in asyncio.as_completed(tasks):
+            for record in await next_group:
+                yield record
+    finally:
+        # A consumer that stops early (client disconnect) cancels the rest
+        for task in tasks:
+            task.cancel()
+
+
+async def write_batch(questions: List[Dict], output_path: str, concurrency: Optional[int] = None,
+                      answer: Answer = answer_question) -> Dict[str, int]:
+    """Append the answers of the questions missing from `output_path` to it; returns counts by status."""
+    completed = load_completed(output_path)
+    pending = [question for question in questions if question["id"] not in completed]
+    counts = {"skipped": len(questions) - len(pending)}
+    with open(output_path, "a", encoding="utf-8") as f:
+        async for record in run_batch(pending, concurrency, answer):
+            f.write(json.dumps(record) + "\n")
+            # One line per question on disk, so an interrupted run loses nothing finished
+            f.flush()
+            counts[record["status"]] = counts.get(record["status"], 0) + 1
+    return counts
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions through the graph")
+    parser.add_argument("questions", help="JSONL file, one {\"id\", \"text\", \"replies\"} object per line")
+    parser.add_argument("output", help="JSONL answers, appended to when resuming")
+    parser.add_argument("--concurrency", type=int, default=config.BATCH_CONCURRENCY, help="questions run at a time")
+    args = parser.parse_args(argv)
+    try:
+        questions = read_questions(args.questions)
+    except ValueError as e:
+        parser.error(f"{args.questions}: {e}")
+    start = time.perf_counter()
+    counts = asyncio.run(write_batch(questions, args.output, args.concurrency))
+    print(f"{len(questions)} questions in {time.perf_counter() - start:.1f}s: "
+          + ", ".join(f"{count} {status}" for status, count in counts.items()))
+    return 1 if counts.get("error") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
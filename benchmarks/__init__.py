@@ -0,0 +1,4 @@
+"""
+Offline benchmarks for LangGraph Assessment: recorded OpenAI/Tavily responses
+replayed through the graph and the FastAPI app (python -m benchmarks.run).
+"""
@@ -0,0 +1,168 @@
+"""
+Load generator for a running API. Virtual users loop over the fixture
+scenarios, each one a full multi-turn conversation: /start_conversation,
+then /continue_conversation with the scenario's replies for as long as the
+graph asks a question. Run the API against benchmarks.stub_server to size
+workers and connection pools without spending API quota:
+
+    python -m benchmarks.load --url http://127.0.0.1:8000 --users 32 --duration 60
+
+Reports throughput, latency percentiles and error rates per endpoint and
+per conversation.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.replay import FIXTURES_PATH, load_fixtures
+from benchmarks.run import summarize
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.outcomes: Dict[str, Dict[str, int]] = {}
+        self.conversation_latencies: List[float] = []
+        self.conversations: Dict[str, int] = {"completed": 0, "failed": 0}
+
+    def request(self, endpoint: str, seconds: float, outcome: str):
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        outcomes = self.outcomes.setdefault(endpoint, {})
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    def report(self, wall_seconds: float) -> Dict:
+        endpoints = {}
+        for endpoint, latencies in self.latencies.items():
+            outcomes = self.outcomes[endpoint]
+            errors = sum(count for outcome, count in outcomes.items() if outcome != "200")
+            endpoints[endpoint] = {
+                **summarize(latencies),
+                "requests_per_second": len(latencies) / wall_seconds,
+                "error_rate": errors / len(latencies),
+                "outcomes": outcomes,
+            }
+        total = self.conversations["completed"] + self.conversations["failed"]
+        return {
+            "wall_seconds": wall_seconds,
+            "conversations": dict(self.conversations),
+            "conversations_per_second": self.conversations["completed"] / wall_seconds,
+            "conversation_error_rate": self.conversations["failed"] / total if total else 0.0,
+            "conversation_latency_seconds": summarize(self.conversation_latencies),
+            "endpoints": endpoints,
+        }
+
+
+async def timed_post(client: httpx.AsyncClient, stats: LoadStats, endpoint: str, path: str, text: str) -> Optional[Dict]:
+    start = time.perf_counter()
+    try:
+        response = await client.post(path, json={"text": text})
+        outcome = str(response.status_code)
+    except httpx.HTTPError as e:
+        response, outcome = None, type(e).__name__
+    stats.request(endpoint, time.perf_counter() - start, outcome)
+    return response.json() if response is not None and response.status_code == 200 else None
+
+
+async def conversation(client: httpx.AsyncClient, stats: LoadStats, scenario: Dict, think_time: float) -> bool:
+    start = time.perf_counter()
+    body = await timed_post(client, stats, "start_conversation", "/start_conversation", scenario["input"])
+    replies = list(scenario.get("replies", []))
+    while body is not None and body["requires_input"]:
+        if not replies:
+            return False
+        if think_time:
+            await asyncio.sleep(think_time)
+        body = await timed_post(client, stats, "continue_conversation",
+                                f"/continue_conversation/{body['conversation_id']}", replies.pop(0))
+    if body is None or not body.get("final_answer"):
+        return False
+    # Think time is the user's, not the server's
+    stats.conversation_latencies.append(time.perf_counter() - start - think_time * len(scenario.get("replies", [])))
+    return True
+
+
+async def user(client, stats: LoadStats, scenarios: List[Dict], rng: random.Random, deadline: float,
+               remaining: List[int], think_time: float):
+    while time.perf_counter() < deadline and remaining[0] != 0:
+        remaining[0] -= 1
+        completed = await conversation(client, stats, rng.choice(scenarios), think_time)
+        stats.conversations["completed" if completed else "failed"] += 1
+
+
+async def run(args) -> Dict:
+    fixtures = load_fixtures(args.fixtures)
+    scenarios = [s for s in fixtures["scenarios"] if not args.scenario or s["name"] in args.scenario]
+    stats = LoadStats()
+    # -1: no limit on the number of conversations, only on the duration
+    remaining = [args.conversations or -1]
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        start = time.perf_counter()
+        deadline = start + args.duration if args.duration else float("inf")
+        tasks = []
+        for index in range(args.users):
+            if args.ramp_up:
+                await asyncio.sleep(args.ramp_up / args.users)
+            tasks.append(asyncio.create_task(
+                user(client, stats, scenarios, random.Random(args.seed + index), deadline, remaining, args.think_time)))
+        await asyncio.gather(*tasks)
+        wall_seconds = time.perf_counter() - start
+    return {"url": args.url, "users": args.users, **stats.report(wall_seconds)}
+
+
+def print_report(results: Dict):
+    conversations = results["conversations"]
+    latency = results["conversation_latency_seconds"]
+    print(f"{results['users']} users against {results['url']} for {results['wall_seconds']:.1f}s")
+    print(f"conversations: {conversations['completed']} completed, {conversations['failed']} failed "
+          f"({results['conversation_error_rate']:.1%}), {results['conversations_per_second']:.2f}/s, "
+          f"p50 {latency['p50']:.3f}s p99 {latency['p99']:.3f}s")
+    print(f"{'endpoint':<24} {'requests':>8} {'req/s':>8} {'errors':>7} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    for endpoint, stats in results["endpoints"].items():
+        print(f"{endpoint:<24} {stats['count']:>8} {stats['requests_per_second']:>8.2f} {stats['error_rate']:>6.1%} "
+              f"{stats['p50']:>8.3f} {stats['p90']:>8.3f} {stats['p99']:>8.3f} {stats['max']:>8.3f}")
+        failures = {outcome: count for outcome, count in stats["outcomes"].items() if outcome != "200"}
+        if failures:
+            print(f"{'':<24} failures: {failures}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Drive multi-turn conversations against a running API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=16, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=60, help="seconds to run (0: until --conversations are done)")
+    parser.add_argument("--conversations", type=int, default=0, help="stop after this many conversations (0: no limit)")
+    parser.add_argument("--ramp-up", type=float, default=0, help="seconds over which the users start")
+    parser.add_argument("--think-time", type=float, default=0, help="seconds a user waits before answering a question")
+    parser.add_argument("--timeout", type=float, default=120, help="per request timeout in seconds")
+    parser.add_argument("--scenario", action="append", help="only run this fixture scenario (repeatable)")
+    parser.add_argument("--fixtures", default=FIXTURES_PATH)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-error-rate", type=float, default=None, help="exit with 1 when more conversations fail")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+    if not args.duration and not args.conversations:
+        parser.error("set --duration or --conversations")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.max_error_rate is not None and results["conversation_error_rate"] > args.max_error_rate:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
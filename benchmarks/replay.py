@@ -0,0 +1,165 @@
+import asyncio
+import copy
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import ConfigDict
+
+from clients import clients
+from tracing import timed_call
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "recorded.json")
+
+
+def load_fixtures(path: str = FIXTURES_PATH) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class Latency:
+    """
+    Synthetic latency of a replayed call: the recorded latency of the entry
+    (or `default` seconds) times `scale`, give or take `jitter` (a fraction,
+    0.2 = ±20%). Draws come from a seeded generator, so runs are repeatable.
+    """
+
+    def __init__(self, default: float = 0.0, scale: float = 1.0, jitter: float = 0.0, seed: int = 0):
+        self.default = default
+        self.scale = scale
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample(self, recorded: Optional[float] = None) -> float:
+        seconds = (self.default if recorded is None else recorded) * self.scale
+        if seconds <= 0:
+            return 0.0
+        with self.lock:
+            factor = 1 + self.random.uniform(-self.jitter, self.jitter)
+        return seconds * factor
+
+
+class Recording:
+    """
+    Recorded responses matched against a request: the first entry whose
+    `match` substrings all occur in the request wins. A request nothing
+    matches raises, so a changed prompt shows up as a failed benchmark rather
+    than a silently different workload.
+    """
+
+    def __init__(self, entries: List[Dict]):
+        self.entries = entries
+
+    def find(self, text: str) -> Dict:
+        for entry in self.entries:
+            if all(part in text for part in entry["match"]):
+                return entry
+        raise KeyError(f"No recorded response matches: {text[:200]!r}")
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class ReplayChatModel(BaseChatModel):
+    """
+    Chat model answering from a Recording after a synthetic delay, with
+    estimated token usage. With tools bound (structured output), the recorded
+    response is the JSON arguments of a call to the first tool.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    model_name: str = "replay"
+    recording: Recording
+    latency: Latency
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name}
+
+    def _reply(self, messages: List[BaseMessage]):
+        prompt = "\n".join(str(message.content) for message in messages)
+        entry = self.recording.find(prompt)
+        return prompt, entry, self.latency.sample(entry.get("latency"))
+
+    def bind_tools(self, tools, tool_choice=None, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools])
+
+    def with_structured_output(self, schema, *, include_raw: bool = False, method=None, strict=None, **kwargs):
+        # Always tool calling, whatever OpenAI specific method the caller asks for
+        return super().with_structured_output(schema, include_raw=include_raw, **kwargs)
+
+    @staticmethod
+    def _result(prompt: str, content: str, tools: Optional[List[Dict]] = None) -> ChatResult:
+        input_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(content)
+        usage = {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+        if tools:
+            tool_call = {"name": tools[0]["function"]["name"], "args": json.loads(content), "id": f"call_{uuid.uuid4().hex}"}
+            message = AIMessage(content="", tool_calls=[tool_call], usage_metadata=usage)
+        else:
+            message = AIMessage(content=content, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, tools=None, **kwargs) -> ChatResult:
+        prompt, entry, delay = self._reply(messages)
+        time.sleep(delay)
+        return self._result(prompt, entry["response"], tools)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, tools=None, **kwargs) -> ChatResult:
+        prompt, entry, delay = self._reply(messages)
+        await asyncio.sleep(delay)
+        return self._result(prompt, entry["response"], tools)
+
+
+class ReplayTavilyClient:
+    """Stand-in for clients.PooledTavilyClient answering searches from a Recording."""
+
+    def __init__(self, recording: Recording, latency: Latency):
+        self.recording = recording
+        self.latency = latency
+
+    def _reply(self, query: str):
+        entry = self.recording.find(query)
+        response = copy.deepcopy(entry["response"])
+        response.setdefault("query", query)
+        return response, self.latency.sample(entry.get("latency"))
+
+    def search(self, query: str, **kwargs) -> Dict:
+        with timed_call("tavily"):
+            response, delay = self._reply(query)
+            time.sleep(delay)
+        return response
+
+    async def asearch(self, query: str, **kwargs) -> Dict:
+        with timed_call("tavily"):
+            response, delay = self._reply(query)
+            await asyncio.sleep(delay)
+        return response
+
+    def close(self):
+        pass
+
+
+def install(fixtures: Dict, llm_latency: Latency, search_latency: Latency):
+    """Make the client registry serve replayed fixtures. Call before importing main."""
+    llm_recording = Recording(fixtures["llm"])
+    clients.override(
+        lambda model, cache=None, callbacks=None: ReplayChatModel(
+            model_name=model, recording=llm_recording, latency=llm_latency, cache=cache, callbacks=callbacks
+        ),
+        ReplayTavilyClient(Recording(fixtures["tavily"]), search_latency),
+    )
@@ -0,0 +1,318 @@
+"""
+Offline benchmark of the full conversation flow. Recorded OpenAI and Tavily
+responses (benchmarks/fixtures/recorded.json) are replayed with synthetic
+latency through `langgraph_entrapeer` directly (--target graph) or through the
+FastAPI app over an in-process ASGI transport (--target api), so no network or
+API key is needed:
+
+    python -m benchmarks.run --target api --concurrency 1,8,32 --conversations 64
+    python -m benchmarks.run --latency-scale 0 --output baseline.json
+    python -m benchmarks.run --latency-scale 0 --baseline baseline.json --max-regression 0.2
+
+Reports end-to-end latency percentiles per turn and per conversation,
+throughput at each concurrency level, time per graph node (from the request
+traces, see tracing.py) and memory per conversation (tracemalloc). With
+--baseline the exit code is 1 when a latency percentile or the throughput is
+worse than the baseline by more than --max-regression.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from typing import Dict, List
+
+# Applied before the app is imported: config reads the environment at import.
+# In-memory checkpoints and no company index keep runs independent of data/
+# (an empty COMPANY_INDEX_PATH falls back to the default file, and fixture
+# companies learned there would skip the LLM lookups of later runs).
+BENCHMARK_ENV = {
+    "CHECKPOINT_BACKEND": "memory",
+    "COMPANY_INDEX_ENABLED": "false",
+    "PRELOAD_MODELS": "false",
+    "WARM_UP_ON_STARTUP": "false",
+    "TRACE_DUMP_DIR": "",
+    "LANGCHAIN_TRACING_V2": "false",
+}
+# Replayed prompts repeat across conversations, so caches would turn every
+# conversation after the first into cache hits
+NO_CACHE_ENV = {"LLM_CACHE_ENABLED": "false", "TAVILY_CACHE_ENABLED": "false"}
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Linear interpolation between closest ranks."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values: List[float]) -> Dict:
+    summary = {"count": len(values), "mean": sum(values) / len(values) if values else 0.0}
+    summary.update({f"p{q}": percentile(values, q) for q in PERCENTILES})
+    summary["max"] = max(values, default=0.0)
+    return summary
+
+
+class GraphDriver:
+    """Runs conversations by streaming `langgraph_entrapeer` directly, one trace per turn."""
+
+    name = "graph"
+
+    def __init__(self):
+        from main import initial_state
+        from main import langgraph_entrapeer
+        self.graph = langgraph_entrapeer
+        self.initial_state = initial_state
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def conversation(self, scenario: Dict) -> Dict:
+        from langgraph.types import Command
+        from tracing import trace_request
+
+        conversation_id = str(uuid.uuid4())
+        thread = {"configurable": {"thread_id": conversation_id}}
+        graph_input, replies, turns = self.initial_state(scenario["input"]), list(scenario.get("replies", [])), []
+        while True:
+            start = time.perf_counter()
+            interrupted = False
+            with trace_request(conversation_id, "benchmark"):
+                async for event in self.graph.astream(graph_input, thread, stream_mode="updates"):
+                    interrupted = interrupted or (isinstance(event, dict) and "__interrupt__" in event)
+            turns.append(time.perf_counter() - start)
+            if not interrupted:
+                break
+            if not replies:
+                raise RuntimeError(f"{scenario['name']}: unexpected question after {len(turns)} turns")
+            graph_input = Command(resume=replies.pop(0))
+        final_answer = (await self.graph.aget_state(thread)).values.get("final_answer")
+        return {"conversation_id": conversation_id, "turns": turns, "final_answer": final_answer}
+
+
+class ApiDriver:
+    """Runs conversations through /start_conversation and /continue_conversation of the FastAPI app."""
+
+    name = "api"
+
+    def __init__(self):
+        import httpx
+        from api import app
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=None)
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def conversation(self, scenario: Dict) -> Dict:
+        replies, turns = list(scenario.get("replies", [])), []
+        start = time.perf_counter()
+        response = await self.client.post("/start_conversation", json={"text": scenario["input"]})
+        while True:
+            turns.append(time.perf_counter() - start)
+            response.raise_for_status()
+            body = response.json()
+            if not body["requires_input"]:
+                break
+            if not replies:
+                raise RuntimeError(f"{scenario['name']}: unexpected question after {len(turns)} turns")
+            start = time.perf_counter()
+            response = await self.client.post(f"/continue_conversation/{body['conversation_id']}", json={"text": replies.pop(0)})
+        return {"conversation_id": body["conversation_id"], "turns": turns, "final_answer": body["final_answer"]}
+
+
+async def run_level(driver, scenarios: List[Dict], conversations: int, concurrency: int) -> Dict:
+    """Run `conversations` conversations (cycling through the scenarios), at most `concurrency` at a time."""
+    from tracing import traces
+
+    semaphore = asyncio.Semaphore(concurrency)
+    turn_latencies, conversation_latencies, node_seconds, errors = [], [], {}, []
+
+    async def one(scenario):
+        async with semaphore:
+            try:
+                result = await driver.conversation(scenario)
+                if not result["final_answer"]:
+                    raise RuntimeError(f"{scenario['name']}: no final answer")
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                return
+        turn_latencies.extend(result["turns"])
+        conversation_latencies.append(sum(result["turns"]))
+        for trace in traces.get(result["conversation_id"]) or []:
+            for span in trace["spans"]:
+                node_seconds.setdefault(span["node"], []).append(span["duration_seconds"])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(scenarios[i % len(scenarios)]) for i in range(conversations)))
+    wall_seconds = time.perf_counter() - start
+    total_node_seconds = sum(sum(values) for values in node_seconds.values()) or 1.0
+    return {
+        "concurrency": concurrency,
+        "conversations": conversations,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "wall_seconds": wall_seconds,
+        "throughput_per_second": len(conversation_latencies) / wall_seconds if wall_seconds else 0.0,
+        "turn_latency_seconds": summarize(turn_latencies),
+        "conversation_latency_seconds": summarize(conversation_latencies),
+        "nodes": {
+            node: {**summarize(values), "share": sum(values) / total_node_seconds}
+            for node, values in sorted(node_seconds.items(), key=lambda item: -sum(item[1]))
+        },
+    }
+
+
+async def measure_memory(driver, scenarios: List[Dict], conversations: int) -> Dict:
+    """Memory allocated per sequential conversation and still held afterwards (checkpoints, caches, traces)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for i in range(conversations):
+            await driver.conversation(scenarios[i % len(scenarios)])
+        gc.collect()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "conversations": conversations,
+        "retained_bytes_per_conversation": (after - before) / conversations,
+        "peak_bytes_above_start": peak - before,
+    }
+
+
+def regressions(results: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    found = []
+    baseline_levels = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    for level in results["levels"]:
+        old = baseline_levels.get(level["concurrency"])
+        if old is None:
+            continue
+        for q in ("p50", "p95", "p99"):
+            new_value, old_value = level["conversation_latency_seconds"][q], old["conversation_latency_seconds"][q]
+            if old_value and new_value > old_value * (1 + max_regression):
+                found.append(f"concurrency {level['concurrency']}: conversation {q} {old_value:.3f}s -> {new_value:.3f}s")
+        if old["throughput_per_second"] and level["throughput_per_second"] < old["throughput_per_second"] * (1 - max_regression):
+            found.append(f"concurrency {level['concurrency']}: throughput {old['throughput_per_second']:.2f}/s -> {level['throughput_per_second']:.2f}/s")
+    return found
+
+
+def print_report(results: Dict):
+    print(f"target={results['target']} latency_scale={results['latency_scale']} jitter={results['jitter']}")
+    print(f"{'conc':>5} {'convs':>6} {'err':>4} {'conv/s':>8} {'p50':>8} {'p90':>8} {'p95':>8} {'p99':>8} {'turn p50':>9} {'turn p99':>9}")
+    for level in results["levels"]:
+        conversation, turn = level["conversation_latency_seconds"], level["turn_latency_seconds"]
+        print(f"{level['concurrency']:>5} {level['conversations']:>6} {level['errors']:>4} {level['throughput_per_second']:>8.2f} "
+              f"{conversation['p50']:>8.3f} {conversation['p90']:>8.3f} {conversation['p95']:>8.3f} {conversation['p99']:>8.3f} "
+              f"{turn['p50']:>9.3f} {turn['p99']:>9.3f}")
+        for sample in level["error_samples"]:
+            print(f"      error: {sample}")
+    last = results["levels"][-1]
+    print(f"\nTime per node at concurrency {last['concurrency']} (seconds):")
+    print(f"{'node':<36} {'runs':>6} {'mean':>8} {'p95':>8} {'share':>7}")
+    for node, stats in last["nodes"].items():
+        print(f"{node:<36} {stats['count']:>6} {stats['mean']:>8.4f} {stats['p95']:>8.4f} {stats['share']:>6.1%}")
+    memory = results.get("memory")
+    if memory:
+        print(f"\nMemory: {memory['retained_bytes_per_conversation'] / 1024:.1f} KiB retained per conversation, "
+              f"{memory['peak_bytes_above_start'] / 1024:.1f} KiB peak over {memory['conversations']} conversations")
+
+
+async def benchmark(args) -> Dict:
+    from benchmarks.replay import Latency, install, load_fixtures
+
+    fixtures = load_fixtures(args.fixtures)
+    install(
+        fixtures,
+        Latency(args.llm_latency, args.latency_scale, args.jitter, seed=args.seed),
+        Latency(args.search_latency, args.latency_scale, args.jitter, seed=args.seed + 1),
+    )
+    import main
+    if args.blank_spacy:
+        import spacy
+        main.user_input_validator.nlp = spacy.blank("en")
+    main.warm_up()
+
+    scenarios = [s for s in fixtures["scenarios"] if not args.scenario or s["name"] in args.scenario]
+    driver = ApiDriver() if args.target == "api" else GraphDriver()
+    try:
+        # One untimed pass so lazy imports and first-call setup are not measured
+        await run_level(driver, scenarios, len(scenarios), len(scenarios))
+        levels = [await run_level(driver, scenarios, args.conversations, concurrency) for concurrency in args.concurrency]
+        memory = await measure_memory(driver, scenarios, args.memory_conversations) if args.memory_conversations else None
+    finally:
+        await driver.close()
+    return {
+        "target": args.target,
+        "latency_scale": args.latency_scale,
+        "jitter": args.jitter,
+        "scenarios": [s["name"] for s in scenarios],
+        "levels": levels,
+        "memory": memory,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded OpenAI/Tavily responses through the graph or the API and measure it")
+    parser.add_argument("--target", choices=("graph", "api"), default="graph")
+    parser.add_argument("--conversations", type=int, default=20, help="conversations per concurrency level")
+    parser.add_argument("--concurrency", type=lambda value: [int(v) for v in value.split(",")], default=[1, 4, 16],
+                        help="comma separated concurrency levels")
+    parser.add_argument("--scenario", action="append", help="only run this fixture scenario (repeatable)")
+    parser.add_argument("--fixtures", default=None, help="recorded fixture file (default benchmarks/fixtures/recorded.json)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier for the recorded latencies; 0 measures only our own overhead")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds for LLM entries without a recorded latency")
+    parser.add_argument("--search-latency", type=float, default=1.0, help="seconds for Tavily entries without a recorded latency")
+    parser.add_argument("--jitter", type=float, default=0.2, help="relative latency jitter, 0.2 = ±20%%")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory-conversations", type=int, default=10, help="sequential conversations for the tracemalloc pass (0 skips it)")
+    parser.add_argument("--with-caches", action="store_true", help="keep the Tavily and LLM response caches on")
+    parser.add_argument("--blank-spacy", action="store_true", help="use a blank English pipeline when the spaCy model is not installed")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed relative slowdown against --baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    for name, value in {**BENCHMARK_ENV, **({} if args.with_caches else NO_CACHE_ENV)}.items():
+        os.environ.setdefault(name, value)
+    if args.fixtures is None:
+        args.fixtures = os.path.join(os.path.dirname(__file__), "fixtures", "recorded.json")
+
+    results = asyncio.run(benchmark(args))
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if any(level["errors"] for level in results["levels"]):
+        return 1
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = regressions(results, json.load(f), args.max_regression)
+        for regression in found:
+            print(f"REGRESSION {regression}")
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
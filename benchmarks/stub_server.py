@@ -0,0 +1,161 @@
+"""
+Stand-in for the OpenAI chat completions and Tavily search APIs, answering
+from the recorded fixtures with tunable latency and error rates. Point the
+app at it to load test without spending API quota:
+
+    python -m benchmarks.stub_server --port 8001 --latency-scale 1 --error-rate 0.01
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 TAVILY_BASE_URL=http://127.0.0.1:8001 \\
+        OPENAI_API_KEY=stub TAVILY_API_KEY=stub gunicorn -c gunicorn.conf.py api:app
+
+GET /stats returns the number of requests served and errors injected.
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from benchmarks.replay import FIXTURES_PATH, Latency, Recording, estimate_tokens, load_fixtures
+
+
+class ErrorInjector:
+    """Fails a seeded random share of requests: `rate_limit_rate` as 429, `error_rate` as 500."""
+
+    def __init__(self, error_rate: float = 0.0, rate_limit_rate: float = 0.0, seed: int = 0):
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def draw(self) -> Optional[int]:
+        with self.lock:
+            value = self.random.random()
+        if value < self.rate_limit_rate:
+            return 429
+        if value < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+
+def message_text(messages: List[Dict]) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(content)
+    return "\n".join(parts)
+
+
+def create_app(fixtures: Dict, llm_latency: Latency, search_latency: Latency, errors: ErrorInjector) -> FastAPI:
+    app = FastAPI()
+    llm_recording = Recording(fixtures["llm"])
+    search_recording = Recording(fixtures["tavily"])
+    stats: Dict[str, int] = {}
+
+    def count(name: str):
+        stats[name] = stats.get(name, 0) + 1
+
+    def injected_error(service: str) -> Optional[JSONResponse]:
+        status = errors.draw()
+        if status is None:
+            return None
+        count(f"{service}_injected_{status}")
+        if service == "tavily":
+            return JSONResponse(status_code=status, content={"detail": {"error": "Injected by the stub server"}})
+        kind = "rate_limit_exceeded" if status == 429 else "server_error"
+        return JSONResponse(status_code=status, content={"error": {"message": "Injected by the stub server", "type": kind, "code": kind}})
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        count("openai_requests")
+        prompt = message_text(body.get("messages", []))
+        try:
+            entry = llm_recording.find(prompt)
+        except KeyError as e:
+            count("openai_unmatched")
+            return JSONResponse(status_code=400, content={"error": {"message": str(e), "type": "invalid_request_error"}})
+        await asyncio.sleep(llm_latency.sample(entry.get("latency")))
+        error = injected_error("openai")
+        if error is not None:
+            return error
+        content = entry["response"]
+        prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(content)
+        message, finish_reason = {"role": "assistant", "content": content}, "stop"
+        if body.get("tools"):
+            # Structured output: the recorded response holds the JSON arguments of the first tool
+            message = {"role": "assistant", "content": None, "tool_calls": [{
+                "id": f"call_{uuid.uuid4().hex}", "type": "function",
+                "function": {"name": body["tools"][0]["function"]["name"], "arguments": content},
+            }]}
+            finish_reason = "tool_calls"
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    @app.post("/search")
+    async def search(request: Request):
+        body = await request.json()
+        count("tavily_requests")
+        query = body.get("query", "")
+        try:
+            entry = search_recording.find(query)
+        except KeyError as e:
+            count("tavily_unmatched")
+            return JSONResponse(status_code=400, content={"detail": {"error": str(e)}})
+        delay = search_latency.sample(entry.get("latency"))
+        await asyncio.sleep(delay)
+        error = injected_error("tavily")
+        if error is not None:
+            return error
+        return {**entry["response"], "query": query, "response_time": round(delay, 3)}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve recorded OpenAI/Tavily responses for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--fixtures", default=FIXTURES_PATH)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier for the recorded latencies")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds for LLM entries without a recorded latency")
+    parser.add_argument("--search-latency", type=float, default=1.0, help="seconds for Tavily entries without a recorded latency")
+    parser.add_argument("--jitter", type=float, default=0.2, help="relative latency jitter, 0.2 = ±20%%")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    import uvicorn
+
+    args = parse_args(argv)
+    app = create_app(
+        load_fixtures(args.fixtures),
+        Latency(args.llm_latency, args.latency_scale, args.jitter, seed=args.seed),
+        Latency(args.search_latency, args.latency_scale, args.jitter, seed=args.seed + 1),
+        ErrorInjector(args.error_rate, args.rate_limit_rate, seed=args.seed + 2),
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+import config
+from tracing import record
+
+
+class TokenUsage:
+    def __init__(self):
+        self.total = 0
+
+
+current_usage: ContextVar[Optional[TokenUsage]] = ContextVar("current_usage", default=None)
+
+
+class TokenCountingCallback(BaseCallbackHandler):
+    """
+    Adds the tokens of every finished LLM call to the TokenUsage of the
+    enclosing track_tokens() block, if any, and counts the call on the running
+    node's trace span unless it was answered from the LLM cache. Attached to
+    every chat model built by the client registry.
+    """
+
+    run_inline = True
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        if not from_cache(response):
+            record("llm_calls")
+        usage = current_usage.get()
+        if usage is not None:
+            usage.total += llm_result_tokens(response)
+
+
+def from_cache(response: LLMResult) -> bool:
+    generations = [generation for batch in response.generations for generation in batch]
+    return bool(generations) and all((generation.generation_info or {}).get("cached") for generation in generations)
+
+
+def llm_result_tokens(response: LLMResult) -> int:
+    tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage_metadata:
+                tokens += usage_metadata.get("total_tokens", 0)
+    if tokens == 0 and response.llm_output:
+        tokens = (response.llm_output.get("token_usage") or {}).get("total_tokens", 0)
+    return tokens
+
+
+token_counter = TokenCountingCallback()
+
+
+@contextmanager
+def track_tokens():
+    """Count the tokens of LLM calls made inside the block, including from threads started with a copied context."""
+    usage = TokenUsage()
+    token = current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        current_usage.reset(token)
+
+
+def tokens_so_far() -> int:
+    usage = current_usage.get()
+    return usage.total if usage is not None else 0
+
+
+def with_token_usage(func):
+    """
+    Wrap a graph node so its update also reports the tokens it spent as
+    `tokens_used` (summed into State by its reducer). The wrapper keeps the
+    node's signature, so injected arguments such as `writer` still work.
+    """
+    def update_with(result, usage):
+        if usage.total == 0:
+            return result
+        return {**(result or {}), "tokens_used": usage.total}
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def awrapper(*args, **kwargs):
+            with track_tokens() as usage:
+                result = await func(*args, **kwargs)
+            return update_with(result, usage)
+        return awrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with track_tokens() as usage:
+            result = func(*args, **kwargs)
+        return update_with(result, usage)
+    return wrapper
+
+
+def budget_exhausted(state: Dict, now: Optional[float] = None) -> Optional[str]:
+    """
+    Name of the first refinement budget the conversation has used up
+    ("iterations", "deadline" or "tokens"), or None. A limit of 0 disables it.
+    """
+    now = time.time() if now is None else now
+    if config.MAX_REFINEMENT_ITERATIONS and state.get("refinement_iterations", 0) >= config.MAX_REFINEMENT_ITERATIONS:
+        return "iterations"
+    started_at = state.get("refinement_started_at") or 0
+    if config.REFINEMENT_DEADLINE_SECONDS and started_at and now - started_at >= config.REFINEMENT_DEADLINE_SECONDS:
+        return "deadline"
+    # Tokens spent on company and intent analysis before the first search do not count
+    tokens = state.get("tokens_used", 0) - state.get("refinement_tokens_start", 0) + tokens_so_far()
+    if config.REFINEMENT_TOKEN_BUDGET and tokens >= config.REFINEMENT_TOKEN_BUDGET:
+        return "tokens"
+    return None
+
+
+def answer_score(evaluation_result: Dict) -> int:
+    return evaluation_result.get("relevance_score", 0) + evaluation_result.get("completeness_score", 0)
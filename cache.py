@@ -0,0 +1,360 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from langchain_core._api import LangChainBetaWarning
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+import config
+from checkpointing import SqliteConnectionMixin
+from metrics import metrics
+from tracing import record
+
+MISSING = object()
+
+
+def normalize_text(text):
+    """Case and whitespace insensitive form of a query or prompt."""
+    return " ".join(str(text).split()).lower()
+
+
+class TTLCache:
+    """Thread-safe in-memory LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+
+class SqliteCacheTier(SqliteConnectionMixin):
+    """
+    On-disk tier holding text values, shared by every process using the same
+    file. Expired rows are ignored on read and pruned, together with the oldest
+    rows beyond `maxsize`, every `prune_every` writes.
+    """
+
+    def __init__(self, db_path: str, table: str, maxsize: int, ttl: float, prune_every: int = 100):
+        self.db_path = db_path
+        self.table = table
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self.writes = 0
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_created_at ON {table} (created_at)")
+            self.conn.commit()
+
+    def get(self, key) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def set(self, key, value: str):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now + self.ttl),
+            )
+            self.conn.commit()
+            self.writes += 1
+            if self.writes % self.prune_every == 0:
+                self._prune(now)
+
+    def _prune(self, now):
+        self.conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (now,))
+        self.conn.execute(
+            f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.maxsize,),
+        )
+        self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute(f"DELETE FROM {self.table}")
+            self.conn.commit()
+
+
+class InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: the first caller of a key runs the
+    call and every caller arriving before it returns gets the same result or
+    exception, instead of repeating the external work. Nothing is kept once
+    the call returns. Sync calls are shared between threads, async calls
+    between the tasks of an event loop. Counted in
+    `singleflight_calls_total{call, role=leader|follower}` and on the
+    running node's trace span as `<name>_coalesced`.
+    """
+
+    def __init__(self, name: str, enabled: Optional[bool] = None):
+        self.name = name
+        self.enabled = config.SINGLE_FLIGHT_ENABLED if enabled is None else enabled
+        self.lock = threading.Lock()
+        self.calls: Dict[str, InFlightCall] = {}
+        self.tasks: Dict[tuple, asyncio.Task] = {}
+
+    def _count(self, leader: bool):
+        metrics.increment("singleflight_calls_total", call=self.name, role="leader" if leader else "follower")
+        if not leader:
+            record(f"{self.name}_coalesced")
+
+    def do(self, key: str, fetch: Callable[..., Any], *args, **kwargs) -> Any:
+        if not self.enabled:
+            return fetch(*args, **kwargs)
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = InFlightCall()
+        self._count(leader)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+        try:
+            call.value = fetch(*args, **kwargs)
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    async def ado(self, key: str, fetch: Callable[..., Any], *args, **kwargs) -> Any:
+        if not self.enabled:
+            return await fetch(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            task = self.tasks.get((loop, key))
+            leader = task is None
+            if leader:
+                # A task of its own, so a cancelled caller does not cancel the call for the others
+                task = self.tasks[(loop, key)] = loop.create_task(fetch(*args, **kwargs))
+                task.add_done_callback(lambda done: self._finished(loop, key, done))
+        self._count(leader)
+        return await asyncio.shield(task)
+
+    def _finished(self, loop, key: str, task: asyncio.Task):
+        with self.lock:
+            self.tasks.pop((loop, key), None)
+        # Retrieved here so a call nobody waits for anymore does not log "exception never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+
+class ResponseCache:
+    """
+    Two tier cache for responses of external calls. Lookups hit memory first,
+    then the optional disk tier (promoting hits to memory). Values are stored on
+    disk as text through `serialize`/`deserialize` (JSON by default).
+    Every lookup is counted in `cache_requests_total{cache=..., result=hit|miss}`
+    and on the running node's trace span as `<name>_cache_hit|miss`.
+    Concurrent misses of a key (and, with the cache off, concurrent calls)
+    share one fetch through a SingleFlight.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, disk_path: str = "", enabled: bool = True,
+                 serialize: Callable[[Any], str] = json.dumps, deserialize: Callable[[str], Any] = json.loads):
+        self.name = name
+        self.enabled = enabled
+        self.serialize = serialize
+        self.deserialize = deserialize
+        self.memory = TTLCache(maxsize, ttl)
+        self.disk = SqliteCacheTier(disk_path, f"{name}_cache", maxsize * 10, ttl) if disk_path else None
+        self.flight = SingleFlight(name)
+
+    @staticmethod
+    def make_key(query: str, **params) -> str:
+        return json.dumps({"query": normalize_text(query), "params": params}, sort_keys=True, default=str)
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not MISSING:
+            metrics.increment("cache_requests_total", cache=self.name, result="hit", tier="memory")
+            record(f"{self.name}_cache_hit")
+            return value
+        if self.disk is not None:
+            stored = self.disk.get(key)
+            if stored is not None:
+                value = self.deserialize(stored)
+                self.memory.set(key, value)
+                metrics.increment("cache_requests_total", cache=self.name, result="hit", tier="disk")
+                record(f"{self.name}_cache_hit")
+                return value
+        metrics.increment("cache_requests_total", cache=self.name, result="miss", tier="none")
+        record(f"{self.name}_cache_miss")
+        return MISSING
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, self.serialize(value))
+
+    def cached(self, fetch: Callable[..., Dict], params: Dict[str, Any]) -> Dict:
+        """Return fetch(**params), calling it only on a cache miss. Exceptions are not cached."""
+        key = self.make_key(**params)
+        if not self.enabled:
+            return self.flight.do(key, fetch, **params)
+        value = self.get(key)
+        if value is MISSING:
+            value = self.flight.do(key, self._fetch, key, fetch, params)
+        return value
+
+    def _fetch(self, key, fetch: Callable[..., Dict], params: Dict[str, Any]) -> Dict:
+        value = fetch(**params)
+        self.set(key, value)
+        return value
+
+    async def acached(self, fetch: Callable[..., Any], params: Dict[str, Any]) -> Dict:
+        key = self.make_key(**params)
+        if not self.enabled:
+            return await self.flight.ado(key, fetch, **params)
+        value = self.get(key)
+        if value is MISSING:
+            value = await self.flight.ado(key, self._afetch, key, fetch, params)
+        return value
+
+    async def _afetch(self, key, fetch: Callable[..., Any], params: Dict[str, Any]) -> Dict:
+        value = await fetch(**params)
+        self.set(key, value)
+        return value
+
+    def stats(self) -> Dict:
+        hits = metrics.get("cache_requests_total", cache=self.name, result="hit", tier="memory") + \
+            metrics.get("cache_requests_total", cache=self.name, result="hit", tier="disk")
+        misses = metrics.get("cache_requests_total", cache=self.name, result="miss", tier="none")
+        total = hits + misses
+        return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0, "entries": len(self.memory)}
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+search_cache = ResponseCache(
+    "tavily",
+    maxsize=config.TAVILY_CACHE_MAX_ENTRIES,
+    ttl=config.TAVILY_CACHE_TTL_SECONDS,
+    disk_path=config.TAVILY_CACHE_DISK_PATH,
+    enabled=config.TAVILY_CACHE_ENABLED,
+)
+
+
+def load_generations(text: str) -> RETURN_VAL_TYPE:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", LangChainBetaWarning)
+        return loads(text)
+
+
+def cached_generation(generation):
+    update = {"generation_info": {**(generation.generation_info or {}), "cached": True}}
+    message = getattr(generation, "message", None)
+    if message is not None and getattr(message, "usage_metadata", None):
+        update["message"] = message.model_copy(update={"usage_metadata": None})
+    return generation.model_copy(update=update)
+
+
+class LLMResponseCache(BaseCache):
+    """
+    Exact-match cache for chat model calls, plugged into a model with
+    `ChatOpenAI(..., cache=llm_cache)`. The key is the prompt with whitespace
+    collapsed plus the model configuration string, so the same prompt sent to a
+    different model or with different parameters is a separate entry.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, disk_path: str = ""):
+        self.store = ResponseCache("llm", maxsize, ttl, disk_path=disk_path, serialize=dumps, deserialize=load_generations)
+
+    @staticmethod
+    def make_key(prompt: str, llm_string: str) -> str:
+        # Chat prompts arrive JSON encoded, so newlines show up as an escaped "\n"
+        normalized = " ".join(prompt.replace("\\n", " ").split())
+        return hashlib.sha256(f"{normalized}\0{llm_string}".encode()).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        value = self.store.get(self.make_key(prompt, llm_string))
+        if value is MISSING:
+            return None
+        # A cached answer sent no request and spent no tokens, so it must not
+        # count as an LLM call or against token budgets
+        return [cached_generation(generation) for generation in value]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self.store.set(self.make_key(prompt, llm_string), return_val)
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear()
+
+    def stats(self) -> Dict:
+        return self.store.stats()
+
+
+def create_llm_cache() -> Optional[LLMResponseCache]:
+    """LLM cache from config; None leaves models uncached."""
+    if not config.LLM_CACHE_ENABLED:
+        return None
+    return LLMResponseCache(config.LLM_CACHE_MAX_ENTRIES, config.LLM_CACHE_TTL_SECONDS, disk_path=config.LLM_CACHE_DISK_PATH)
+
+
+llm_cache = create_llm_cache()
+
+# Identical LLM calls in flight at the same time, e.g. several users asking
+# about the same company at once
+url_summary_flight = SingleFlight("url_summary")
+company_list_flight = SingleFlight("company_list")
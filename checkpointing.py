@@ -0,0 +1,524 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+import config
+
+
+def open_sqlite(db_path):
+    """Open a connection that can be shared between threads and worker processes."""
+    if db_path != ":memory:" and os.path.dirname(db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+class SqliteConnectionMixin:
+    """
+    Lazily opened, per-process connection. A connection must not be used on
+    both sides of a fork, so a worker forked from a preloading master opens
+    its own on first use.
+    """
+
+    db_path: str
+    _conn: Optional[sqlite3.Connection] = None
+    _conn_pid: Optional[int] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = open_sqlite(self.db_path)
+            self._conn_pid = os.getpid()
+        return self._conn
+
+
+class SqliteCheckpointSaver(SqliteConnectionMixin, BaseCheckpointSaver):
+    """
+    File backed checkpointer. Every uvicorn worker pointing at the same
+    database file sees the same threads, so interrupted conversations survive
+    restarts and can be resumed by any worker.
+
+    Async methods run the (short) SQLite calls in a worker thread so the event
+    loop is never blocked on the database lock.
+    """
+
+    def __init__(self, db_path: str, *, serde=None):
+        super().__init__(serde=serde)
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
+                parent_checkpoint_id TEXT,
+                type TEXT,
+                checkpoint BLOB,
+                metadata_type TEXT,
+                metadata BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+            );
+            CREATE TABLE IF NOT EXISTS writes (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                type TEXT,
+                value BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            );
+            """
+        )
+        self.conn.commit()
+
+    @contextmanager
+    def cursor(self, transaction: bool = True) -> Iterator[sqlite3.Cursor]:
+        with self.lock:
+            cur = self.conn.cursor()
+            try:
+                yield cur
+                if transaction:
+                    self.conn.commit()
+            finally:
+                cur.close()
+
+    def _load_tuple(self, cur, row) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata = row
+        cur.execute(
+            "SELECT task_id, channel, type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        )
+        pending_writes = [
+            (task_id, channel, self.serde.loads_typed((value_type, value)))
+            for task_id, channel, value_type, value in cur.fetchall()
+        ]
+        return CheckpointTuple(
+            {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            self.serde.loads_typed((type_, checkpoint)),
+            self.serde.loads_typed((metadata_type, metadata)) if metadata is not None else {},
+            (
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_checkpoint_id}}
+                if parent_checkpoint_id
+                else None
+            ),
+            pending_writes,
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        with self.cursor(transaction=False) as cur:
+            if checkpoint_id := get_checkpoint_id(config):
+                cur.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                )
+            else:
+                cur.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                )
+            row = cur.fetchone()
+            if row is None:
+                return None
+            return self._load_tuple(cur, row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        wheres, params = [], []
+        if config is not None:
+            wheres.append("thread_id = ?")
+            params.append(str(config["configurable"]["thread_id"]))
+            checkpoint_ns = config["configurable"].get("checkpoint_ns")
+            if checkpoint_ns is not None:
+                wheres.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                wheres.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before is not None:
+            wheres.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata FROM checkpoints"
+        if wheres:
+            query += " WHERE " + " AND ".join(wheres)
+        query += " ORDER BY checkpoint_id DESC"
+
+        # Materialise under the lock, then yield so callers never hold it.
+        with self.cursor(transaction=False) as cur:
+            cur.execute(query, params)
+            tuples = [self._load_tuple(cur, row) for row in cur.fetchall()]
+
+        count = 0
+        for checkpoint_tuple in tuples:
+            if filter and not all(checkpoint_tuple.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            yield checkpoint_tuple
+            count += 1
+            if limit and count >= limit:
+                break
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, serialized_checkpoint = self.serde.dumps_typed(checkpoint)
+        metadata_type, serialized_metadata = self.serde.dumps_typed(dict(metadata))
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    type_,
+                    serialized_checkpoint,
+                    metadata_type,
+                    serialized_metadata,
+                ),
+            )
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        verb = "INSERT OR REPLACE" if all(w[0] in WRITES_IDX_MAP for w in writes) else "INSERT OR IGNORE"
+        with self.cursor() as cur:
+            cur.executemany(
+                f"{verb} INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        str(config["configurable"]["thread_id"]),
+                        str(config["configurable"].get("checkpoint_ns", "")),
+                        str(config["configurable"]["checkpoint_id"]),
+                        task_id,
+                        WRITES_IDX_MAP.get(channel, idx),
+                        channel,
+                        *self.serde.dumps_typed(value),
+                    )
+                    for idx, (channel, value) in enumerate(writes)
+                ],
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM checkpoints WHERE thread_id = ?", (str(thread_id),))
+            cur.execute("DELETE FROM writes WHERE thread_id = ?", (str(thread_id),))
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        tuples = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for checkpoint_tuple in tuples:
+            yield checkpoint_tuple
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+class ConversationStore:
+    """
+    Metadata kept per conversation next to its checkpoints (whether the graph
+    is waiting on the user, when it was created and last touched, and until
+    when a worker running it holds a lease). Records are plain dicts so any
+    key/value backend can implement this interface.
+
+    Leased conversations are left out of `idle_since` and `least_recently_used`
+    and are never removed by `delete_unleased`, so a worker evicting
+    conversations cannot drop one that another worker is running.
+    """
+
+    def get(self, conversation_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def put(self, conversation_id: str, record: Dict) -> None:
+        raise NotImplementedError
+
+    def delete(self, conversation_id: str) -> None:
+        raise NotImplementedError
+
+    def lease(self, conversation_id: str, until: float) -> bool:
+        """Hold (or with 0, release) the lease of a conversation; False when it no longer exists."""
+        raise NotImplementedError
+
+    def acquire(self, conversation_id: str, until: float) -> bool:
+        """
+        Lease a conversation that waits for input and mark it as no longer
+        waiting, in one step; False when it is not waiting, already leased or
+        gone, so only one of several concurrent resumes gets it.
+        """
+        raise NotImplementedError
+
+    def delete_unleased(self, conversation_id: str) -> bool:
+        """Delete a conversation unless it is leased; True when it was deleted."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def idle_since(self, cutoff: float) -> List[str]:
+        """Ids of unleased conversations not touched since `cutoff` (epoch seconds)."""
+        raise NotImplementedError
+
+    def least_recently_used(self, limit: int) -> List[str]:
+        """Ids of the `limit` least recently touched unleased conversations."""
+        raise NotImplementedError
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return self.get(conversation_id) is not None
+
+    def new_record(self, waiting_for_input: bool = False, leased_until: float = 0.0) -> Dict:
+        now = time.time()
+        return {"waiting_for_input": waiting_for_input, "created_at": now, "updated_at": now, "leased_until": leased_until}
+
+
+class InMemoryConversationStore(ConversationStore):
+    def __init__(self):
+        self.records: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+
+    def get(self, conversation_id):
+        with self.lock:
+            record = self.records.get(conversation_id)
+            return dict(record) if record is not None else None
+
+    def put(self, conversation_id, record):
+        with self.lock:
+            self.records[conversation_id] = dict(record, updated_at=time.time())
+
+    def delete(self, conversation_id):
+        with self.lock:
+            self.records.pop(conversation_id, None)
+
+    def lease(self, conversation_id, until):
+        with self.lock:
+            record = self.records.get(conversation_id)
+            if record is None:
+                return False
+            record["leased_until"] = until
+            return True
+
+    def acquire(self, conversation_id, until):
+        with self.lock:
+            record = self.records.get(conversation_id)
+            if record is None or not record["waiting_for_input"] or record.get("leased_until", 0.0) > time.time():
+                return False
+            record.update(waiting_for_input=False, leased_until=until)
+            return True
+
+    def delete_unleased(self, conversation_id):
+        with self.lock:
+            record = self.records.get(conversation_id)
+            if record is None or record.get("leased_until", 0.0) > time.time():
+                return False
+            del self.records[conversation_id]
+            return True
+
+    def count(self):
+        with self.lock:
+            return len(self.records)
+
+    def _unleased(self):
+        now = time.time()
+        return [(cid, record) for cid, record in self.records.items() if record.get("leased_until", 0.0) <= now]
+
+    def idle_since(self, cutoff):
+        with self.lock:
+            return [cid for cid, record in self._unleased() if record["updated_at"] < cutoff]
+
+    def least_recently_used(self, limit):
+        with self.lock:
+            ordered = sorted(self._unleased(), key=lambda item: item[1]["updated_at"])
+            return [cid for cid, _ in ordered[:limit]]
+
+
+class SqliteConversationStore(SqliteConnectionMixin, ConversationStore):
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS conversations (
+                conversation_id TEXT PRIMARY KEY,
+                waiting_for_input INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                leased_until REAL NOT NULL DEFAULT 0
+            )
+            """
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(conversations)")}
+        if "leased_until" not in columns:
+            # Databases created before leases existed
+            self.conn.execute("ALTER TABLE conversations ADD COLUMN leased_until REAL NOT NULL DEFAULT 0")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations (updated_at)")
+        self.conn.commit()
+
+    def get(self, conversation_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT waiting_for_input, created_at, updated_at, leased_until FROM conversations WHERE conversation_id = ?",
+                (conversation_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"waiting_for_input": bool(row[0]), "created_at": row[1], "updated_at": row[2], "leased_until": row[3]}
+
+    def put(self, conversation_id, record):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO conversations (conversation_id, waiting_for_input, created_at, updated_at, leased_until) VALUES (?, ?, ?, ?, ?)",
+                (conversation_id, int(bool(record.get("waiting_for_input"))), record.get("created_at", time.time()), time.time(),
+                 record.get("leased_until", 0.0)),
+            )
+            self.conn.commit()
+
+    def delete(self, conversation_id):
+        with self.lock:
+            self.conn.execute("DELETE FROM conversations WHERE conversation_id = ?", (conversation_id,))
+            self.conn.commit()
+
+    def lease(self, conversation_id, until):
+        with self.lock:
+            cur = self.conn.execute("UPDATE conversations SET leased_until = ? WHERE conversation_id = ?", (until, conversation_id))
+            self.conn.commit()
+        return cur.rowcount > 0
+
+    def acquire(self, conversation_id, until):
+        # One statement, so two workers resuming the same conversation cannot both get it
+        with self.lock:
+            cur = self.conn.execute(
+                "UPDATE conversations SET leased_until = ?, waiting_for_input = 0 "
+                "WHERE conversation_id = ? AND waiting_for_input = 1 AND leased_until <= ?",
+                (until, conversation_id, time.time()),
+            )
+            self.conn.commit()
+        return cur.rowcount > 0
+
+    def delete_unleased(self, conversation_id):
+        # One statement, so a lease taken by another worker in between is respected
+        with self.lock:
+            cur = self.conn.execute(
+                "DELETE FROM conversations WHERE conversation_id = ? AND leased_until <= ?", (conversation_id, time.time())
+            )
+            self.conn.commit()
+        return cur.rowcount > 0
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def idle_since(self, cutoff):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT conversation_id FROM conversations WHERE updated_at < ? AND leased_until <= ?", (cutoff, time.time())
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def least_recently_used(self, limit):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT conversation_id FROM conversations WHERE leased_until <= ? ORDER BY updated_at ASC LIMIT ?", (time.time(), limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+
+def delete_thread(checkpointer: BaseCheckpointSaver, thread_id: str) -> None:
+    """Drop every checkpoint and pending write kept for a thread."""
+    try:
+        checkpointer.delete_thread(thread_id)
+        return
+    except (AttributeError, NotImplementedError):
+        pass
+    # MemorySaver from langgraph-checkpoint releases without delete_thread
+    storage = getattr(checkpointer, "storage", None)
+    if storage is not None:
+        storage.pop(thread_id, None)
+    for attr in ("writes", "blobs"):
+        entries = getattr(checkpointer, attr, None)
+        if entries is not None:
+            for key in [k for k in entries if k[0] == thread_id]:
+                del entries[key]
+
+
+def create_checkpointer(backend: Optional[str] = None, db_path: Optional[str] = None) -> BaseCheckpointSaver:
+    backend = (backend or config.CHECKPOINT_BACKEND).lower()
+    if backend == "memory":
+        return MemorySaver()
+    if backend == "sqlite":
+        return SqliteCheckpointSaver(db_path or config.CHECKPOINT_DB_PATH)
+    raise ValueError(f"Unknown checkpoint backend: {backend}")
+
+
+def create_conversation_store(backend: Optional[str] = None, db_path: Optional[str] = None) -> ConversationStore:
+    backend = (backend or config.CHECKPOINT_BACKEND).lower()
+    if backend == "memory":
+        return InMemoryConversationStore()
+    if backend == "sqlite":
+        return SqliteConversationStore(db_path or config.CHECKPOINT_DB_PATH)
+    raise ValueError(f"Unknown checkpoint backend: {backend}")
@@ -0,0 +1,280 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+import httpx
+import requests
+from langchain_core.language_models import BaseChatModel
+from langchain_openai import ChatOpenAI
+from tavily.errors import InvalidAPIKeyError, MissingAPIKeyError, UsageLimitExceededError
+
+import config
+from budget import token_counter
+from metrics import metrics
+from scheduler import CONNECTION_ERRORS, AsyncScheduledTransport, ScheduledTransport, limiters
+from tracing import record, timed_call
+
+
+def http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+def http_timeout(read_timeout: float) -> httpx.Timeout:
+    return httpx.Timeout(read_timeout, connect=config.HTTP_CONNECT_TIMEOUT_SECONDS)
+
+
+def openai_retries(response: httpx.Response) -> bool:
+    """Whether the openai SDK retries after this response (same rules as its _should_retry)."""
+    should_retry = response.headers.get("x-should-retry")
+    if should_retry in ("true", "false"):
+        return should_retry == "true"
+    return response.status_code in (408, 409, 429) or response.status_code >= 500
+
+
+def tavily_retries(response: httpx.Response) -> bool:
+    """
+    Whether to retry a Tavily response: rate limits and gateway or availability
+    errors. A plain 500 may come after the search ran (and was billed), so it is not retried.
+    """
+    return response.status_code in (429, 502, 503, 504)
+
+
+def count_openai_retry(response: httpx.Response):
+    # Also counts the last failed attempt when the SDK has no retries left
+    if openai_retries(response):
+        metrics.increment("openai_retries_total", status=str(response.status_code))
+        record("openai_retries")
+
+
+async def acount_openai_retry(response: httpx.Response):
+    count_openai_retry(response)
+
+
+def estimate_openai_tokens(request: httpx.Request) -> int:
+    """Rough size of a chat completion (about 4 bytes per prompt token plus the completion limit), settled later from its usage."""
+    try:
+        body = json.loads(request.content)
+    except (httpx.RequestNotRead, ValueError):
+        return 0
+    if not isinstance(body, dict):
+        return 0
+    return len(request.content) // 4 + (body.get("max_completion_tokens") or body.get("max_tokens") or 0)
+
+
+def openai_usage(response: httpx.Response) -> Optional[int]:
+    try:
+        return response.json()["usage"]["total_tokens"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def scheduled_transports(provider: str, **options):
+    """
+    `transport` arguments for the sync and async httpx clients of a provider:
+    pooled connections behind the provider's limiter (see scheduler.py), or
+    the httpx defaults when the scheduler is off.
+    """
+    if not config.SCHEDULER_ENABLED:
+        return None, None
+    if provider == "openai":
+        # The statuses and errors the openai SDK itself retries on
+        retry = dict(retryable=openai_retries, retry_errors=(httpx.TransportError,))
+    else:
+        # A timed out search may have run on the server, so only requests that
+        # never got there are retried unless timeouts are opted in
+        retry_errors = (httpx.TransportError,) if config.TAVILY_RETRY_TIMEOUTS else CONNECTION_ERRORS
+        retry = dict(retryable=tavily_retries, retry_errors=retry_errors)
+    options = dict(limiter=limiters[provider], **retry, **options)
+    return (
+        ScheduledTransport(httpx.HTTPTransport(limits=http_limits()), **options),
+        AsyncScheduledTransport(httpx.AsyncHTTPTransport(limits=http_limits()), **options),
+    )
+
+
+def sdk_response(response: httpx.Response) -> requests.Response:
+    """The httpx response as the requests.Response tavily-python would have received."""
+    sdk = requests.Response()
+    sdk.status_code = response.status_code
+    sdk.reason = response.reason_phrase
+    sdk.headers = requests.structures.CaseInsensitiveDict(response.headers)
+    sdk._content = response.content
+    sdk.url = str(response.request.url)
+    return sdk
+
+
+@contextmanager
+def sdk_transport_errors() -> Iterator[None]:
+    """Raise httpx timeouts and connection failures as the requests errors tavily-python lets through."""
+    try:
+        yield
+    except httpx.ConnectTimeout as e:
+        raise requests.ConnectTimeout(str(e)) from e
+    except httpx.TimeoutException as e:
+        raise requests.ReadTimeout(str(e)) from e
+    except httpx.TransportError as e:
+        raise requests.ConnectionError(str(e)) from e
+
+
+class PooledTavilyClient:
+    """
+    Tavily search over keep-alive httpx pools. Drop-in for the `search` call of
+    tavily.TavilyClient, plus `asearch` for the async path, so neither path
+    opens a new connection per search.
+
+    Mirrors TavilyClient._search of tavily-python 0.5.1 (the version pinned in
+    requirements.txt): the same request body, UsageLimitExceededError for 429,
+    InvalidAPIKeyError for 401, requests.HTTPError for any other failed status
+    and requests' timeout and connection errors, so callers written against the
+    SDK catch the same exceptions.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, timeout: Optional[float] = None):
+        api_key = api_key or os.getenv("TAVILY_API_KEY")
+        if not api_key:
+            raise MissingAPIKeyError()
+        options = dict(
+            base_url=base_url or config.TAVILY_BASE_URL,
+            headers={"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"},
+            limits=http_limits(),
+            timeout=http_timeout(config.TAVILY_TIMEOUT_SECONDS if timeout is None else timeout),
+        )
+        transport, async_transport = scheduled_transports("tavily")
+        self.http_client = httpx.Client(**options, transport=transport)
+        self.http_async_client = httpx.AsyncClient(**options, transport=async_transport)
+
+    @staticmethod
+    def _payload(query, search_depth="basic", topic="general", days=3, max_results=5, include_domains=None,
+                 exclude_domains=None, include_answer=False, include_raw_content=False, include_images=False, **kwargs) -> str:
+        data = {
+            "query": query,
+            "search_depth": search_depth,
+            "topic": topic,
+            "days": days,
+            "include_answer": include_answer,
+            "include_raw_content": include_raw_content,
+            "max_results": max_results,
+            "include_domains": include_domains,
+            "exclude_domains": exclude_domains,
+            "include_images": include_images,
+        }
+        data.update(kwargs)
+        return json.dumps(data)
+
+    @staticmethod
+    def _handle(response: httpx.Response) -> Dict:
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 429:
+            detail = "Too many requests."
+            try:
+                detail = response.json()["detail"]["error"]
+            except Exception:
+                pass
+            raise UsageLimitExceededError(detail)
+        if response.status_code == 401:
+            raise InvalidAPIKeyError()
+        sdk_response(response).raise_for_status()
+
+    def search(self, query: str, **kwargs) -> Dict:
+        with timed_call("tavily"), sdk_transport_errors():
+            response = self.http_client.post("/search", content=self._payload(query, **kwargs))
+        return self._handle(response)
+
+    async def asearch(self, query: str, **kwargs) -> Dict:
+        with timed_call("tavily"), sdk_transport_errors():
+            response = await self.http_async_client.post("/search", content=self._payload(query, **kwargs))
+        return self._handle(response)
+
+    def close(self):
+        self.http_client.close()
+
+
+class ClientRegistry:
+    """
+    Process wide home of the outbound clients. Every ChatOpenAI model and the
+    Tavily client share one sync and one async connection pool per service, and
+    models are built once per (model, cache) pair instead of per call.
+
+    Pools open connections lazily, so clients created while a preloading server
+    imports the app start empty in every forked worker.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.openai_http_client: Optional[httpx.Client] = None
+        self.openai_http_async_client: Optional[httpx.AsyncClient] = None
+        self.tavily_client: Optional[PooledTavilyClient] = None
+        self.chat_models: Dict = {}
+        # Set by override(): builds stand-in chat models instead of ChatOpenAI
+        self.chat_model_factory: Optional[Callable[..., BaseChatModel]] = None
+
+    def _openai_clients(self):
+        if self.openai_http_client is None:
+            options = dict(limits=http_limits(), timeout=http_timeout(config.OPENAI_TIMEOUT_SECONDS))
+            transport, async_transport = scheduled_transports("openai", estimate=estimate_openai_tokens, usage=openai_usage)
+            if transport is not None:
+                # The scheduler retries (and counts retries) in place of the SDK
+                self.openai_http_client = httpx.Client(**options, transport=transport)
+                self.openai_http_async_client = httpx.AsyncClient(**options, transport=async_transport)
+            else:
+                self.openai_http_client = httpx.Client(**options, event_hooks={"response": [count_openai_retry]})
+                self.openai_http_async_client = httpx.AsyncClient(**options, event_hooks={"response": [acount_openai_retry]})
+        return self.openai_http_client, self.openai_http_async_client
+
+    def chat_model(self, model: str, cache=None) -> ChatOpenAI:
+        key = (model, id(cache))
+        with self.lock:
+            if key not in self.chat_models and self.chat_model_factory is not None:
+                self.chat_models[key] = self.chat_model_factory(model=model, cache=cache, callbacks=[token_counter])
+            elif key not in self.chat_models:
+                http_client, http_async_client = self._openai_clients()
+                self.chat_models[key] = ChatOpenAI(
+                    model=model,
+                    cache=cache,
+                    callbacks=[token_counter],
+                    http_client=http_client,
+                    http_async_client=http_async_client,
+                    timeout=config.OPENAI_TIMEOUT_SECONDS,
+                    max_retries=0 if config.SCHEDULER_ENABLED else 2,
+                )
+            return self.chat_models[key]
+
+    def tavily(self) -> PooledTavilyClient:
+        with self.lock:
+            if self.tavily_client is None:
+                self.tavily_client = PooledTavilyClient()
+            return self.tavily_client
+
+    def override(self, chat_model_factory: Callable[..., BaseChatModel], tavily_client):
+        """
+        Serve stand-ins instead of the real services, e.g. the replayed
+        fixtures of the benchmarks. `chat_model_factory(model=, cache=,
+        callbacks=)` builds each chat model. Only clients looked up after the
+        call are affected, so override before importing main.
+        """
+        self.reset()
+        with self.lock:
+            self.chat_model_factory = chat_model_factory
+            self.tavily_client = tavily_client
+
+    def reset(self):
+        """Drop every client; the next lookup builds fresh ones."""
+        with self.lock:
+            if self.openai_http_client is not None:
+                self.openai_http_client.close()
+            if self.tavily_client is not None:
+                self.tavily_client.close()
+            self.openai_http_client = None
+            self.openai_http_async_client = None
+            self.tavily_client = None
+            self.chat_models = {}
+            self.chat_model_factory = None
+
+
+clients = ClientRegistry()
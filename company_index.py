@@ -0,0 +1,138 @@
+import argparse
+import csv
+import difflib
+import json
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import config
+from metrics import metrics
+
+LEGAL_SUFFIXES = {
+    "inc", "incorporated", "corp", "corporation", "co", "company", "ltd", "limited", "llc", "plc",
+    "gmbh", "ag", "sa", "nv", "bv", "srl", "spa", "holding", "holdings", "group",
+}
+
+FIELDS = ("name", "canonical_name", "industry", "location")
+
+
+def normalize_company_name(name: str) -> str:
+    """Lowercase, punctuation free form of a company name without legal suffixes ("Apple Inc." -> "apple")."""
+    words = re.sub(r"[^\w\s&]", " ", str(name).lower()).split()
+    while len(words) > 1 and words[-1] in LEGAL_SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+
+class CompanyIndex:
+    """
+    Local answer to "which companies share this name": normalized name ->
+    list of {"canonical_name", "industry", "location"}. Exact lookups are a
+    dict hit; fuzzy lookups only compare against names with the same first
+    letter. Entries come from CSV/JSONL dumps and from earlier LLM answers,
+    which are appended to `path` when one is given.
+
+    Rows in both formats have the fields name, canonical_name, industry and
+    location; rows sharing a name are the homonyms of that name.
+    """
+
+    def __init__(self, path: Optional[str] = None, fuzzy_cutoff: float = 0.9):
+        self.path = path
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.entries: Dict[str, List[Dict]] = {}
+        self.buckets: Dict[str, List[str]] = {}
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load_jsonl(path, persist=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _add_row(self, row: Dict) -> bool:
+        key = normalize_company_name(row.get("name") or row.get("canonical_name") or "")
+        if not key:
+            return False
+        company = {
+            "canonical_name": (row.get("canonical_name") or row.get("name")).strip(),
+            "industry": (row.get("industry") or "").strip(),
+            "location": (row.get("location") or "").strip(),
+        }
+        companies = self.entries.get(key)
+        if companies is None:
+            self.entries[key] = companies = []
+            self.buckets.setdefault(key[0], []).append(key)
+        if any(normalize_company_name(c["canonical_name"]) == normalize_company_name(company["canonical_name"])
+               and c["industry"].lower() == company["industry"].lower() for c in companies):
+            return False
+        companies.append(company)
+        return True
+
+    def add_rows(self, rows: Iterable[Dict], persist: bool = True) -> int:
+        added = []
+        with self.lock:
+            for row in rows:
+                if self._add_row(row):
+                    added.append({field: row.get(field, "") for field in FIELDS})
+            if persist and self.path and added:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    for row in added:
+                        f.write(json.dumps(row) + "\n")
+        return len(added)
+
+    def load_jsonl(self, path: str, persist: bool = True) -> int:
+        with open(path, encoding="utf-8") as f:
+            return self.add_rows((json.loads(line) for line in f if line.strip()), persist=persist)
+
+    def load_csv(self, path: str, persist: bool = True) -> int:
+        with open(path, newline="", encoding="utf-8") as f:
+            return self.add_rows(csv.DictReader(f), persist=persist)
+
+    def lookup(self, name: str) -> Optional[List[Dict]]:
+        key = normalize_company_name(name)
+        # learn() may add entries from another thread: read under the lock, but
+        # run the fuzzy match on a snapshot of the bucket outside of it
+        with self.lock:
+            companies = self.entries.get(key)
+            candidates = list(self.buckets.get(key[0], [])) if companies is None and key else []
+        if candidates:
+            matches = difflib.get_close_matches(key, candidates, n=1, cutoff=self.fuzzy_cutoff)
+            if matches:
+                with self.lock:
+                    companies = self.entries.get(matches[0])
+        if companies is not None:
+            companies = list(companies)
+        metrics.increment("company_index_lookups_total", result="miss" if companies is None else "hit")
+        return companies
+
+    def learn(self, name: str, company_list: List[str]) -> None:
+        """Remember an LLM listing of the companies called `name` ("Name, Industry" per entry)."""
+        rows = []
+        for entry in company_list:
+            canonical_name, _, industry = entry.partition(",")
+            rows.append({"name": name, "canonical_name": canonical_name.strip(), "industry": industry.strip()})
+        self.add_rows(rows)
+
+    @staticmethod
+    def as_company_list(companies: List[Dict]) -> List[str]:
+        """Same shape as the parsed LLM answer: one name, or "Name, Industry" per homonym."""
+        if len(companies) == 1:
+            return [companies[0]["canonical_name"]]
+        return [f"{c['canonical_name']}, {c['industry']}" if c["industry"] else c["canonical_name"] for c in companies[:5]]
+
+
+def create_company_index() -> Optional[CompanyIndex]:
+    if not config.COMPANY_INDEX_ENABLED:
+        return None
+    return CompanyIndex(config.COMPANY_INDEX_PATH or None, fuzzy_cutoff=config.COMPANY_INDEX_FUZZY_CUTOFF)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a CSV or JSONL company dump into the company index")
+    parser.add_argument("dump", help="file with name, canonical_name, industry and location columns")
+    args = parser.parse_args()
+    index = CompanyIndex(config.COMPANY_INDEX_PATH)
+    load = index.load_csv if args.dump.lower().endswith(".csv") else index.load_jsonl
+    print(f"Imported {load(args.dump)} companies into {config.COMPANY_INDEX_PATH}")
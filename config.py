@@ -0,0 +1,163 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def env_str(name, default=""):
+    value = os.getenv(name)
+    return default if value is None or value.strip() == "" else value.strip()
+
+
+def env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_bool(name, default=False):
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Checkpoint / conversation persistence
+CHECKPOINT_BACKEND = env_str("CHECKPOINT_BACKEND", "sqlite")
+CHECKPOINT_DB_PATH = env_str("CHECKPOINT_DB_PATH", os.path.join("data", "checkpoints.sqlite"))
+
+# Conversation lifecycle
+CONVERSATION_IDLE_TTL_SECONDS = env_float("CONVERSATION_IDLE_TTL_SECONDS", 1800)
+MAX_LIVE_CONVERSATIONS = env_int("MAX_LIVE_CONVERSATIONS", 10000)
+CONVERSATION_SWEEP_INTERVAL_SECONDS = env_float("CONVERSATION_SWEEP_INTERVAL_SECONDS", 60)
+# A running turn leases its conversation in the store so no worker evicts it;
+# the lease lapses after this long in case the worker dies mid-turn
+CONVERSATION_LEASE_SECONDS = env_float("CONVERSATION_LEASE_SECONDS", 600)
+
+# spaCy backend: "full" runs the transformer pipeline, "light" loads a small
+# model with only the components intent detection needs (tagger + lemmatizer)
+SPACY_PIPELINE_MODE = env_str("SPACY_PIPELINE_MODE", "full").lower()
+SPACY_MODEL = env_str("SPACY_MODEL", "en_core_web_sm" if SPACY_PIPELINE_MODE == "light" else "en_core_web_trf")
+
+# Model loading: warm up in the background once the server starts, or load
+# while importing the app so a forking server (gunicorn --preload) shares the
+# loaded model copy-on-write between its workers
+WARM_UP_ON_STARTUP = env_bool("WARM_UP_ON_STARTUP", True)
+PRELOAD_MODELS = env_bool("PRELOAD_MODELS", False)
+
+# Bulk intent classification (UserInputValidator.classify_intents)
+SPACY_BATCH_SIZE = env_int("SPACY_BATCH_SIZE", 256)
+SPACY_N_PROCESS = env_int("SPACY_N_PROCESS", 1)
+
+# Tavily response cache: in-memory LRU with TTL, plus an optional SQLite tier
+# (set TAVILY_CACHE_DISK_PATH) shared between workers and restarts
+TAVILY_CACHE_ENABLED = env_bool("TAVILY_CACHE_ENABLED", True)
+TAVILY_CACHE_TTL_SECONDS = env_float("TAVILY_CACHE_TTL_SECONDS", 3600)
+TAVILY_CACHE_MAX_ENTRIES = env_int("TAVILY_CACHE_MAX_ENTRIES", 1024)
+TAVILY_CACHE_DISK_PATH = env_str("TAVILY_CACHE_DISK_PATH", "")
+
+# LLM response cache for the company/intent resolution and search query steps
+# (exact match on the normalized prompt and model settings)
+LLM_CACHE_ENABLED = env_bool("LLM_CACHE_ENABLED", True)
+LLM_CACHE_TTL_SECONDS = env_float("LLM_CACHE_TTL_SECONDS", 86400)
+LLM_CACHE_MAX_ENTRIES = env_int("LLM_CACHE_MAX_ENTRIES", 2048)
+LLM_CACHE_DISK_PATH = env_str("LLM_CACHE_DISK_PATH", "")
+
+# Outbound HTTP: every OpenAI model and the Tavily client share keep-alive
+# connection pools sized by these settings (see clients.py)
+HTTP_MAX_CONNECTIONS = env_int("HTTP_MAX_CONNECTIONS", 100)
+HTTP_MAX_KEEPALIVE_CONNECTIONS = env_int("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20)
+HTTP_KEEPALIVE_EXPIRY_SECONDS = env_float("HTTP_KEEPALIVE_EXPIRY_SECONDS", 30)
+HTTP_CONNECT_TIMEOUT_SECONDS = env_float("HTTP_CONNECT_TIMEOUT_SECONDS", 10)
+OPENAI_TIMEOUT_SECONDS = env_float("OPENAI_TIMEOUT_SECONDS", 60)
+TAVILY_TIMEOUT_SECONDS = env_float("TAVILY_TIMEOUT_SECONDS", 100)
+TAVILY_BASE_URL = env_str("TAVILY_BASE_URL", "https://api.tavily.com")
+
+# Speculative search: build an alternative query next to the main one and run
+# both searches concurrently, so a rejected answer can be replaced without a
+# new query + search round trip (costs one extra LLM call and search per round)
+SPECULATIVE_SEARCH = env_bool("SPECULATIVE_SEARCH", False)
+
+# Refinement loop budget per conversation; the best scoring answer so far is
+# returned once any limit is reached (0 disables a limit)
+MAX_REFINEMENT_ITERATIONS = env_int("MAX_REFINEMENT_ITERATIONS", 3)
+REFINEMENT_DEADLINE_SECONDS = env_float("REFINEMENT_DEADLINE_SECONDS", 60)
+REFINEMENT_TOKEN_BUDGET = env_int("REFINEMENT_TOKEN_BUDGET", 20000)
+
+# Local fast path: take the company name from a single spaCy ORG entity and
+# location-type clarity from keywords when their confidence reaches the
+# threshold, instead of asking the LLM
+FAST_PATH_ENABLED = env_bool("FAST_PATH_ENABLED", True)
+FAST_PATH_MIN_CONFIDENCE = env_float("FAST_PATH_MIN_CONFIDENCE", 0.8)
+
+# Local company index consulted before asking the LLM for companies sharing a
+# name; filled from CSV/JSONL dumps (python company_index.py dump.csv) and from
+# earlier LLM answers, persisted as JSONL at COMPANY_INDEX_PATH
+COMPANY_INDEX_ENABLED = env_bool("COMPANY_INDEX_ENABLED", True)
+COMPANY_INDEX_PATH = env_str("COMPANY_INDEX_PATH", os.path.join("data", "company_index.jsonl"))
+COMPANY_INDEX_LEARN = env_bool("COMPANY_INDEX_LEARN", True)
+COMPANY_INDEX_FUZZY_CUTOFF = env_float("COMPANY_INDEX_FUZZY_CUTOFF", 0.9)
+
+# Per-request traces: wall time, tokens, Tavily latency, cache hits and
+# retries of every graph node (see tracing.py). Kept in memory for the last
+# TRACE_HISTORY_SIZE conversations (GET /traces/{id}) and, with a dump
+# directory, appended as JSON lines to <TRACE_DUMP_DIR>/<conversation_id>.jsonl
+TRACING_ENABLED = env_bool("TRACING_ENABLED", True)
+TRACE_HISTORY_SIZE = env_int("TRACE_HISTORY_SIZE", 200)
+TRACE_DUMP_DIR = env_str("TRACE_DUMP_DIR", "")
+
+# Source attribution of answers: "domains" names the publishers of the search
+# result URLs from the table in sources.py (extended by the JSON object of
+# domain -> name at SOURCE_PUBLISHERS_PATH); "llm" asks the model to summarize
+# the sources from the raw search response instead
+SOURCE_ATTRIBUTION = env_str("SOURCE_ATTRIBUTION", "domains").lower()
+SOURCE_ATTRIBUTION_MAX_SOURCES = env_int("SOURCE_ATTRIBUTION_MAX_SOURCES", 5)
+SOURCE_PUBLISHERS_PATH = env_str("SOURCE_PUBLISHERS_PATH", "")
+
+# Batch question answering (batch.py, POST /batch): questions answered at a
+# time, and the most a POST /batch request may ask for
+BATCH_CONCURRENCY = env_int("BATCH_CONCURRENCY", 8)
+BATCH_MAX_CONCURRENCY = env_int("BATCH_MAX_CONCURRENCY", 32)
+
+# Outbound request scheduler (scheduler.py): OpenAI and Tavily requests wait
+# for per-provider request and token budgets (0 disables a limit) instead of
+# bursting into 429s, and rejected requests are retried with exponential
+# backoff and jitter. Limits apply per worker process, so divide the account
+# quota by WEB_CONCURRENCY. Batch jobs only use the budget interactive
+# conversations leave, never the last SCHEDULER_INTERACTIVE_RESERVE of it
+SCHEDULER_ENABLED = env_bool("SCHEDULER_ENABLED", True)
+OPENAI_REQUESTS_PER_MINUTE = env_float("OPENAI_REQUESTS_PER_MINUTE", 500)
+OPENAI_TOKENS_PER_MINUTE = env_float("OPENAI_TOKENS_PER_MINUTE", 0)
+TAVILY_REQUESTS_PER_MINUTE = env_float("TAVILY_REQUESTS_PER_MINUTE", 100)
+SCHEDULER_INTERACTIVE_RESERVE = env_float("SCHEDULER_INTERACTIVE_RESERVE", 0.2)
+SCHEDULER_MAX_RETRIES = env_int("SCHEDULER_MAX_RETRIES", 4)
+SCHEDULER_BACKOFF_BASE_SECONDS = env_float("SCHEDULER_BACKOFF_BASE_SECONDS", 0.5)
+SCHEDULER_BACKOFF_MAX_SECONDS = env_float("SCHEDULER_BACKOFF_MAX_SECONDS", 20)
+# Tavily searches that time out may have run (and been billed) already, so
+# only connection failures are retried unless this is on
+TAVILY_RETRY_TIMEOUTS = env_bool("TAVILY_RETRY_TIMEOUTS", False)
+
+# Request coalescing: concurrent identical Tavily searches, source summaries
+# and same-name company listings share one in-flight call (see cache.SingleFlight)
+SINGLE_FLIGHT_ENABLED = env_bool("SINGLE_FLIGHT_ENABLED", True)
+
+# Heuristic pre-evaluation: answers are scored locally (0-1) from their coverage
+# of the company name and intent keywords, their length and their number of
+# sources. At or above the accept score they are taken, at or below the reject
+# score (or shorter than the minimum length) they are refined, both without
+# the GPT-4o evaluator, which only sees the band in between
+PRE_EVALUATION_ENABLED = env_bool("PRE_EVALUATION_ENABLED", True)
+PRE_EVALUATION_ACCEPT_SCORE = env_float("PRE_EVALUATION_ACCEPT_SCORE", 0.8)
+PRE_EVALUATION_REJECT_SCORE = env_float("PRE_EVALUATION_REJECT_SCORE", 0.2)
+PRE_EVALUATION_MIN_ANSWER_CHARS = env_int("PRE_EVALUATION_MIN_ANSWER_CHARS", 20)
+PRE_EVALUATION_TARGET_ANSWER_CHARS = env_int("PRE_EVALUATION_TARGET_ANSWER_CHARS", 150)
+PRE_EVALUATION_TARGET_KEYWORDS = env_int("PRE_EVALUATION_TARGET_KEYWORDS", 2)
+PRE_EVALUATION_TARGET_SOURCES = env_int("PRE_EVALUATION_TARGET_SOURCES", 2)
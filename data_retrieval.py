@@ -1,42 +1,96 @@
 import os
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
+from cache import search_cache, llm_cache, url_summary_flight
+from clients import clients
+from sources import search_sources
+import config
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class DataRetrieval:
     def __init__(self):
-        self.TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
-        self.llm = ChatOpenAI(model="gpt-4o")
+        self.tavily_client = clients.tavily()
+        self.llm = clients.chat_model("gpt-4o", cache=llm_cache)
         
     def create_search_input(self, company_name, intent, text, refined_query):
-        prompt = f"""Create JUST ONE search text for web search. 
+        prompt = self._search_input_prompt(company_name, intent, text, refined_query)
+        response = self.llm.invoke(prompt)
+        return response.content
+
+    async def acreate_search_input(self, company_name, intent, text, refined_query):
+        prompt = self._search_input_prompt(company_name, intent, text, refined_query)
+        response = await self.llm.ainvoke(prompt)
+        return response.content
+
+    def _search_input_prompt(self, company_name, intent, text, refined_query):
+        return f"""Create JUST ONE search text for web search. 
         Company Name: "{company_name}"
         Intent: "{intent}"
         Text: "{text}"
         Take into consideration this refined query: "{refined_query}"
         """
-        
+
+    def create_alternative_search_input(self, company_name, intent, text, refined_query):
+        prompt = self._alternative_search_input_prompt(company_name, intent, text, refined_query)
         response = self.llm.invoke(prompt)
         return response.content
 
+    async def acreate_alternative_search_input(self, company_name, intent, text, refined_query):
+        prompt = self._alternative_search_input_prompt(company_name, intent, text, refined_query)
+        response = await self.llm.ainvoke(prompt)
+        return response.content
+
+    def _alternative_search_input_prompt(self, company_name, intent, text, refined_query):
+        return f"""Create JUST ONE search text for web search that looks for the same information from a different angle than the most direct query, for example with other wording or by asking for an official source.
+        Company Name: "{company_name}"
+        Intent: "{intent}"
+        Text: "{text}"
+        Take into consideration this refined query: "{refined_query}"
+        """
+
     def tavily_search(self, text):
-        from tavily import TavilyClient
-        client = TavilyClient(self.TAVILY_API_KEY)
-        response = client.search(
+        response = search_cache.cached(self.tavily_client.search, self._search_params(text))
+        if config.SOURCE_ATTRIBUTION == "llm":
+            url_sum = self.url_summary(response).content
+        else:
+            url_sum = search_sources(response)
+        return url_sum, response.get('answer')
+
+    async def atavily_search(self, text):
+        response = await search_cache.acached(self.tavily_client.asearch, self._search_params(text))
+        if config.SOURCE_ATTRIBUTION == "llm":
+            url_sum = (await self.aurl_summary(response)).content
+        else:
+            url_sum = search_sources(response)
+        return url_sum, response.get('answer')
+
+    def _search_params(self, text):
+        return dict(
             query=text,
             search_depth="advanced", 
             include_answer=True,     
             include_domains=[],       
             max_results=5           
         )
-        url_sum = self.url_summary(response)
-        return url_sum, response.get('answer')
     
     def url_summary(self, all_response):
-        prompt=f"""{all_response} - summarize all the source names used in this text and do not include the URL itself"""
-        url_sum = self.llm.invoke(prompt)
+        prompt = self._url_summary_prompt(all_response)
+        url_sum = url_summary_flight.do(prompt, self.llm.invoke, prompt)
+        return url_sum
+
+    async def aurl_summary(self, all_response):
+        prompt = self._url_summary_prompt(all_response)
+        url_sum = await url_summary_flight.ado(prompt, self.llm.ainvoke, prompt)
         return url_sum
+
+    def _url_summary_prompt(self, all_response):
+        return f"""{all_response} - summarize all the source names used in this text and do not include the URL itself"""
     
     def search_wikipedia(self, query):
         """Searches Wikipedia and returns the summary of the first result."""
@@ -61,4 +115,38 @@ class DataRetrieval:
             return url_summary, data_retrieval_general_output
         elif intent.lower() == "investments":
             url_summary, data_retrieval_general = self.tavily_search(text)
-            return url_summary, data_retrieval_general
\ No newline at end of file
+            return url_summary, data_retrieval_general
+
+    async def adata_retrieval_general(self, text, intent):
+        if intent.lower() in ("customers", "business model", "timeframe", "location", "investments"):
+            url_summary, data_retrieval_general = await self.atavily_search(text)
+            return url_summary, data_retrieval_general
+
+    def speculative_data_retrieval(self, text, alternative_text, intent):
+        """
+        Run the search for `text` and for `alternative_text` at the same time.
+        A failed alternative search yields (None, None) instead of an error.
+        """
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            # Copied contexts keep token accounting (budget.track_tokens) working in the threads
+            primary = pool.submit(contextvars.copy_context().run, self.data_retrieval_general, text, intent)
+            alternative = pool.submit(contextvars.copy_context().run, self.data_retrieval_general, alternative_text, intent)
+            try:
+                alternative_result = alternative.result() or (None, None)
+            except Exception as e:
+                logger.warning("Error in speculative search: %s", e, exc_info=e)
+                alternative_result = (None, None)
+            return primary.result(), alternative_result
+
+    async def aspeculative_data_retrieval(self, text, alternative_text, intent):
+        primary, alternative = await asyncio.gather(
+            self.adata_retrieval_general(text, intent),
+            self.adata_retrieval_general(alternative_text, intent),
+            return_exceptions=True,
+        )
+        if isinstance(primary, BaseException):
+            raise primary
+        if isinstance(alternative, BaseException):
+            logger.warning("Error in speculative search: %s", alternative, exc_info=alternative)
+            alternative = None
+        return primary, alternative or (None, None)
@@ -1,43 +1,186 @@
-from typing import Dict, Tuple, List
+import logging
+import os
+import re
+from typing import Dict, Tuple, List, Optional
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
+from pydantic import BaseModel, Field, field_validator
 from dotenv import load_dotenv
+from clients import clients
+from metrics import metrics
+from tracing import record
+from utils import IntentKeywordIndex
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class Evaluation(BaseModel):
+    """Quality of an answer to a user query."""
+
+    # Every field is required and unconstrained in the schema, as strict function
+    # calling demands; the validators clamp and fill in what the model gets wrong
+    relevance_score: int = Field(description="0-10, how specifically the answer addresses the query")
+    completeness_score: int = Field(description="0-10, how fully it answers")
+    missing_information: List[str] = Field(description="Key aspects missing")
+    refinement_needed: bool
+    refined_query: str = Field(description="Better search query, empty if not needed")
+
+    @field_validator("relevance_score", "completeness_score", mode="before")
+    @classmethod
+    def clamp_score(cls, value):
+        return min(10, max(0, round(float(value))))
+
+    @field_validator("missing_information", mode="before")
+    @classmethod
+    def drop_none(cls, value):
+        return [item for item in value or [] if item and str(item).strip().lower() != "none"]
+
+
+INTENT_KEYWORDS_PATH = os.path.join(os.path.dirname(__file__), "source", "intent_keywords.txt")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+PRE_EVALUATION_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+
+class HeuristicEvaluator:
+    """
+    Local pre-screen of an answer, scored from 0 to 1 by how much of the company
+    name and of the intent's keywords it mentions, its length and its number of
+    sources. Answers at either end of the scale are decided without an LLM call.
+    """
+
+    WEIGHTS = {"company": 0.35, "intent": 0.3, "length": 0.2, "sources": 0.15}
+
+    def __init__(self, keyword_index: Optional[IntentKeywordIndex] = None):
+        self.keyword_index = keyword_index or IntentKeywordIndex(INTENT_KEYWORDS_PATH)
+
+    def score(self, answer: str, company_name: str, intent: str, sources) -> float:
+        if not isinstance(answer, str) or len(answer.strip()) < config.PRE_EVALUATION_MIN_ANSWER_CHARS:
+            return 0.0
+        words = set(WORD_PATTERN.findall(answer.lower()))
+        # Crude stems, so "headquartered" and "investors" match their keywords
+        words |= {word[:-1] for word in words if word.endswith("s")} | {word[:-2] for word in words if word.endswith("ed")}
+        coverage = {
+            "company": self._company_coverage(company_name, words),
+            "intent": self._intent_coverage(intent, words),
+            "length": min(1.0, len(answer.strip()) / config.PRE_EVALUATION_TARGET_ANSWER_CHARS),
+            "sources": min(1.0, self._source_count(sources) / config.PRE_EVALUATION_TARGET_SOURCES),
+        }
+        return round(sum(self.WEIGHTS[name] * value for name, value in coverage.items()), 3)
+
+    def evaluate(self, query: str, answer: str, company_name: str, intent: str, sources) -> Optional[Dict]:
+        """
+        Evaluation result for a clearly good or clearly empty answer, or None when
+        the score falls in the uncertain band (or the company or intent is unknown)
+        and AnswerEvaluator has to decide.
+        """
+        score = self.score(answer, company_name, intent, sources)
+        if score == 0.0:
+            decision = "rejected"
+        elif not (company_name or "").strip() or not (intent or "").strip():
+            decision = "uncertain"
+        elif score >= config.PRE_EVALUATION_ACCEPT_SCORE:
+            decision = "accepted"
+        elif score <= config.PRE_EVALUATION_REJECT_SCORE:
+            decision = "rejected"
+        else:
+            decision = "uncertain"
+        metrics.increment("pre_evaluations_total", result=decision)
+        metrics.observe("pre_evaluation_score", score, buckets=PRE_EVALUATION_BUCKETS)
+        if decision == "uncertain":
+            return None
+        record("pre_evaluation_hits")
+        points = round(score * 10)
+        if decision == "accepted":
+            return {
+                'relevance_score': points,
+                'completeness_score': points,
+                'missing_information': [],
+                'refinement_needed': False,
+                'refined_query': None
+            }
+        # Searching for the company and intent alone gives the next iteration a
+        # different search input than the one that found nothing
+        refined_query = " ".join(part.strip() for part in (company_name or "", intent or "") if part and part.strip())
+        return {
+            'relevance_score': points,
+            'completeness_score': points,
+            'missing_information': ['An answer about the company and intent'],
+            'refinement_needed': True,
+            'refined_query': refined_query or query
+        }
+
+    @staticmethod
+    def _company_coverage(company_name: str, words: set) -> float:
+        name_words = WORD_PATTERN.findall((company_name or "").lower())
+        if not name_words:
+            return 0.0
+        return sum(word in words for word in name_words) / len(name_words)
+
+    def _intent_coverage(self, intent: str, words: set) -> float:
+        intent = (intent or "").strip().lower()
+        keywords = {keyword.lower() for keyword, categories in self.keyword_index.get().items()
+                    if intent in {category.lower() for category in categories}}
+        if not keywords:
+            return 0.0
+        return min(1.0, len(keywords & words) / config.PRE_EVALUATION_TARGET_KEYWORDS)
+
+    @staticmethod
+    def _source_count(sources) -> int:
+        # Source lines from sources.search_sources, or the LLM summary message
+        sources = getattr(sources, "content", sources)
+        if not isinstance(sources, str):
+            return 0
+        return sum(1 for line in sources.splitlines() if line.strip())
+
+
+heuristic_evaluator = HeuristicEvaluator()
+
 
 class AnswerEvaluator:
     def __init__(self, llm: ChatOpenAI):
         self.llm = llm
-        self.evaluation_prompt = """You are an answer quality evaluator. Analyze the given answer based on two main criteria:
+        # The raw message is kept so a model answering in text can still be parsed
+        self.structured_llm = llm.with_structured_output(Evaluation, method="function_calling", strict=True, include_raw=True)
+        self.evaluation_prompt = """Rate the answer to the query from 0 to 10 for relevance and completeness, list what is missing, and if refinement is needed give an improved search query.
 
-1. Relevance (0-10):
-   - Does the information directly address the user's question?
-   - Is the information specific to the query?
-   - Are there any irrelevant details?
+Query: {query}
+Answer: {answer}"""
 
-2. Completeness (0-10):
-   - Does the answer provide sufficient detail?
-   - Are there any missing key aspects?
-   - Is the information comprehensive enough?
-
-User Query: {query}
-Answer to Evaluate: {answer}
+    def evaluate_answer(self, query: str, answer: str) -> Dict:
+        output = self.structured_llm.invoke(self._evaluation_messages(query, answer))
+        return self._evaluation_result(output, query)
 
-Provide your evaluation in this format:
-Relevance Score: [0-10]
-Completeness Score: [0-10]
-Missing Information: [List any missing key aspects]
-Refinement Needed: [Yes/No]
-Refined Query: [If refinement is needed, provide an improved query]"""
+    async def aevaluate_answer(self, query: str, answer: str) -> Dict:
+        output = await self.structured_llm.ainvoke(self._evaluation_messages(query, answer))
+        return self._evaluation_result(output, query)
 
-    def evaluate_answer(self, query: str, answer: str) -> Dict:
+    def _evaluation_messages(self, query: str, answer: str) -> List:
         evaluation_message = self.evaluation_prompt.format(
             query=query,
             answer=answer
         )
-        response = self.llm.invoke([
-            SystemMessage(content="You are an answer quality evaluator."),
+        return [
+            SystemMessage(content="You evaluate answers to questions about companies."),
             HumanMessage(content=evaluation_message)
-        ])
-        evaluation_text = response.content
+        ]
+
+    def _evaluation_result(self, output: Dict, query: str) -> Dict:
+        parsed = output.get("parsed")
+        if parsed is not None:
+            metrics.increment("evaluations_total", format="structured")
+            result = parsed.model_dump()
+            result["refined_query"] = result["refined_query"] or None
+            return result
+        raw = getattr(output.get("raw"), "content", None)
+        if isinstance(raw, str) and raw.strip():
+            metrics.increment("evaluations_total", format="text")
+            return self._parse_evaluation(raw, query)
+        metrics.increment("evaluations_total", format="failed")
+        logger.warning("Error parsing evaluation response: %s", output.get("parsing_error"))
+        return self._failed_evaluation(query)
+
+    def _parse_evaluation(self, evaluation_text: str, query: str) -> Dict:
         try:
             lines = evaluation_text.split('\n')
             result = {
@@ -65,16 +208,21 @@ Refined Query: [If refinement is needed, provide an improved query]"""
             return result
             
         except Exception as e:
-            print(f"Error parsing evaluation response: {str(e)}")
-            return {
-                'relevance_score': 0,
-                'completeness_score': 0,
-                'missing_information': ['Error in evaluation'],
-                'refinement_needed': True,
-                'refined_query': query
-            }
+            logger.warning("Error parsing evaluation response: %s", e)
+            return self._failed_evaluation(query)
+
+    @staticmethod
+    def _failed_evaluation(query: str) -> Dict:
+        return {
+            'relevance_score': 0,
+            'completeness_score': 0,
+            'missing_information': ['Error in evaluation'],
+            'refinement_needed': True,
+            'refined_query': query
+        }
 
-    def needs_refinement(self, evaluation_result: Dict) -> Tuple[bool, str]:
+    @staticmethod
+    def needs_refinement(evaluation_result: Dict) -> Tuple[bool, str]:
         threshold = 5
         
         needs_refinement = (
@@ -86,21 +234,67 @@ Refined Query: [If refinement is needed, provide an improved query]"""
         
         return needs_refinement, refined_query
 
-def evaluate_and_refine(query: str, answer: str) -> Tuple[bool, str, Dict]:
+_answer_evaluator: Optional[AnswerEvaluator] = None
+
+
+def answer_evaluator() -> AnswerEvaluator:
+    """
+    Evaluator around the registry's gpt-4o model, so the structured output
+    chain is built once instead of per evaluation. It is rebuilt when the
+    registry hands out another model (after clients.override() or reset()).
+    """
+    global _answer_evaluator
+    llm = clients.chat_model("gpt-4o")
+    evaluator = _answer_evaluator
+    if evaluator is None or evaluator.llm is not llm:
+        evaluator = _answer_evaluator = AnswerEvaluator(llm)
+    return evaluator
+
+
+def pre_evaluate(query: str, answer: str, company_name: str, intent: str, sources) -> Optional[Dict]:
+    if not config.PRE_EVALUATION_ENABLED:
+        return None
+    return heuristic_evaluator.evaluate(query, answer, company_name, intent, sources)
+
+
+def refined_query_or(refined_query: Optional[str], query: str) -> str:
+    """The evaluator's refined query, or the original query when it gave none (it ends up in a search prompt)."""
+    if not refined_query or refined_query.strip().lower() == "none":
+        return query
+    return refined_query
+
+
+def evaluate_and_refine(query: str, answer: str, company_name: str = "", intent: str = "", sources="") -> Tuple[bool, str, Dict]:
     """
     Evaluate an answer and determine if it needs refinement.
     
     Args:
         query: The original user query
         answer: The answer to evaluate
-        llm: The language model to use for evaluation
+        company_name, intent, sources: Context for the local pre-evaluation,
+            which decides clearly good or empty answers without the LLM
         
     Returns:
         Tuple of (needs_refinement: bool, refined_query: str, evaluation_result: Dict)
     """
-    llm = ChatOpenAI(model="gpt-4o")
-    evaluator = AnswerEvaluator(llm)
-    evaluation_result = evaluator.evaluate_answer(query, answer)
-    needs_refinement, refined_query = evaluator.needs_refinement(evaluation_result)
+    evaluation_result = pre_evaluate(query, answer, company_name, intent, sources)
+    if evaluation_result is None:
+        evaluation_result = answer_evaluator().evaluate_answer(query, answer)
+    needs_refinement, refined_query = AnswerEvaluator.needs_refinement(evaluation_result)
+    refined_query = refined_query_or(refined_query, query)
+    
+    return needs_refinement, refined_query, evaluation_result
+
+
+async def aevaluate_and_refine(query: str, answer: str, company_name: str = "", intent: str = "", sources="") -> Tuple[bool, str, Dict]:
+    """
+    Async counterpart of evaluate_and_refine, awaiting the evaluator LLM
+    instead of blocking the event loop.
+    """
+    evaluation_result = pre_evaluate(query, answer, company_name, intent, sources)
+    if evaluation_result is None:
+        evaluation_result = await answer_evaluator().aevaluate_answer(query, answer)
+    needs_refinement, refined_query = AnswerEvaluator.needs_refinement(evaluation_result)
+    refined_query = refined_query_or(refined_query, query)
     
     return needs_refinement, refined_query, evaluation_result
@@ -0,0 +1,11 @@
+import os
+
+# Import the app once in the master and fork the workers from it. Together with
+# PRELOAD_MODELS=true the spaCy model is loaded a single time and shared
+# copy-on-write by every worker:
+#   PRELOAD_MODELS=true gunicorn -c gunicorn.conf.py api:app
+preload_app = True
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+bind = os.getenv("BIND", "0.0.0.0:8000")
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
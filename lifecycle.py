@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+import config
+from checkpointing import ConversationStore, delete_thread
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationLifecycleManager:
+    """
+    Keeps the number of live conversations bounded. A conversation is live from
+    start_conversation until it completes or is evicted; while it waits on an
+    interrupt its checkpoints stay in the checkpointer.
+
+    Two eviction rules apply:
+      - idle TTL: conversations not touched for `idle_ttl` seconds are dropped
+        by the background sweeper.
+      - size cap: when more than `max_live` conversations exist, the least
+        recently used ones are dropped immediately.
+
+    Evicting removes the conversation record and every checkpoint of its thread.
+    A running turn holds a lease on its record in the shared store, so no worker
+    evicts a conversation that is mid-turn on another one. Leases lapse after
+    `lease_seconds` in case the worker running the turn dies.
+    """
+
+    def __init__(self, store: ConversationStore, checkpointer, idle_ttl: Optional[float] = None,
+                 max_live: Optional[int] = None, sweep_interval: Optional[float] = None,
+                 lease_seconds: Optional[float] = None):
+        self.store = store
+        self.checkpointer = checkpointer
+        self.idle_ttl = config.CONVERSATION_IDLE_TTL_SECONDS if idle_ttl is None else idle_ttl
+        self.max_live = config.MAX_LIVE_CONVERSATIONS if max_live is None else max_live
+        self.sweep_interval = config.CONVERSATION_SWEEP_INTERVAL_SECONDS if sweep_interval is None else sweep_interval
+        self.lease_seconds = config.CONVERSATION_LEASE_SECONDS if lease_seconds is None else lease_seconds
+        self.active = set()
+        self.lock = threading.Lock()
+        self.sweeper_task: Optional[asyncio.Task] = None
+
+    def start(self, conversation_id: str) -> Dict:
+        record = self.store.new_record(leased_until=time.time() + self.lease_seconds)
+        self.store.put(conversation_id, record)
+        with self.lock:
+            self.active.add(conversation_id)
+        metrics.increment("conversations_started_total")
+        self.enforce_cap()
+        return record
+
+    def resume(self, conversation_id: str) -> Optional[Dict]:
+        """
+        The conversation's record with its lease taken, or None when it is not
+        waiting for input (another request resumed it first) or was evicted.
+        """
+        if not self.store.acquire(conversation_id, time.time() + self.lease_seconds):
+            return None
+        with self.lock:
+            self.active.add(conversation_id)
+        return self.store.get(conversation_id)
+
+    def wait_for_input(self, conversation_id: str, record: Dict) -> None:
+        record["waiting_for_input"] = True
+        record["leased_until"] = 0.0
+        self.store.put(conversation_id, record)
+        with self.lock:
+            self.active.discard(conversation_id)
+
+    def release(self, conversation_id: str) -> None:
+        """Stop protecting a conversation that left the graph without finishing (e.g. on error)."""
+        with self.lock:
+            self.active.discard(conversation_id)
+        self.store.lease(conversation_id, 0.0)
+
+    def finish(self, conversation_id: str) -> None:
+        self._drop(conversation_id)
+        metrics.increment("conversations_completed_total")
+
+    def evict(self, conversation_id: str, reason: str) -> bool:
+        """Drop a conversation unless a worker leased it meanwhile; True when it was evicted."""
+        if self._is_active(conversation_id) or not self.store.delete_unleased(conversation_id):
+            return False
+        delete_thread(self.checkpointer, conversation_id)
+        metrics.increment("conversations_evicted_total", reason=reason)
+        return True
+
+    def _drop(self, conversation_id: str) -> None:
+        with self.lock:
+            self.active.discard(conversation_id)
+        self.store.delete(conversation_id)
+        delete_thread(self.checkpointer, conversation_id)
+
+    def _is_active(self, conversation_id: str) -> bool:
+        with self.lock:
+            return conversation_id in self.active
+
+    def enforce_cap(self) -> int:
+        overflow = self.store.count() - self.max_live
+        if overflow <= 0:
+            return 0
+        evicted = 0
+        # Leased (running) conversations are not listed
+        for conversation_id in self.store.least_recently_used(overflow):
+            evicted += self.evict(conversation_id, reason="lru")
+        return evicted
+
+    def sweep(self) -> int:
+        cutoff = time.time() - self.idle_ttl
+        evicted = 0
+        for conversation_id in self.store.idle_since(cutoff):
+            evicted += self.evict(conversation_id, reason="ttl")
+        evicted += self.enforce_cap()
+        metrics.set_gauge("conversations_live", self.store.count())
+        return evicted
+
+    async def run_sweeper(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception:
+                logger.exception("Error sweeping conversations")
+
+    def start_sweeper(self) -> None:
+        if self.sweeper_task is None or self.sweeper_task.done():
+            self.sweeper_task = asyncio.get_running_loop().create_task(self.run_sweeper())
+
+    async def stop_sweeper(self) -> None:
+        if self.sweeper_task is not None:
+            self.sweeper_task.cancel()
+            try:
+                await self.sweeper_task
+            except asyncio.CancelledError:
+                pass
+            self.sweeper_task = None
+
+    def stats(self) -> Dict:
+        live = self.store.count()
+        metrics.set_gauge("conversations_live", live)
+        with self.lock:
+            running = len(self.active)
+        return {
+            "live": live,
+            "running": running,
+            "started": metrics.get("conversations_started_total"),
+            "completed": metrics.get("conversations_completed_total"),
+            "evicted_ttl": metrics.get("conversations_evicted_total", reason="ttl"),
+            "evicted_lru": metrics.get("conversations_evicted_total", reason="lru"),
+            "idle_ttl_seconds": self.idle_ttl,
+            "max_live": self.max_live,
+        }
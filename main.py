@@ -1,12 +1,25 @@
+import asyncio
+import logging
+import operator
+import re
+import time
 import uuid
+from typing import Annotated
 from dotenv import load_dotenv 
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
-from langgraph.types import Command, interrupt
-from langgraph.checkpoint.memory import MemorySaver
+from langgraph.types import Command, StreamWriter, interrupt
+from langgraph.utils.runnable import RunnableCallable
 from text_analyze import UserInputValidator
 from data_retrieval import DataRetrieval
-from evaluation import evaluate_and_refine
+from evaluation import evaluate_and_refine, aevaluate_and_refine
+from checkpointing import create_checkpointer
+from metrics import metrics
+from budget import answer_score, budget_exhausted, with_token_usage
+from tracing import traced
+import config
+
+logger = logging.getLogger(__name__)
 
 user_input_validator = UserInputValidator()
 data_retrieval = DataRetrieval()
@@ -14,6 +27,13 @@ load_dotenv()
 
 question_to_user = "Please ask your question:"
 
+def warm_up():
+    """Load the models that are otherwise loaded by the first request."""
+    user_input_validator.warm_up()
+
+def models_ready():
+    return {"spacy": user_input_validator.nlp_loaded}
+
 class State(TypedDict):
     input: str
     company_name: str
@@ -33,19 +53,92 @@ class State(TypedDict):
     final_answer: str
     original_company_name: str
     url_summary: str
+    # Alternative search run next to the main one when SPECULATIVE_SEARCH is on
+    speculative_search_input: str
+    speculative_output: str
+    speculative_url_summary: str
+    # Refinement budget (see budget.py); tokens_used sums the updates of all
+    # nodes, the token budget counts from refinement_tokens_start on
+    refinement_iterations: int
+    refinement_started_at: float
+    refinement_tokens_start: int
+    tokens_used: Annotated[int, operator.add]
+    best_answer: str
+    best_url_summary: str
+    best_score: int
+
+def initial_state(text: str) -> dict:
+    return {
+        "input": text,
+        "company_name": "",
+        "company_detail": "",
+        "company_list": [],
+        "intent_detail": "",
+        "search_input": "",
+        "update_input": "",
+        "needs_refinement": False,
+        "refined_query": "",
+        "evaluation_result": "",
+        "data_retrieval_general_output": "",
+        "intent": "",
+        "intent_ambiguity": "",
+        "feedback": "",
+        "question_to_user": "",
+        "data_retrieval_tavily_input": "",
+        "data_retrieval_wikipedia_input": "",
+        "data_retrieval_tavily_output": "",
+        "data_retrieval_wikipedia_output": "",
+        "dummy_state_input": "",
+        "final_answer": "",
+        "original_company_name": "",
+        "url_summary": "",
+        "speculative_search_input": "",
+        "speculative_output": "",
+        "speculative_url_summary": "",
+        "refinement_iterations": 0,
+        "refinement_started_at": 0.0,
+        "refinement_tokens_start": 0,
+        "tokens_used": 0,
+        "best_answer": "",
+        "best_url_summary": "",
+        "best_score": -1
+    }
+
+def progress(writer: StreamWriter, stage, **details):
+    # Received by stream_mode="custom" consumers, dropped otherwise
+    writer({"type": "progress", "stage": stage, **details})
 
-def extract_company_name(state: State) -> State:
+def stream_answer(writer: StreamWriter, text):
+    for token in re.findall(r"\S+\s*", text):
+        writer({"type": "token", "text": token})
+
+def extract_company_name(state: State, writer: StreamWriter) -> State:
     original_company_name, company_list = user_input_validator.get_company_name_from_llm(state["input"], state["company_detail"], state["company_name"])
+    progress(writer, "company_resolved", company=original_company_name, candidates=company_list)
     if len(company_list) == 1:
         return {"company_name": original_company_name, "company_list": company_list}
     else:
         return {"company_name": original_company_name, "company_list": company_list}
 
+async def aextract_company_name(state: State, writer: StreamWriter) -> State:
+    original_company_name, company_list = await user_input_validator.aget_company_name_from_llm(state["input"], state["company_detail"], state["company_name"])
+    progress(writer, "company_resolved", company=original_company_name, candidates=company_list)
+    return {"company_name": original_company_name, "company_list": company_list}
+
 def listing_companies_with_same_name(state: State) -> State:
     return {"company_list": state["company_list"]}
 
-def extract_intent(state: State) -> State:
+def intent_analysis_completed(state: State) -> State:
+    return {"intent_ambiguity": state["intent_ambiguity"]}
+
+def extract_intent(state: State, writer: StreamWriter) -> State:
     intent = user_input_validator.get_intent(state["input"] + " " + state["intent_detail"])
+    progress(writer, "intent_detected", intent=intent)
+    return {"intent": intent}
+
+async def aextract_intent(state: State, writer: StreamWriter) -> State:
+    intent = await user_input_validator.aget_intent(state["input"] + " " + state["intent_detail"])
+    progress(writer, "intent_detected", intent=intent)
     return {"intent": intent}
 
 def check_intent_ambiguity(state: State) -> State:
@@ -54,47 +147,159 @@ def check_intent_ambiguity(state: State) -> State:
     checking_intent_ambiguity = user_input_validator.intention_clearity(input, intent)
     return {"intent_ambiguity": checking_intent_ambiguity}
 
+async def acheck_intent_ambiguity(state: State) -> State:
+    intent = state["intent"]
+    input = state["input"] + " " + state["intent_detail"]
+    checking_intent_ambiguity = await user_input_validator.aintention_clearity(input, intent)
+    return {"intent_ambiguity": checking_intent_ambiguity}
+
 def anaysis_company_completed(state):
     if len(state['company_list']) == 1:
         return {"company_name": state['company_list'][0]}
 
+def refinement_start(state):
+    """Start time and token count of the refinement loop, taken when its first search input is built."""
+    if state.get("refinement_started_at"):
+        return {}
+    return {"refinement_started_at": time.time(), "refinement_tokens_start": state.get("tokens_used", 0)}
+
 def anaysis_question_completed(state):
     if len(state['company_list']) == 1 and "clear" in state['intent_ambiguity'].lower():
-        create_search_input = data_retrieval.create_search_input(state['company_name'], state['intent'], state['input'] + " " + state['company_detail'] + " " + state['intent_detail'], state['refined_query'])
-        
-        return {"intent": state['intent'], 
-                "update_input": state['input'] + " " + state['company_detail'] + " " + state['intent_detail'], 
-                "search_input": create_search_input}
+        text = state['input'] + " " + state['company_detail'] + " " + state['intent_detail']
+        create_search_input = data_retrieval.create_search_input(state['company_name'], state['intent'], text, state['refined_query'])
+        update = {"intent": state['intent'], 
+                  "update_input": text, 
+                  "search_input": create_search_input,
+                  **refinement_start(state)}
+        if config.SPECULATIVE_SEARCH:
+            update["speculative_search_input"] = data_retrieval.create_alternative_search_input(state['company_name'], state['intent'], text, state['refined_query'])
+        return update
+
+async def aanaysis_question_completed(state):
+    if len(state['company_list']) == 1 and "clear" in state['intent_ambiguity'].lower():
+        text = state['input'] + " " + state['company_detail'] + " " + state['intent_detail']
+        if config.SPECULATIVE_SEARCH:
+            create_search_input, speculative_search_input = await asyncio.gather(
+                data_retrieval.acreate_search_input(state['company_name'], state['intent'], text, state['refined_query']),
+                data_retrieval.acreate_alternative_search_input(state['company_name'], state['intent'], text, state['refined_query']),
+            )
+        else:
+            create_search_input = await data_retrieval.acreate_search_input(state['company_name'], state['intent'], text, state['refined_query'])
+            speculative_search_input = None
+        update = {"intent": state['intent'], 
+                  "update_input": text, 
+                  "search_input": create_search_input,
+                  **refinement_start(state)}
+        if speculative_search_input is not None:
+            update["speculative_search_input"] = speculative_search_input
+        return update
 
-def data_retrieval_general(state):
+def data_retrieval_general(state, writer: StreamWriter):
     if not state["search_input"] or state["search_input"].isspace():
         return {"data_retrieval_general_output": "No valid search input provided"}
+    progress(writer, "searching", query=state["search_input"])
+    if config.SPECULATIVE_SEARCH and state.get("speculative_search_input"):
+        primary, alternative = data_retrieval.speculative_data_retrieval(state["search_input"], state["speculative_search_input"], state["intent"])
+        return speculative_update(primary, alternative)
     url_summary, data_retrieval_general = data_retrieval.data_retrieval_general(state["search_input"], state["intent"])
     return {"data_retrieval_general_output": data_retrieval_general, "url_summary": url_summary}
+
+async def adata_retrieval_general(state, writer: StreamWriter):
+    if not state["search_input"] or state["search_input"].isspace():
+        return {"data_retrieval_general_output": "No valid search input provided"}
+    progress(writer, "searching", query=state["search_input"])
+    if config.SPECULATIVE_SEARCH and state.get("speculative_search_input"):
+        primary, alternative = await data_retrieval.aspeculative_data_retrieval(state["search_input"], state["speculative_search_input"], state["intent"])
+        return speculative_update(primary, alternative)
+    url_summary, data_retrieval_general = await data_retrieval.adata_retrieval_general(state["search_input"], state["intent"])
+    return {"data_retrieval_general_output": data_retrieval_general, "url_summary": url_summary}
+
+def speculative_update(primary, alternative):
+    url_summary, data_retrieval_general = primary
+    speculative_url_summary, speculative_output = alternative
+    metrics.increment("speculative_searches_total")
+    return {"data_retrieval_general_output": data_retrieval_general,
+            "url_summary": url_summary,
+            "speculative_output": speculative_output or "",
+            "speculative_url_summary": speculative_url_summary or ""}
+
+def use_speculative_result(state, writer: StreamWriter):
+    # The main answer was rejected; evaluate the alternative search that ran
+    # next to it instead of building and running a new search
+    progress(writer, "using_alternative", query=state["speculative_search_input"])
+    metrics.increment("speculative_results_used_total")
+    return {"search_input": state["speculative_search_input"],
+            "data_retrieval_general_output": state["speculative_output"],
+            "url_summary": state["speculative_url_summary"],
+            "speculative_search_input": "",
+            "speculative_output": "",
+            "speculative_url_summary": ""}
     
-def evaluate_and_refine_answer(state):
-    needs_refinement, refined_query, evaluation_result = evaluate_and_refine(state["update_input"], state["data_retrieval_general_output"])
-    return {"needs_refinement": needs_refinement, 
-            "refined_query": refined_query, 
-            "evaluation_result": evaluation_result}
+def evaluate_and_refine_answer(state, writer: StreamWriter):
+    progress(writer, "evaluating")
+    needs_refinement, refined_query, evaluation_result = evaluate_and_refine(state["update_input"], state["data_retrieval_general_output"],
+        state["company_name"], state["intent"], state["url_summary"])
+    return refinement_update(state, writer, needs_refinement, refined_query, evaluation_result)
+
+async def aevaluate_and_refine_answer(state, writer: StreamWriter):
+    progress(writer, "evaluating")
+    needs_refinement, refined_query, evaluation_result = await aevaluate_and_refine(state["update_input"], state["data_retrieval_general_output"],
+        state["company_name"], state["intent"], state["url_summary"])
+    return refinement_update(state, writer, needs_refinement, refined_query, evaluation_result)
+
+def refinement_update(state, writer: StreamWriter, needs_refinement, refined_query, evaluation_result):
+    iterations = state.get("refinement_iterations", 0) + 1
+    update = {"needs_refinement": needs_refinement, 
+              "refined_query": refined_query, 
+              "evaluation_result": evaluation_result,
+              "refinement_iterations": iterations}
+    best_answer, best_url_summary = state.get("best_answer"), state.get("best_url_summary")
+    score = answer_score(evaluation_result)
+    if score > state.get("best_score", -1):
+        best_answer, best_url_summary = state["data_retrieval_general_output"], state["url_summary"]
+        update.update(best_answer=best_answer, best_url_summary=best_url_summary, best_score=score)
+    if needs_refinement:
+        reason = budget_exhausted({**state, "refinement_iterations": iterations})
+        if reason:
+            # Stop refining and answer with the best scoring result so far
+            metrics.increment("refinement_budget_exhausted_total", reason=reason)
+            progress(writer, "budget_exhausted", reason=reason)
+            update.update(needs_refinement=False,
+                          data_retrieval_general_output=best_answer or state["data_retrieval_general_output"],
+                          url_summary=best_url_summary if best_answer else state["url_summary"])
+        else:
+            progress(writer, "refining", refined_query=refined_query)
+    return update
 
 def route_company_list(state):
     company_list = state["company_list"]
     company_string = ", ".join(company_list)
     if len(company_list) == 1:
         return "Accepted"
-    print(f"I found multiple companies: {company_string} \n Please provide more details about the company you are looking for such as industry, function,and location")
+    logger.debug("Multiple companies found: %s", company_string)
     return "Rejected"
     
 def route_intent_ambiguity(state):
     intent_ambiguity = state["intent_ambiguity"]
     if "clear" in intent_ambiguity.lower():
         return "Accepted"
-    print(f"I found more than one location type. Could you please clarify what kind of location you are asking about, such as stores, headquarters, or factories?")
+    logger.debug("Ambiguous intent: %s", intent_ambiguity)
     return "Rejected"
     
+def join_company_and_intent(state):
+    return {}
+
+def route_company_and_intent(state):
+    if route_company_list(state) == "Rejected":
+        return "CompanyRejected"
+    if route_intent_ambiguity(state) == "Rejected":
+        return "IntentRejected"
+    return "Accepted"
+    
 def route_needs_refinement(state):
     needs_refinement = state["needs_refinement"]
+    if needs_refinement and state.get("speculative_output"):
+        return "Speculative"
     if needs_refinement:
         return "Rejected"
     else:
@@ -116,47 +321,65 @@ def additional_detail_for_intent(state):
     
     return {"intent_detail": state["intent_detail"] + " " + detail}
 
-def final_answer_output(state):
+def final_answer_output(state, writer: StreamWriter):
     final_answer = state['data_retrieval_general_output']
-    url_summary = state['url_summary'].content if state['url_summary'] else ""
-    url_summary = url_summary.replace("\n", ", ")
+    url_summary = state['url_summary'] or ""
+    # Checkpoints written before sources became plain text hold the LLM message
+    url_summary = getattr(url_summary, "content", url_summary).replace("\n", ", ")
     formatted_response = f"{final_answer}(Sources: {url_summary})"
-    return {"final_answer": formatted_response}
+    stream_answer(writer, formatted_response)
+    # An alternative search result that was never needed is dropped with the turn
+    return {"final_answer": formatted_response,
+            "speculative_search_input": "",
+            "speculative_output": "",
+            "speculative_url_summary": ""}
+
+def dual_node(func, afunc):
+    # Sync callers (stream/invoke) run func, async callers (astream/ainvoke) await afunc.
+    # Like plain function nodes, both get `writer` injected when they declare it,
+    # both report the LLM tokens they spend in `tokens_used`, and each run is a
+    # span of the request trace under the sync function's name.
+    return RunnableCallable(traced(with_token_usage(func)), traced(with_token_usage(afunc), func.__name__), name=func.__name__)
 
 builder = StateGraph(State)
-builder.add_node("extract_company_name", extract_company_name)
-builder.add_node("extract_intent", extract_intent)
-builder.add_node("listing_companies_with_same_name", listing_companies_with_same_name)
-builder.add_node("check_intent_ambiguity", check_intent_ambiguity)
-builder.add_node("anaysis_question_completed", anaysis_question_completed)
-builder.add_node("additional_question_for_company", additional_question_for_company)
-builder.add_node("anaysis_company_completed", anaysis_company_completed)
-builder.add_node("additional_detail_for_intent", additional_detail_for_intent)
-builder.add_node("evaluate_and_refine_answer", evaluate_and_refine_answer)
-builder.add_node("data_retrieval_general", data_retrieval_general)
-builder.add_node("final_answer_output", final_answer_output)
+builder.add_node("extract_company_name", dual_node(extract_company_name, aextract_company_name))
+builder.add_node("extract_intent", dual_node(extract_intent, aextract_intent))
+builder.add_node("listing_companies_with_same_name", traced(listing_companies_with_same_name))
+builder.add_node("check_intent_ambiguity", dual_node(check_intent_ambiguity, acheck_intent_ambiguity))
+builder.add_node("intent_analysis_completed", traced(intent_analysis_completed))
+builder.add_node("join_company_and_intent", traced(join_company_and_intent))
+builder.add_node("anaysis_question_completed", dual_node(anaysis_question_completed, aanaysis_question_completed))
+builder.add_node("additional_question_for_company", traced(additional_question_for_company))
+builder.add_node("anaysis_company_completed", traced(anaysis_company_completed))
+builder.add_node("additional_detail_for_intent", traced(additional_detail_for_intent))
+builder.add_node("evaluate_and_refine_answer", dual_node(evaluate_and_refine_answer, aevaluate_and_refine_answer))
+builder.add_node("data_retrieval_general", dual_node(data_retrieval_general, adata_retrieval_general))
+builder.add_node("use_speculative_result", traced(use_speculative_result))
+builder.add_node("final_answer_output", traced(final_answer_output))
+# Company resolution and intent detection are independent, so they run as
+# parallel branches and meet in join_company_and_intent, which waits for the
+# last node of both. A clarification re-runs the branch it belongs to, while
+# the other branch only passes its earlier result on to the join again.
 builder.add_edge(START, "extract_company_name")
+builder.add_edge(START, "extract_intent")
 builder.add_edge("extract_company_name", "listing_companies_with_same_name")
+builder.add_edge("extract_intent", "check_intent_ambiguity")
+builder.add_edge("check_intent_ambiguity", "intent_analysis_completed")
+builder.add_edge(["listing_companies_with_same_name", "intent_analysis_completed"], "join_company_and_intent")
 builder.add_conditional_edges(
-    "listing_companies_with_same_name",
-    route_company_list,
+    "join_company_and_intent",
+    route_company_and_intent,
     {  
         "Accepted": "anaysis_company_completed",
-        "Rejected": "additional_question_for_company",
+        "CompanyRejected": "additional_question_for_company",
+        "IntentRejected": "additional_detail_for_intent",
     },
 )
 builder.add_edge("additional_question_for_company", "extract_company_name")
-builder.add_edge("anaysis_company_completed", "extract_intent")
-builder.add_edge("extract_intent", "check_intent_ambiguity")
-builder.add_conditional_edges(
-    "check_intent_ambiguity",
-    route_intent_ambiguity,
-    {  
-        "Accepted": "anaysis_question_completed",
-        "Rejected": "additional_detail_for_intent",
-    },
-)
+builder.add_edge("additional_question_for_company", "intent_analysis_completed")
 builder.add_edge("additional_detail_for_intent", "extract_intent")
+builder.add_edge("additional_detail_for_intent", "listing_companies_with_same_name")
+builder.add_edge("anaysis_company_completed", "anaysis_question_completed")
 builder.add_edge("anaysis_question_completed", "data_retrieval_general")
 builder.add_edge("data_retrieval_general", "evaluate_and_refine_answer")
 builder.add_conditional_edges(
@@ -165,10 +388,12 @@ builder.add_conditional_edges(
     {
         "Accepted": "final_answer_output",
         "Rejected": "anaysis_question_completed",
+        "Speculative": "use_speculative_result",
     },
 )
+builder.add_edge("use_speculative_result", "evaluate_and_refine_answer")
 builder.add_edge("final_answer_output", END)
-memory = MemorySaver()
+memory = create_checkpointer()
 
 langgraph_entrapeer = builder.compile(checkpointer=memory)
 
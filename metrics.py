@@ -0,0 +1,128 @@
+import bisect
+import threading
+from typing import Dict, List, Tuple
+
+# Upper bounds of the histogram buckets; wide enough for both sub-second
+# cache hits and multi-second LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (0, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts: List[int] = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    """
+    Process local counters, gauges and histograms. Names follow Prometheus
+    conventions and optional keyword labels split a metric into series, e.g.
+    metrics.increment("conversations_evicted_total", reason="ttl").
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Tuple], float] = {}
+        self.gauges: Dict[Tuple[str, Tuple], float] = {}
+        self.histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def increment(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        """Add a sample to a histogram; `buckets` only applies to the first sample of a series."""
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                self.histograms[key] = histogram = Histogram(buckets)
+            histogram.observe(value)
+
+    def histogram(self, name, **labels):
+        """(count, sum) of a histogram series."""
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            return (histogram.count, histogram.sum) if histogram else (0, 0.0)
+
+    def get(self, name, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            return self.counters.get(key, self.gauges.get(key, 0))
+
+    def total(self, name):
+        """Sum of a counter over all of its label combinations."""
+        with self.lock:
+            return sum(value for (metric, _), value in self.counters.items() if metric == name)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self.lock:
+            series = list(self.counters.items()) + list(self.gauges.items())
+        return {format_series(name, labels): value for (name, labels), value in series}
+
+    def prometheus_text(self) -> str:
+        """All series in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for kind, series in (("counter", self.counters), ("gauge", self.gauges)):
+                for name, group in group_by_name(series):
+                    lines.append(f"# TYPE {name} {kind}")
+                    lines.extend(f"{format_series(name, labels)} {value}" for labels, value in group)
+            for name, group in group_by_name(self.histograms):
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in group:
+                    for bound, count in histogram.cumulative():
+                        lines.append(f"{format_series(name + '_bucket', labels + (('le', bound),))} {count}")
+                    lines.append(f"{format_series(name + '_bucket', labels + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{format_series(name + '_sum', labels)} {histogram.sum}")
+                    lines.append(f"{format_series(name + '_count', labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+
+def group_by_name(series):
+    groups: Dict[str, List] = {}
+    for (name, labels), value in sorted(series.items(), key=lambda item: item[0]):
+        groups.setdefault(name, []).append((labels, value))
+    return groups.items()
+
+
+def format_series(name, labels):
+    if not labels:
+        return name
+    label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+    return f"{name}{{{label_text}}}"
+
+
+metrics = MetricsRegistry()
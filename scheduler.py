@@ -0,0 +1,296 @@
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional, Tuple, Type
+
+import httpx
+
+import config
+from metrics import metrics
+from tracing import record
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+# Work started by a user waiting on the answer goes first; batch jobs wrap
+# their runs in `with priority(BATCH)`
+current_priority = contextvars.ContextVar("outbound_priority", default=INTERACTIVE)
+
+# How often a request held back for higher priority work checks again
+PRIORITY_POLL_SECONDS = 0.05
+
+
+@contextmanager
+def priority(name: str):
+    previous = current_priority.get()
+    current_priority.set(name)
+    try:
+        yield
+    finally:
+        current_priority.set(previous)
+
+
+class TokenBucket:
+    """
+    Refills `per_minute` units a minute, holding at most `burst_seconds` worth
+    so a quiet period does not turn into a burst the provider rejects.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float = 10):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float, reserve: float = 0.0) -> float:
+        """Seconds until `amount` can be taken while leaving `reserve` (share of the capacity) in the bucket."""
+        self.refill(now)
+        # A request larger than the bucket (or its share outside the reserve)
+        # waits for a full bucket instead of forever
+        needed = min(self.capacity, min(amount, self.capacity) + reserve * self.capacity)
+        return max(0.0, (needed - self.level) / self.rate)
+
+    def take(self, amount: float):
+        self.level -= amount
+
+
+class ProviderLimiter:
+    """
+    Outbound request budget of one provider: a request bucket, an optional
+    token bucket, a shared pause after 429s, and priority between
+    interactive and batch work. Batch requests wait while interactive ones
+    are queued and never take the last `interactive_reserve` of a bucket.
+    Safe to share between threads and event loops; limits are per process.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: float = 0,
+                 interactive_reserve: Optional[float] = None, max_retries: Optional[int] = None,
+                 backoff_base: Optional[float] = None, backoff_max: Optional[float] = None, seed: Optional[int] = None):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.interactive_reserve = config.SCHEDULER_INTERACTIVE_RESERVE if interactive_reserve is None else interactive_reserve
+        self.max_retries = config.SCHEDULER_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = config.SCHEDULER_BACKOFF_BASE_SECONDS if backoff_base is None else backoff_base
+        self.backoff_max = config.SCHEDULER_BACKOFF_MAX_SECONDS if backoff_max is None else backoff_max
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.waiting: Dict[str, int] = {INTERACTIVE: 0, BATCH: 0}
+        self.paused_until = 0.0
+
+    def _queue(self, priority: str, change: int):
+        with self.lock:
+            self.waiting[priority] = self.waiting.get(priority, 0) + change
+            depth = self.waiting[priority]
+        metrics.set_gauge("outbound_queue_depth", depth, provider=self.name, priority=priority)
+
+    def _try_acquire(self, tokens: int, priority: str) -> float:
+        """Take the budget of one request, or return how long to wait before trying again."""
+        with self.lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            if priority != INTERACTIVE and self.waiting[INTERACTIVE]:
+                return PRIORITY_POLL_SECONDS
+            reserve = 0.0 if priority == INTERACTIVE else self.interactive_reserve
+            delay = max(
+                self.requests.wait_time(1, now, reserve) if self.requests else 0.0,
+                self.tokens.wait_time(tokens, now, reserve) if self.tokens and tokens else 0.0,
+            )
+            if delay > 0:
+                return delay
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+            return 0.0
+
+    def _acquired(self, priority: str, waited: float):
+        metrics.increment("outbound_requests_total", provider=self.name, priority=priority)
+        metrics.observe("outbound_wait_seconds", waited, provider=self.name)
+        if waited:
+            record(f"{self.name}_wait_seconds", waited)
+
+    def acquire(self, tokens: int = 0):
+        priority, start = current_priority.get(), time.perf_counter()
+        delay = self._try_acquire(tokens, priority)
+        if delay:
+            self._queue(priority, 1)
+            try:
+                while delay:
+                    time.sleep(delay)
+                    delay = self._try_acquire(tokens, priority)
+            finally:
+                self._queue(priority, -1)
+        self._acquired(priority, time.perf_counter() - start)
+
+    async def aacquire(self, tokens: int = 0):
+        priority, start = current_priority.get(), time.perf_counter()
+        delay = self._try_acquire(tokens, priority)
+        if delay:
+            self._queue(priority, 1)
+            try:
+                while delay:
+                    await asyncio.sleep(delay)
+                    delay = self._try_acquire(tokens, priority)
+            finally:
+                self._queue(priority, -1)
+        self._acquired(priority, time.perf_counter() - start)
+
+    def settle(self, estimated: int, used: Optional[int]):
+        """Charge the token bucket with what a request really used instead of its estimate."""
+        if self.tokens and used is not None:
+            with self.lock:
+                self.tokens.take(used - estimated)
+
+    def backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """
+        Exponential backoff with full jitter, at least the provider's
+        Retry-After. A 429 pauses every request to the provider for that long,
+        so the queue waits it out instead of each request tripping it again.
+        """
+        delay = self.random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if response is not None:
+            delay = max(delay, retry_after(response) or 0.0)
+            metrics.increment("outbound_retries_total", provider=self.name, status=str(response.status_code))
+            if response.status_code == 429:
+                with self.lock:
+                    self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        else:
+            metrics.increment("outbound_retries_total", provider=self.name, status="connection_error")
+        record(f"{self.name}_retries")
+        return delay
+
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds asked for by the retry-after-ms or Retry-After headers (seconds or an HTTP date)."""
+    value = response.headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_json(response: httpx.Response) -> bool:
+    # Streamed (event-stream) answers are passed through without reading their usage
+    return response.status_code == 200 and response.headers.get("content-type", "").startswith("application/json")
+
+
+class ScheduledTransport(httpx.BaseTransport):
+    """
+    Sends every request through the provider's limiter and retries the
+    responses `retryable` rejects, and the `retry_errors` transport errors, with
+    backoff. `estimate(request)` sizes a request for the token bucket and
+    `usage(response)` reports what it actually used.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport, limiter: ProviderLimiter,
+                 retryable: Callable[[httpx.Response], bool],
+                 estimate: Optional[Callable[[httpx.Request], int]] = None,
+                 usage: Optional[Callable[[httpx.Response], Optional[int]]] = None,
+                 retry_errors: Tuple[Type[Exception], ...] = (httpx.TransportError,)):
+        self.transport = transport
+        self.limiter = limiter
+        self.retryable = retryable
+        self.estimate = estimate
+        self.usage = usage
+        self.retry_errors = retry_errors
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        tokens = self.estimate(request) if self.estimate else 0
+        attempt = 0
+        while True:
+            self.limiter.acquire(tokens)
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError as e:
+                # Failed and rejected attempts used no tokens
+                self.limiter.settle(tokens, 0)
+                if attempt >= self.limiter.max_retries or not isinstance(e, self.retry_errors):
+                    raise
+                time.sleep(self.limiter.backoff(attempt))
+            else:
+                if attempt >= self.limiter.max_retries or not self.retryable(response):
+                    if self.usage and is_json(response):
+                        response.read()
+                        self.limiter.settle(tokens, self.usage(response))
+                    return response
+                response.close()
+                self.limiter.settle(tokens, 0)
+                time.sleep(self.limiter.backoff(attempt, response))
+            attempt += 1
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncScheduledTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of ScheduledTransport, sharing its limiter."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, limiter: ProviderLimiter,
+                 retryable: Callable[[httpx.Response], bool],
+                 estimate: Optional[Callable[[httpx.Request], int]] = None,
+                 usage: Optional[Callable[[httpx.Response], Optional[int]]] = None,
+                 retry_errors: Tuple[Type[Exception], ...] = (httpx.TransportError,)):
+        self.transport = transport
+        self.limiter = limiter
+        self.retryable = retryable
+        self.estimate = estimate
+        self.usage = usage
+        self.retry_errors = retry_errors
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        tokens = self.estimate(request) if self.estimate else 0
+        attempt = 0
+        while True:
+            await self.limiter.aacquire(tokens)
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                self.limiter.settle(tokens, 0)
+                if attempt >= self.limiter.max_retries or not isinstance(e, self.retry_errors):
+                    raise
+                await asyncio.sleep(self.limiter.backoff(attempt))
+            else:
+                if attempt >= self.limiter.max_retries or not self.retryable(response):
+                    if self.usage and is_json(response):
+                        await response.aread()
+                        self.limiter.settle(tokens, self.usage(response))
+                    return response
+                await response.aclose()
+                self.limiter.settle(tokens, 0)
+                await asyncio.sleep(self.limiter.backoff(attempt, response))
+            attempt += 1
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+# Raised before the request reached the server, so retrying cannot repeat work
+CONNECTION_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Process wide, shared by every client of a provider
+limiters = {
+    "openai": ProviderLimiter("openai", config.OPENAI_REQUESTS_PER_MINUTE, config.OPENAI_TOKENS_PER_MINUTE),
+    "tavily": ProviderLimiter("tavily", config.TAVILY_REQUESTS_PER_MINUTE),
+}
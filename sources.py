@@ -0,0 +1,98 @@
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import config
+
+# Domain -> publisher name. Subdomains resolve through their parent domain
+# (ir.tesla.com -> tesla.com); extend with register_publishers() or a JSON
+# file at SOURCE_PUBLISHERS_PATH
+PUBLISHERS: Dict[str, str] = {
+    "apnews.com": "AP News",
+    "bbc.co.uk": "BBC",
+    "bbc.com": "BBC",
+    "bloomberg.com": "Bloomberg",
+    "businessinsider.com": "Business Insider",
+    "cnbc.com": "CNBC",
+    "cnn.com": "CNN",
+    "crunchbase.com": "Crunchbase",
+    "economist.com": "The Economist",
+    "forbes.com": "Forbes",
+    "fortune.com": "Fortune",
+    "ft.com": "Financial Times",
+    "linkedin.com": "LinkedIn",
+    "marketwatch.com": "MarketWatch",
+    "nytimes.com": "The New York Times",
+    "pitchbook.com": "PitchBook",
+    "prnewswire.com": "PR Newswire",
+    "reuters.com": "Reuters",
+    "sec.gov": "U.S. SEC",
+    "techcrunch.com": "TechCrunch",
+    "theguardian.com": "The Guardian",
+    "theverge.com": "The Verge",
+    "washingtonpost.com": "The Washington Post",
+    "wikipedia.org": "Wikipedia",
+    "wsj.com": "The Wall Street Journal",
+    "finance.yahoo.com": "Yahoo Finance",
+    "youtube.com": "YouTube",
+    "zdnet.com": "ZDNET",
+}
+
+# Public suffixes with two labels, so example.co.uk is named "Example" and not "Co"
+SECOND_LEVEL_SUFFIXES = {"co.uk", "co.jp", "co.kr", "co.in", "com.au", "com.br", "com.cn", "com.tr", "com.sg", "org.uk", "ac.uk", "gov.uk"}
+
+
+def register_publishers(publishers: Dict[str, str]) -> None:
+    PUBLISHERS.update({domain.lower().removeprefix("www."): name for domain, name in publishers.items()})
+
+
+def load_publishers(path: str) -> None:
+    """Merge a JSON object of domain -> publisher name into the table."""
+    with open(path, encoding="utf-8") as f:
+        register_publishers(json.load(f))
+
+
+def publisher_name(url: str) -> Optional[str]:
+    """
+    Publisher of a URL: the table entry of its host or closest parent domain,
+    otherwise the site's own name ("https://www.entrapeer.com/x" -> "Entrapeer").
+    """
+    host = (urlparse(url).hostname or "").lower().removeprefix("www.")
+    if not host:
+        return None
+    labels = host.split(".")
+    for start in range(len(labels) - 1):
+        name = PUBLISHERS.get(".".join(labels[start:]))
+        if name:
+            return name
+    suffix_length = 2 if ".".join(labels[-2:]) in SECOND_LEVEL_SUFFIXES else 1
+    if len(labels) <= suffix_length:
+        return host
+    return labels[-suffix_length - 1].replace("-", " ").title()
+
+
+def source_names(results: Iterable[Dict], limit: Optional[int] = None) -> List[str]:
+    """Distinct publisher names of Tavily results in ranking order, falling back to the title when a result has no URL."""
+    names: List[str] = []
+    for result in results:
+        if not isinstance(result, dict):
+            continue
+        name = publisher_name(result.get("url") or "") or (result.get("title") or "").strip()
+        if name and name not in names:
+            names.append(name)
+            if limit and len(names) == limit:
+                break
+    return names
+
+
+def search_sources(response) -> str:
+    """Source line of a Tavily response, one publisher per line like the LLM summary it replaces."""
+    results = response.get("results") if isinstance(response, dict) else None
+    if not isinstance(results, list):
+        return ""
+    return "\n".join(source_names(results, limit=config.SOURCE_ATTRIBUTION_MAX_SOURCES))
+
+
+if config.SOURCE_PUBLISHERS_PATH and os.path.exists(config.SOURCE_PUBLISHERS_PATH):
+    load_publishers(config.SOURCE_PUBLISHERS_PATH)
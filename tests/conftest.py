@@ -0,0 +1,14 @@
+import os
+import sys
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+# Importing main builds the checkpointer and conversation store, so keep them
+# in memory instead of writing data/checkpoints.sqlite into the working tree.
+# The package __init__ has loaded config already; the environment variable
+# covers subprocesses such as the benchmark run
+os.environ["CHECKPOINT_BACKEND"] = "memory"
+config.CHECKPOINT_BACKEND = "memory"
@@ -0,0 +1,68 @@
+import pytest
+import sys
+import os
+import asyncio
+import json
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch import load_completed, parse_questions, run_batch, write_batch
+
+
+def test_parse_questions():
+    """Test ids, replies and errors of a JSONL batch."""
+    questions = parse_questions(['{"id": "a", "text": "Where is Tesla?", "replies": ["Austin"]}', "", '"Who owns Apple?"'])
+    assert questions == [
+        {"id": "a", "text": "Where is Tesla?", "replies": ["Austin"]},
+        {"id": "3", "text": "Who owns Apple?", "replies": []},
+    ]
+    with pytest.raises(ValueError, match="line 2"):
+        parse_questions(['"ok"', '{"id": 1}'])
+    with pytest.raises(ValueError, match="duplicate id"):
+        parse_questions(['{"id": "a", "text": "x"}', '{"id": "a", "text": "y"}'])
+
+
+@pytest.mark.asyncio
+async def test_run_batch_deduplicates_and_limits_concurrency():
+    """Test that identical questions share one run and no more than `concurrency` run at once."""
+    calls, running, peak = [], [0], [0]
+
+    async def answer(text, replies):
+        calls.append(text)
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        if text == "fail":
+            raise RuntimeError("boom")
+        return {"status": "done", "final_answer": text.upper()}
+
+    questions = parse_questions(json.dumps(text) for text in ["tesla", " Tesla ", "apple", "nvidia", "fail"])
+    records = [record async for record in run_batch(questions, concurrency=2, answer=answer)]
+
+    assert sorted(calls) == ["apple", "fail", "nvidia", "tesla"]
+    assert peak[0] == 2
+    by_id = {record["id"]: record for record in records}
+    assert by_id["2"]["final_answer"] == "TESLA" and by_id["2"]["duplicate_of"] == "1"
+    assert by_id["5"]["status"] == "error" and "boom" in by_id["5"]["error"]
+
+
+@pytest.mark.asyncio
+async def test_write_batch_resumes(tmp_path):
+    """Test that a rerun skips answered questions and retries failed and cut off ones."""
+    output = tmp_path / "answers.jsonl"
+    output.write_text('{"id": "1", "status": "done"}\n{"id": "2", "status": "error"}\n{"id": "3", "sta')
+    questions = parse_questions(json.dumps(text) for text in ["tesla", "apple", "nvidia"])
+    answered = []
+
+    async def answer(text, replies):
+        answered.append(text)
+        return {"status": "done", "final_answer": text}
+
+    counts = await write_batch(questions, str(output), answer=answer)
+
+    assert sorted(answered) == ["apple", "nvidia"]
+    assert counts == {"skipped": 1, "done": 2}
+    assert load_completed(str(output)) == {"1", "2", "3"}
+    assert len(output.read_text().splitlines()) == 3
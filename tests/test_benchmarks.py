@@ -0,0 +1,123 @@
+import pytest
+import sys
+import os
+import json
+import subprocess
+import httpx
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_openai import ChatOpenAI
+from tavily.errors import UsageLimitExceededError
+
+from benchmarks.load import LoadStats
+from benchmarks.replay import Latency, Recording, load_fixtures
+from benchmarks.run import percentile, regressions
+from benchmarks.stub_server import ErrorInjector, create_app
+from clients import PooledTavilyClient
+from evaluation import AnswerEvaluator
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_percentile_interpolates():
+    """Test percentiles between closest ranks."""
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    assert percentile([5], 99) == 5
+    assert percentile([], 50) == 0.0
+
+
+def test_recording_first_match_wins():
+    """Test that recorded entries are matched in order and unknown requests fail."""
+    recording = Recording(load_fixtures()["llm"])
+    assert recording.find("List all the companies named Apple, if there is one")["response"].startswith("1. Apple Inc.")
+    with pytest.raises(KeyError):
+        recording.find("a prompt nobody recorded")
+
+
+def test_latency_is_scaled_and_repeatable():
+    """Test that latency draws follow the scale and the seed."""
+    assert Latency(scale=0).sample(2.0) == 0.0
+    first, second = Latency(scale=0.5, jitter=0.2, seed=3), Latency(scale=0.5, jitter=0.2, seed=3)
+    draws = [first.sample(2.0) for _ in range(5)]
+    assert draws == [second.sample(2.0) for _ in range(5)]
+    assert all(0.8 <= draw <= 1.2 for draw in draws)
+
+
+def test_regressions_against_baseline():
+    """Test that slower percentiles and lower throughput are reported."""
+    level = {"concurrency": 4, "throughput_per_second": 10.0,
+             "conversation_latency_seconds": {"p50": 1.0, "p95": 2.0, "p99": 3.0}}
+    slower = {**level, "throughput_per_second": 7.0,
+              "conversation_latency_seconds": {"p50": 1.1, "p95": 2.6, "p99": 3.0}}
+    found = regressions({"levels": [slower]}, {"levels": [level]}, 0.2)
+    assert len(found) == 2
+    assert regressions({"levels": [level]}, {"levels": [level]}, 0.2) == []
+
+
+def test_benchmark_runs_offline(tmp_path):
+    """Test a small benchmark of every fixture scenario through the graph without network access."""
+    output = tmp_path / "results.json"
+    company_index = os.path.join(PROJECT_ROOT, "data", "company_index.jsonl")
+    index_before = open(company_index, "rb").read() if os.path.exists(company_index) else None
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.run", "--blank-spacy", "--latency-scale", "0", "--conversations", "5",
+         "--concurrency", "2", "--memory-conversations", "1", "--output", str(output)],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=300,
+        env={**os.environ, "OPENAI_API_KEY": "", "TAVILY_API_KEY": ""},
+    )
+    assert completed.returncode == 0, completed.stdout + completed.stderr
+    index_after = open(company_index, "rb").read() if os.path.exists(company_index) else None
+    assert index_after == index_before
+
+    results = json.loads(output.read_text())
+    level = results["levels"][0]
+    assert level["errors"] == 0
+    assert level["conversation_latency_seconds"]["count"] == 5
+    assert "evaluate_and_refine_answer" in level["nodes"]
+    assert results["memory"]["retained_bytes_per_conversation"] > 0
+
+
+def stub_app(error_rate=0.0, rate_limit_rate=0.0):
+    return create_app(load_fixtures(), Latency(scale=0), Latency(scale=0), ErrorInjector(error_rate, rate_limit_rate))
+
+
+@pytest.mark.asyncio
+async def test_stub_server_speaks_openai_and_tavily():
+    """Test that the OpenAI and Tavily clients of the app work against the stub server."""
+    transport = httpx.ASGITransport(app=stub_app())
+    llm = ChatOpenAI(model="gpt-4o", api_key="stub", base_url="http://stub/v1", max_retries=0,
+                     http_async_client=httpx.AsyncClient(transport=transport))
+    response = await llm.ainvoke("List all the companies named Tesla, if there is one and only one company return company name.")
+    assert response.content == "Tesla"
+    assert response.usage_metadata["total_tokens"] > 0
+    evaluation = await AnswerEvaluator(llm).aevaluate_answer("Where is Tesla headquarters?", "1 Tesla Road, Austin.")
+    assert (evaluation["relevance_score"], evaluation["refinement_needed"]) == (9, False)
+
+    tavily = PooledTavilyClient(api_key="stub", base_url="http://stub")
+    tavily.http_async_client = httpx.AsyncClient(base_url="http://stub", transport=transport)
+    assert "Austin" in (await tavily.asearch("Tesla headquarters location"))["answer"]
+
+
+@pytest.mark.asyncio
+async def test_stub_server_injects_rate_limits():
+    """Test that injected 429s reach the client as Tavily usage limit errors."""
+    tavily = PooledTavilyClient(api_key="stub", base_url="http://stub")
+    tavily.http_async_client = httpx.AsyncClient(base_url="http://stub", transport=httpx.ASGITransport(app=stub_app(rate_limit_rate=1.0)))
+    with pytest.raises(UsageLimitExceededError):
+        await tavily.asearch("Tesla headquarters location")
+
+
+def test_load_stats_report():
+    """Test per endpoint error rates and throughput of a load run."""
+    stats = LoadStats()
+    stats.request("start_conversation", 0.5, "200")
+    stats.request("start_conversation", 1.5, "500")
+    stats.conversations.update(completed=1, failed=1)
+    stats.conversation_latencies.append(0.5)
+
+    report = stats.report(wall_seconds=2.0)
+    assert report["endpoints"]["start_conversation"]["error_rate"] == 0.5
+    assert report["endpoints"]["start_conversation"]["requests_per_second"] == 1.0
+    assert report["conversation_error_rate"] == 0.5
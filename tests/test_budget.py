@@ -0,0 +1,74 @@
+import pytest
+import sys
+import os
+import time
+from unittest.mock import patch
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from budget import budget_exhausted, token_counter, track_tokens, with_token_usage
+
+
+def llm_result(total_tokens):
+    message = AIMessage(content="ok", usage_metadata={"input_tokens": total_tokens - 1, "output_tokens": 1, "total_tokens": total_tokens})
+    return LLMResult(generations=[[ChatGeneration(message=message)]])
+
+
+def test_track_tokens_counts_llm_calls():
+    """Test that finished LLM calls inside the block are counted."""
+    with track_tokens() as usage:
+        token_counter.on_llm_end(llm_result(10))
+        token_counter.on_llm_end(llm_result(5))
+    token_counter.on_llm_end(llm_result(100))
+    assert usage.total == 15
+
+
+def test_with_token_usage_adds_tokens_to_update():
+    """Test that a wrapped node reports its tokens next to its own update."""
+    def node(state):
+        token_counter.on_llm_end(llm_result(12))
+        return {"intent": "Location"}
+
+    assert with_token_usage(node)({}) == {"intent": "Location", "tokens_used": 12}
+
+
+@pytest.mark.asyncio
+async def test_with_token_usage_async_node():
+    """Test the wrapper on an async node that returns nothing."""
+    async def node(state):
+        token_counter.on_llm_end(llm_result(7))
+
+    assert await with_token_usage(node)({}) == {"tokens_used": 7}
+
+
+def test_budget_exhausted_reasons():
+    """Test each refinement budget limit."""
+    with patch("config.MAX_REFINEMENT_ITERATIONS", 3), \
+         patch("config.REFINEMENT_DEADLINE_SECONDS", 60), \
+         patch("config.REFINEMENT_TOKEN_BUDGET", 1000):
+        now = time.time()
+        state = {"refinement_iterations": 1, "refinement_started_at": now, "tokens_used": 100}
+        assert budget_exhausted(state, now) is None
+        assert budget_exhausted({**state, "refinement_iterations": 3}, now) == "iterations"
+        assert budget_exhausted(state, now + 61) == "deadline"
+        assert budget_exhausted({**state, "tokens_used": 1000}, now) == "tokens"
+
+
+def test_budget_limit_zero_disables_it():
+    """Test that a limit of 0 never stops the loop."""
+    with patch("config.MAX_REFINEMENT_ITERATIONS", 0), \
+         patch("config.REFINEMENT_DEADLINE_SECONDS", 0), \
+         patch("config.REFINEMENT_TOKEN_BUDGET", 0):
+        assert budget_exhausted({"refinement_iterations": 50, "refinement_started_at": 1.0, "tokens_used": 10 ** 6}) is None
+
+
+def test_token_budget_counts_from_refinement_start():
+    """Test that tokens spent before the first search input are not charged to the refinement budget."""
+    with patch("config.REFINEMENT_TOKEN_BUDGET", 1000):
+        state = {"refinement_iterations": 1, "refinement_tokens_start": 800, "tokens_used": 1500}
+        assert budget_exhausted(state) is None
+        assert budget_exhausted({**state, "tokens_used": 1800}) == "tokens"
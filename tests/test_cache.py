@@ -0,0 +1,196 @@
+import pytest
+import sys
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, AsyncMock
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+
+from cache import TTLCache, ResponseCache, LLMResponseCache, SingleFlight, MISSING
+from metrics import metrics
+
+
+@pytest.fixture
+def search_cache():
+    metrics.reset()
+    return ResponseCache("test", maxsize=2, ttl=60)
+
+
+def test_key_normalizes_query():
+    """Test that case and whitespace differences map to the same key."""
+    assert ResponseCache.make_key("  Where is   Entrapeer? ", max_results=5) == \
+        ResponseCache.make_key("where is entrapeer?", max_results=5)
+    assert ResponseCache.make_key("entrapeer", max_results=5) != ResponseCache.make_key("entrapeer", max_results=3)
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    """Test that the oldest untouched entry is dropped past maxsize."""
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_ttl_cache_expires_entries():
+    """Test that entries past their TTL are not returned."""
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.entries["a"] = (time.time() - 1, 1)
+    assert cache.get("a") is MISSING
+
+
+def test_cached_calls_fetch_once(search_cache):
+    """Test that a repeated search is served from the cache."""
+    fetch = Mock(return_value={"answer": "Istanbul"})
+    params = dict(query="Where is Entrapeer?", max_results=5)
+
+    assert search_cache.cached(fetch, params) == {"answer": "Istanbul"}
+    assert search_cache.cached(fetch, dict(params, query="where is entrapeer?")) == {"answer": "Istanbul"}
+    fetch.assert_called_once_with(**params)
+    stats = search_cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_cached_does_not_store_errors(search_cache):
+    """Test that a failing search is retried on the next call."""
+    fetch = Mock(side_effect=[Exception("API Error"), {"answer": "ok"}])
+    with pytest.raises(Exception):
+        search_cache.cached(fetch, dict(query="q"))
+    assert search_cache.cached(fetch, dict(query="q")) == {"answer": "ok"}
+    assert fetch.call_count == 2
+
+
+def test_disk_tier_survives_new_instance(tmp_path):
+    """Test that a second cache on the same file reads the first one's entries."""
+    path = str(tmp_path / "cache.sqlite")
+    fetch = Mock(return_value={"answer": "Istanbul"})
+    ResponseCache("disk", maxsize=2, ttl=60, disk_path=path).cached(fetch, dict(query="q"))
+
+    assert ResponseCache("disk", maxsize=2, ttl=60, disk_path=path).cached(fetch, dict(query="q")) == {"answer": "Istanbul"}
+    fetch.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_acached_calls_fetch_once(search_cache):
+    """Test the async cache path."""
+    fetch = AsyncMock(return_value={"answer": "Istanbul"})
+    await search_cache.acached(fetch, dict(query="q"))
+    assert await search_cache.acached(fetch, dict(query="q")) == {"answer": "Istanbul"}
+    fetch.assert_awaited_once()
+
+
+def test_llm_cache_skips_repeated_prompt():
+    """Test that a repeated prompt, up to whitespace, is answered from the LLM cache."""
+    llm_cache = LLMResponseCache(maxsize=2, ttl=60)
+    llm = FakeListChatModel(responses=["Entrapeer", "Other"], cache=llm_cache)
+
+    assert llm.invoke("What is the company name?\n   Text: Entrapeer").content == "Entrapeer"
+    assert llm.invoke("What is the company name? Text:  Entrapeer").content == "Entrapeer"
+    assert llm.invoke("Another prompt").content == "Other"
+
+
+def test_llm_cache_keys_on_model_settings():
+    """Test that the same prompt for a different model is a separate entry."""
+    assert LLMResponseCache.make_key("prompt", "gpt-4") != LLMResponseCache.make_key("prompt", "gpt-4o")
+
+
+def test_llm_cache_disk_tier(tmp_path):
+    """Test that cached generations are restored from the SQLite tier."""
+    path = str(tmp_path / "llm.sqlite")
+    generations = [ChatGeneration(message=AIMessage(content="Entrapeer"))]
+    LLMResponseCache(maxsize=2, ttl=60, disk_path=path).update("prompt", "gpt-4", generations)
+
+    restored = LLMResponseCache(maxsize=2, ttl=60, disk_path=path).lookup("prompt", "gpt-4")
+    assert restored[0].message.content == "Entrapeer"
+
+
+def test_llm_cache_hit_reports_no_token_usage():
+    """Test that cached generations do not carry the original call's token usage."""
+    llm_cache = LLMResponseCache(maxsize=2, ttl=60)
+    usage = {"input_tokens": 10, "output_tokens": 5, "total_tokens": 15}
+    llm_cache.update("prompt", "gpt-4", [ChatGeneration(message=AIMessage(content="Entrapeer", usage_metadata=usage))])
+
+    restored = llm_cache.lookup("prompt", "gpt-4")
+    assert restored[0].message.content == "Entrapeer"
+    assert restored[0].message.usage_metadata is None
+
+
+def test_single_flight_shares_concurrent_calls():
+    """Test that threads calling with the same key while a call runs get its result without calling again."""
+    metrics.reset()
+    flight = SingleFlight("test", enabled=True)
+    release = threading.Event()
+    calls = []
+
+    def fetch(query):
+        calls.append(query)
+        release.wait(5)
+        return {"answer": query}
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(flight.do, "q", fetch, "tesla") for _ in range(4)]
+        while metrics.get("singleflight_calls_total", call="test", role="follower") < 3:
+            time.sleep(0.01)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert calls == ["tesla"]
+    assert all(result is results[0] for result in results)
+    # Finished calls are not kept
+    assert flight.do("q", lambda: "again") == "again"
+
+
+@pytest.mark.asyncio
+async def test_single_flight_async_shares_errors():
+    """Test that concurrent async callers share one call and its exception."""
+    flight = SingleFlight("test", enabled=True)
+    fetch = AsyncMock(side_effect=RuntimeError("rate limited"))
+
+    async def slow_fetch():
+        await asyncio.sleep(0.01)
+        return await fetch()
+
+    results = await asyncio.gather(*(flight.ado("q", slow_fetch) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    fetch.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_single_flight_survives_a_cancelled_caller():
+    """Test that cancelling the caller that started a call does not cancel it for the others."""
+    flight = SingleFlight("test", enabled=True)
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "Austin"
+
+    leader = asyncio.create_task(flight.ado("q", fetch))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flight.ado("q", fetch))
+    await asyncio.sleep(0)
+    leader.cancel()
+    assert await follower == "Austin"
+
+
+@pytest.mark.asyncio
+async def test_acached_coalesces_concurrent_misses(search_cache):
+    """Test that concurrent misses of one query fetch once."""
+    async def search(query):
+        await asyncio.sleep(0.01)
+        return {"answer": "Istanbul"}
+
+    fetch = AsyncMock(side_effect=search)
+    results = await asyncio.gather(*(search_cache.acached(fetch, dict(query="Where is Entrapeer?")) for _ in range(5)))
+    assert results == [{"answer": "Istanbul"}] * 5
+    fetch.assert_awaited_once()
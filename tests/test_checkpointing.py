@@ -0,0 +1,158 @@
+import pytest
+import sys
+import os
+import sqlite3
+import time
+from typing_extensions import TypedDict
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import Command, interrupt
+from checkpointing import (
+    SqliteCheckpointSaver,
+    SqliteConversationStore,
+    InMemoryConversationStore,
+    create_checkpointer,
+)
+
+
+class ToyState(TypedDict):
+    question: str
+    detail: str
+    answer: str
+
+
+def ask_detail(state):
+    detail = interrupt("Which company do you mean?")
+    return {"detail": detail}
+
+
+def write_answer(state):
+    return {"answer": f"{state['question']} ({state['detail']})"}
+
+
+def build_graph(checkpointer):
+    builder = StateGraph(ToyState)
+    builder.add_node("ask_detail", ask_detail)
+    builder.add_node("write_answer", write_answer)
+    builder.add_edge(START, "ask_detail")
+    builder.add_edge("ask_detail", "write_answer")
+    builder.add_edge("write_answer", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "checkpoints.sqlite")
+
+
+def test_interrupted_thread_survives_new_saver(db_path):
+    """Test that a conversation paused on interrupt can be resumed by another process."""
+    thread = {"configurable": {"thread_id": "conversation-1"}}
+    first_worker = build_graph(SqliteCheckpointSaver(db_path))
+    events = list(first_worker.stream({"question": "Where is Apple?", "detail": "", "answer": ""}, thread, stream_mode="updates"))
+    assert "__interrupt__" in events[-1]
+
+    second_worker = build_graph(SqliteCheckpointSaver(db_path))
+    assert second_worker.get_state(thread).next == ("ask_detail",)
+    second_worker.invoke(Command(resume="the tech company"), thread)
+    assert second_worker.get_state(thread).values["answer"] == "Where is Apple? (the tech company)"
+
+
+@pytest.mark.asyncio
+async def test_async_resume(db_path):
+    """Test the async checkpointer path used by the API."""
+    graph = build_graph(SqliteCheckpointSaver(db_path))
+    thread = {"configurable": {"thread_id": "conversation-2"}}
+    async for _ in graph.astream({"question": "Q", "detail": "", "answer": ""}, thread, stream_mode="updates"):
+        pass
+    await graph.ainvoke(Command(resume="D"), thread)
+    state = await graph.aget_state(thread)
+    assert state.values["answer"] == "Q (D)"
+
+
+def test_delete_thread(db_path):
+    """Test removing every checkpoint of a thread."""
+    saver = SqliteCheckpointSaver(db_path)
+    graph = build_graph(saver)
+    thread = {"configurable": {"thread_id": "conversation-3"}}
+    list(graph.stream({"question": "Q", "detail": "", "answer": ""}, thread))
+    assert saver.get_tuple(thread) is not None
+
+    saver.delete_thread("conversation-3")
+    assert saver.get_tuple(thread) is None
+    assert list(saver.list(thread)) == []
+
+
+@pytest.mark.parametrize("store_factory", [InMemoryConversationStore, "sqlite"])
+def test_conversation_store_roundtrip(store_factory, db_path):
+    """Test the conversation metadata stores share one interface."""
+    store = SqliteConversationStore(db_path) if store_factory == "sqlite" else store_factory()
+    record = store.new_record()
+    store.put("abc", record)
+    assert "abc" in store
+    assert store.get("abc")["waiting_for_input"] is False
+
+    store.put("abc", dict(record, waiting_for_input=True))
+    assert store.get("abc")["waiting_for_input"] is True
+
+    store.delete("abc")
+    assert store.get("abc") is None
+
+
+@pytest.mark.parametrize("store_factory", [InMemoryConversationStore, "sqlite"])
+def test_conversation_store_leases(store_factory, db_path):
+    """Test that leased conversations are neither listed for eviction nor deleted by delete_unleased."""
+    store = SqliteConversationStore(db_path) if store_factory == "sqlite" else store_factory()
+    store.put("leased", store.new_record(leased_until=time.time() + 60))
+    store.put("idle", store.new_record())
+    cutoff = time.time() + 1
+
+    assert store.idle_since(cutoff) == ["idle"]
+    assert store.least_recently_used(10) == ["idle"]
+    assert store.delete_unleased("leased") is False
+
+    assert store.lease("leased", 0.0) is True
+    assert store.delete_unleased("leased") is True
+    assert store.lease("leased", time.time() + 60) is False
+
+
+@pytest.mark.parametrize("store_factory", [InMemoryConversationStore, "sqlite"])
+def test_conversation_store_acquire_once(store_factory, db_path):
+    """Test that only one of two workers resuming a waiting conversation acquires it."""
+    if store_factory == "sqlite":
+        store, other_worker = SqliteConversationStore(db_path), SqliteConversationStore(db_path)
+    else:
+        store = other_worker = store_factory()
+    store.put("waiting", store.new_record(waiting_for_input=True))
+    store.put("running", store.new_record())
+    until = time.time() + 60
+
+    assert store.acquire("waiting", until) is True
+    assert other_worker.acquire("waiting", until) is False
+    assert store.get("waiting")["waiting_for_input"] is False
+    assert store.get("waiting")["leased_until"] == until
+    assert store.acquire("running", until) is False
+    assert store.acquire("missing", until) is False
+
+
+def test_sqlite_store_adds_lease_column(db_path):
+    """Test that a conversations table created before leases is migrated."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE conversations (conversation_id TEXT PRIMARY KEY, waiting_for_input INTEGER NOT NULL DEFAULT 0, "
+                 "created_at REAL NOT NULL, updated_at REAL NOT NULL)")
+    conn.execute("INSERT INTO conversations VALUES ('old', 1, 0, 0)")
+    conn.commit()
+    conn.close()
+
+    store = SqliteConversationStore(db_path)
+    assert store.get("old")["leased_until"] == 0
+    assert store.idle_since(time.time()) == ["old"]
+
+
+def test_create_checkpointer_unknown_backend():
+    """Test that an unknown backend name is rejected."""
+    with pytest.raises(ValueError):
+        create_checkpointer("redis")
@@ -0,0 +1,100 @@
+import pytest
+import sys
+import os
+import json
+import httpx
+import requests
+from unittest.mock import Mock
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tavily.errors import UsageLimitExceededError
+
+from clients import ClientRegistry, PooledTavilyClient
+
+
+def make_tavily_client(handler):
+    client = PooledTavilyClient(api_key="test-key", base_url="https://tavily.test")
+    transport = httpx.MockTransport(handler)
+    client.http_client = httpx.Client(base_url="https://tavily.test", transport=transport)
+    client.http_async_client = httpx.AsyncClient(base_url="https://tavily.test", transport=transport)
+    return client
+
+
+def test_chat_model_is_reused():
+    """Test that the registry builds one model per name and shares its HTTP pool."""
+    registry = ClientRegistry()
+    gpt4 = registry.chat_model("gpt-4")
+    assert registry.chat_model("gpt-4") is gpt4
+    gpt4o = registry.chat_model("gpt-4o")
+    assert gpt4o is not gpt4
+    assert gpt4o.http_client is gpt4.http_client
+
+
+def test_tavily_search_posts_request_body():
+    """Test that the pooled client sends the same body as tavily.TavilyClient."""
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, json={"answer": "Istanbul"})
+
+    client = make_tavily_client(handler)
+    assert client.search("Where is Entrapeer?", search_depth="advanced", max_results=5) == {"answer": "Istanbul"}
+    assert requests[0]["query"] == "Where is Entrapeer?"
+    assert requests[0]["search_depth"] == "advanced"
+    assert requests[0]["include_answer"] is False
+
+
+def test_tavily_rate_limit_error():
+    """Test that HTTP 429 maps to the tavily usage limit error."""
+    client = make_tavily_client(lambda request: httpx.Response(429, json={"detail": {"error": "slow down"}}))
+    with pytest.raises(UsageLimitExceededError):
+        client.search("q")
+
+
+def test_tavily_other_errors_raise_sdk_exceptions():
+    """Test that other failed statuses and transport errors raise the requests exceptions tavily-python raises."""
+    client = make_tavily_client(lambda request: httpx.Response(500, text="upstream down"))
+    with pytest.raises(requests.HTTPError) as error:
+        client.search("q")
+    assert error.value.response.status_code == 500
+    assert "500 Server Error" in str(error.value)
+
+    def timeout(request):
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    with pytest.raises(requests.Timeout):
+        make_tavily_client(timeout).search("q")
+
+
+@pytest.mark.asyncio
+async def test_tavily_asearch_connection_error():
+    """Test that a failed connection on the async path raises requests.ConnectionError."""
+    def refuse(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    with pytest.raises(requests.ConnectionError):
+        await make_tavily_client(refuse).asearch("q")
+
+
+@pytest.mark.asyncio
+async def test_tavily_asearch():
+    """Test the async search path."""
+    client = make_tavily_client(lambda request: httpx.Response(200, json={"answer": "Istanbul"}))
+    assert await client.asearch("q") == {"answer": "Istanbul"}
+
+
+def test_override_serves_stand_in_clients():
+    """Test that overridden registries build models with the factory until reset."""
+    registry = ClientRegistry()
+    stand_in_tavily = Mock()
+    registry.override(lambda model, cache=None, callbacks=None: ("fake", model, callbacks), stand_in_tavily)
+    model = registry.chat_model("gpt-4")
+    assert model[:2] == ("fake", "gpt-4")
+    assert registry.chat_model("gpt-4") is model
+    assert registry.tavily() is stand_in_tavily
+
+    registry.reset()
+    assert registry.chat_model_factory is None
@@ -0,0 +1,84 @@
+import pytest
+import sys
+import os
+import json
+import threading
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from company_index import CompanyIndex, normalize_company_name
+
+
+@pytest.fixture
+def dump_csv(tmp_path):
+    path = tmp_path / "companies.csv"
+    path.write_text(
+        "name,canonical_name,industry,location\n"
+        "Apple,Apple Inc.,Technology,Cupertino\n"
+        "Apple,Apple Records,Music,London\n"
+        "Entrapeer,Entrapeer,Software,San Francisco\n"
+    )
+    return str(path)
+
+
+def test_normalize_company_name():
+    """Test that case, punctuation and legal suffixes are ignored."""
+    assert normalize_company_name("Apple Inc.") == "apple"
+    assert normalize_company_name("  ENTRAPEER,  LLC ") == "entrapeer"
+    assert normalize_company_name("AT&T") == "at&t"
+
+
+def test_lookup_after_csv_import(dump_csv):
+    """Test exact and fuzzy lookups of imported companies."""
+    index = CompanyIndex()
+    assert index.load_csv(dump_csv) == 3
+
+    assert [c["canonical_name"] for c in index.lookup("apple inc")] == ["Apple Inc.", "Apple Records"]
+    assert index.lookup("Entrapeeer")[0]["location"] == "San Francisco"
+    assert index.lookup("Microsoft") is None
+
+
+def test_as_company_list_matches_llm_shape(dump_csv):
+    """Test that index hits are returned like the parsed LLM listing."""
+    index = CompanyIndex()
+    index.load_csv(dump_csv)
+    assert CompanyIndex.as_company_list(index.lookup("Apple")) == ["Apple Inc., Technology", "Apple Records, Music"]
+    assert CompanyIndex.as_company_list(index.lookup("Entrapeer")) == ["Entrapeer"]
+
+
+def test_learned_companies_are_persisted(tmp_path):
+    """Test that learned listings are appended to the JSONL file and reloaded."""
+    path = str(tmp_path / "index.jsonl")
+    CompanyIndex(path).learn("Apple", ["Apple, Technology", "Apple, Records"])
+    CompanyIndex(path).learn("Apple", ["Apple, Technology"])
+
+    with open(path) as f:
+        assert len([json.loads(line) for line in f]) == 2
+    assert len(CompanyIndex(path).lookup("Apple")) == 2
+
+
+def test_lookup_while_learning():
+    """Test that fuzzy lookups are safe while other threads learn new companies."""
+    index = CompanyIndex()
+    errors = []
+
+    def learn():
+        for i in range(300):
+            index.learn(f"Acme {i}", [f"Acme {i} Corp, Industry {i}"])
+
+    def lookup():
+        try:
+            for i in range(300):
+                companies = index.lookup(f"Acme {i}x")
+                assert companies is None or isinstance(companies, list)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=learn)] + [threading.Thread(target=lookup) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert index.lookup("Acme 299") == [{"canonical_name": "Acme 299 Corp", "industry": "Industry 299", "location": ""}]
@@ -1,21 +1,25 @@
 import pytest
 import sys
 import os
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import Mock, AsyncMock, patch, MagicMock
 
 # Add the project root to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from evaluation import AnswerEvaluator, evaluate_and_refine
+import config
+from evaluation import AnswerEvaluator, Evaluation, aevaluate_and_refine, answer_evaluator, evaluate_and_refine, heuristic_evaluator
 
 @pytest.fixture
 def mock_llm():
-    """Create a mock LLM for testing."""
-    with patch('langchain_openai.ChatOpenAI') as mock_llm:
-        mock_llm_instance = Mock()
-        mock_llm.return_value = mock_llm_instance
+    """Create a mock LLM and hand it out as the client registry's chat model."""
+    mock_llm_instance = Mock()
+    with patch("evaluation.clients.chat_model", return_value=mock_llm_instance):
         yield mock_llm_instance
 
+def structured_output(**fields):
+    """Output of the evaluator's structured model: the parsed Evaluation and the raw tool call message."""
+    return {"raw": Mock(content=""), "parsed": Evaluation(**fields), "parsing_error": None}
+
 @pytest.fixture
 def evaluator(mock_llm):
     """Create an AnswerEvaluator instance for testing."""
@@ -27,13 +31,8 @@ def test_evaluate_answer_good_response(evaluator, mock_llm):
     query = "What is Entrapeer's business model?"
     answer = "Entrapeer is a technology company focused on AI solutions."
     
-    mock_response = """Relevance Score: 8
-Completeness Score: 7
-Missing Information:
-Refinement Needed: No
-Refined Query: ''"""
-    
-    mock_llm.invoke.return_value = Mock(content=mock_response)
+    mock_llm.with_structured_output.return_value.invoke.return_value = structured_output(
+        relevance_score=8, completeness_score=7, missing_information=[], refinement_needed=False, refined_query="")
     
     print(f"Input query: {query}")
     print(f"Input answer: {answer}")
@@ -53,13 +52,10 @@ def test_evaluate_answer_needs_refinement(evaluator, mock_llm):
     query = "What is Entrapeer's business model?"
     answer = "Entrapeer is a company."
     
-    mock_response = """Relevance Score: 4
-Completeness Score: 3
-Missing Information: business model details, revenue streams, target market
-Refinement Needed: Yes
-Refined Query: What are Entrapeer's business model, revenue streams, and target market?"""
-    
-    mock_llm.invoke.return_value = Mock(content=mock_response)
+    mock_llm.with_structured_output.return_value.invoke.return_value = structured_output(
+        relevance_score=4, completeness_score=3,
+        missing_information=["business model details", "revenue streams", "target market"],
+        refinement_needed=True, refined_query="What are Entrapeer's business model, revenue streams, and target market?")
     
     print(f"Input query: {query}")
     print(f"Input answer: {answer}")
@@ -122,13 +118,9 @@ def test_evaluate_and_refine(mock_llm):
     query = "What is Entrapeer's business model?"
     answer = "Entrapeer is a technology company."
     
-    mock_response = """Relevance Score: 6
-Completeness Score: 5
-Missing Information: business model details
-Refinement Needed: Yes
-Refined Query: What are Entrapeer's business model and revenue streams?"""
-    
-    mock_llm.invoke.return_value = Mock(content=mock_response)
+    mock_llm.with_structured_output.return_value.invoke.return_value = structured_output(
+        relevance_score=6, completeness_score=4, missing_information=["business model details"],
+        refinement_needed=True, refined_query="What are Entrapeer's business model and revenue streams?")
     
     print(f"Input query: {query}")
     print(f"Input answer: {answer}")
@@ -139,7 +131,124 @@ Refined Query: What are Entrapeer's business model and revenue streams?"""
     print(f"Evaluation result: {evaluation_result}")
     
     assert needs_refinement is True
-    assert refined_query is not None
+    assert refined_query == "What are Entrapeer's business model and revenue streams?"
     assert evaluation_result['relevance_score'] <= 6
     assert evaluation_result['completeness_score'] <= 5
-    print("✓ Test passed successfully") 
\ No newline at end of file
+    print("✓ Test passed successfully")
+
+@pytest.mark.asyncio
+async def test_aevaluate_answer(evaluator, mock_llm):
+    """Test the async evaluate_answer counterpart."""
+    mock_llm.with_structured_output.return_value.ainvoke = AsyncMock(return_value=structured_output(
+        relevance_score=9, completeness_score=8, missing_information=["None"], refinement_needed=False, refined_query=""))
+    
+    result = await evaluator.aevaluate_answer("Where is Entrapeer located?", "Entrapeer is in San Francisco.")
+    
+    assert result['relevance_score'] == 9
+    assert result['completeness_score'] == 8
+    assert result['missing_information'] == []
+    assert result['refinement_needed'] is False
+    assert result['refined_query'] is None
+
+def test_evaluation_schema_clamps_scores():
+    """Test that out of range and textual scores are brought into 0-10."""
+    evaluation = Evaluation(relevance_score="12", completeness_score=-1, missing_information=None,
+                            refinement_needed=False, refined_query="")
+    assert (evaluation.relevance_score, evaluation.completeness_score) == (10, 0)
+    assert evaluation.missing_information == []
+
+def test_evaluate_answer_falls_back_to_text(evaluator, mock_llm):
+    """Test that a model answering in text instead of calling the tool is still parsed."""
+    text = "Relevance Score: 7\nCompleteness Score: 6\nMissing Information: None\nRefinement Needed: No\nRefined Query: "
+    mock_llm.with_structured_output.return_value.invoke.return_value = {
+        "raw": Mock(content=text), "parsed": None, "parsing_error": None}
+
+    result = evaluator.evaluate_answer("Where is Entrapeer located?", "Entrapeer is in San Francisco.")
+
+    assert result['relevance_score'] == 7
+    assert result['completeness_score'] == 6
+
+def test_evaluate_answer_parsing_error(evaluator, mock_llm):
+    """Test that an unusable tool call asks for refinement with the original query."""
+    mock_llm.with_structured_output.return_value.invoke.return_value = {
+        "raw": Mock(content=""), "parsed": None, "parsing_error": ValueError("bad arguments")}
+
+    result = evaluator.evaluate_answer("Where is Entrapeer located?", "Entrapeer.")
+
+    assert result['refinement_needed'] is True
+    assert result['refined_query'] == "Where is Entrapeer located?"
+
+def test_answer_evaluator_is_reused():
+    """Test that the evaluator is built once per chat model of the client registry."""
+    first_llm, second_llm = Mock(), Mock()
+    with patch("evaluation.clients.chat_model", return_value=first_llm):
+        evaluator = answer_evaluator()
+        assert answer_evaluator() is evaluator
+    first_llm.with_structured_output.assert_called_once()
+    with patch("evaluation.clients.chat_model", return_value=second_llm):
+        assert answer_evaluator().llm is second_llm
+
+def test_evaluate_and_refine_without_refined_query():
+    """Test that a missing refined query falls back to the original query instead of the text "None"."""
+    evaluation_result = {'relevance_score': 3, 'completeness_score': 2, 'missing_information': ['address'],
+                         'refinement_needed': True, 'refined_query': None}
+    with patch("evaluation.answer_evaluator") as answer_evaluator_factory:
+        answer_evaluator_factory.return_value.evaluate_answer.return_value = evaluation_result
+        needs_refinement, refined_query, _ = evaluate_and_refine("Where is Entrapeer located?", "Entrapeer is a company.")
+
+    assert needs_refinement is True
+    assert refined_query == "Where is Entrapeer located?"
+
+GOOD_LOCATION_ANSWER = ("Entrapeer is headquartered in San Francisco, California, with an office in Istanbul, "
+                        "Turkey, serving corporate innovation teams worldwide.")
+
+def test_pre_evaluation_scores_coverage():
+    """Test that the heuristic score rises with company, intent keyword, length and source coverage."""
+    good = heuristic_evaluator.score(GOOD_LOCATION_ANSWER, "Entrapeer", "Location", "Crunchbase\nLinkedIn")
+    off_topic = heuristic_evaluator.score("Apple sells phones and computers to people.", "Entrapeer", "Location", "")
+    assert good > 0.9
+    assert off_topic < 0.2
+    assert heuristic_evaluator.score("", "Entrapeer", "Location", "Crunchbase") == 0.0
+    assert heuristic_evaluator.score(None, "Entrapeer", "Location", "Crunchbase") == 0.0
+
+def test_pre_evaluation_accepts_without_llm():
+    """Test that an obviously good answer is accepted without building or calling the LLM evaluator."""
+    with patch("evaluation.answer_evaluator") as answer_evaluator_factory:
+        needs_refinement, refined_query, evaluation_result = evaluate_and_refine(
+            "Where is Entrapeer located?", GOOD_LOCATION_ANSWER, "Entrapeer", "Location", "Crunchbase\nLinkedIn")
+
+    answer_evaluator_factory.assert_not_called()
+    assert needs_refinement is False
+    assert evaluation_result['relevance_score'] >= 9
+
+def test_pre_evaluation_rejects_empty_answer():
+    """Test that an empty answer is refined with a company and intent query without building or calling the LLM evaluator."""
+    with patch("evaluation.answer_evaluator") as answer_evaluator_factory:
+        needs_refinement, refined_query, evaluation_result = evaluate_and_refine(
+            "Where is Entrapeer located?", "", "Entrapeer", "Location", "")
+
+    answer_evaluator_factory.assert_not_called()
+    assert needs_refinement is True
+    assert refined_query == "Entrapeer Location"
+
+@pytest.mark.asyncio
+async def test_pre_evaluation_uncertain_falls_through():
+    """Test that an answer in the uncertain band is evaluated by the LLM."""
+    llm_result = {'relevance_score': 7, 'completeness_score': 6, 'missing_information': [],
+                  'refinement_needed': False, 'refined_query': None}
+    with patch.object(AnswerEvaluator, "aevaluate_answer", AsyncMock(return_value=llm_result)) as aevaluate_answer:
+        needs_refinement, refined_query, evaluation_result = await aevaluate_and_refine(
+            "Where is Entrapeer located?", "Entrapeer is a startup building an AI platform.", "Entrapeer", "Location", "Crunchbase")
+
+    aevaluate_answer.assert_awaited_once()
+    assert evaluation_result == llm_result
+
+def test_pre_evaluation_disabled(monkeypatch):
+    """Test that every answer goes to the LLM evaluator when pre-evaluation is off."""
+    monkeypatch.setattr(config, "PRE_EVALUATION_ENABLED", False)
+    llm_result = {'relevance_score': 9, 'completeness_score': 9, 'missing_information': [],
+                  'refinement_needed': False, 'refined_query': None}
+    with patch.object(AnswerEvaluator, "evaluate_answer", return_value=llm_result) as evaluate_answer:
+        evaluate_and_refine("Where is Entrapeer located?", "", "Entrapeer", "Location", "")
+
+    evaluate_answer.assert_called_once()
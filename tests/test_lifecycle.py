@@ -0,0 +1,109 @@
+import pytest
+import sys
+import os
+import time
+from unittest.mock import Mock
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from checkpointing import InMemoryConversationStore
+from lifecycle import ConversationLifecycleManager
+from metrics import metrics
+
+
+@pytest.fixture
+def checkpointer():
+    return Mock()
+
+
+@pytest.fixture
+def manager(checkpointer):
+    metrics.reset()
+    return ConversationLifecycleManager(InMemoryConversationStore(), checkpointer, idle_ttl=60, max_live=2, sweep_interval=1)
+
+
+def test_finish_removes_record_and_thread(manager, checkpointer):
+    """Test that a completed conversation leaves nothing behind."""
+    manager.start("a")
+    manager.finish("a")
+    assert manager.store.get("a") is None
+    checkpointer.delete_thread.assert_called_once_with("a")
+    assert manager.stats()["completed"] == 1
+
+
+def test_sweep_evicts_idle_conversations(manager, checkpointer):
+    """Test that conversations idle past the TTL are evicted."""
+    record = manager.start("idle")
+    manager.wait_for_input("idle", record)
+    manager.store.records["idle"]["updated_at"] = time.time() - 120
+
+    assert manager.sweep() == 1
+    assert manager.store.get("idle") is None
+    checkpointer.delete_thread.assert_called_once_with("idle")
+    assert manager.stats()["evicted_ttl"] == 1
+
+
+def test_sweep_skips_running_conversations(manager):
+    """Test that a conversation still running in the graph is not evicted."""
+    manager.start("running")
+    manager.store.records["running"]["updated_at"] = time.time() - 120
+
+    assert manager.sweep() == 0
+    assert manager.store.get("running") is not None
+
+
+def test_cap_evicts_least_recently_used(manager):
+    """Test that exceeding max_live evicts the oldest waiting conversation."""
+    for conversation_id in ("first", "second"):
+        manager.wait_for_input(conversation_id, manager.start(conversation_id))
+    manager.store.records["first"]["updated_at"] = time.time() - 10
+
+    manager.start("third")
+
+    assert manager.store.get("first") is None
+    assert manager.store.get("second") is not None
+    stats = manager.stats()
+    assert stats["live"] == 2
+    assert stats["evicted_lru"] == 1
+
+
+def test_lease_protects_conversation_from_other_workers(checkpointer):
+    """Test that a conversation running on one worker is not evicted by another sharing the store."""
+    store = InMemoryConversationStore()
+    running = ConversationLifecycleManager(store, checkpointer, idle_ttl=60, max_live=1, sweep_interval=1)
+    other = ConversationLifecycleManager(store, checkpointer, idle_ttl=60, max_live=1, sweep_interval=1)
+    record = running.start("shared")
+    store.records["shared"]["updated_at"] = time.time() - 120
+
+    assert other.sweep() == 0
+    assert store.get("shared") is not None
+
+    running.wait_for_input("shared", record)
+    store.records["shared"]["updated_at"] = time.time() - 120
+    assert other.sweep() == 1
+    assert running.resume("shared") is None
+
+
+def test_concurrent_resumes_get_the_conversation_once(manager):
+    """Test that a second resume of a conversation already resumed gets nothing until it waits for input again."""
+    record = manager.start("busy")
+    manager.wait_for_input("busy", record)
+
+    resumed = manager.resume("busy")
+    assert resumed is not None and resumed["waiting_for_input"] is False
+    assert manager.resume("busy") is None
+
+    manager.wait_for_input("busy", resumed)
+    assert manager.resume("busy") is not None
+
+
+def test_expired_lease_allows_eviction(checkpointer):
+    """Test that a lease left behind by a dead worker lapses."""
+    manager = ConversationLifecycleManager(InMemoryConversationStore(), checkpointer, idle_ttl=60, max_live=2,
+                                           sweep_interval=1, lease_seconds=0)
+    manager.start("orphan")
+    manager.release("orphan")
+    manager.store.records["orphan"]["updated_at"] = time.time() - 120
+
+    assert manager.sweep() == 1
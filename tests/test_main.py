@@ -0,0 +1,234 @@
+import pytest
+import sys
+import os
+import uuid
+from typing import get_type_hints
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.types import Command
+
+import config
+import main
+
+
+ACCEPTED = (False, None, {'relevance_score': 9, 'completeness_score': 9, 'missing_information': [],
+                          'refinement_needed': False, 'refined_query': None})
+REJECTED = (True, "Entrapeer headquarters address", {'relevance_score': 2, 'completeness_score': 2,
+                                                     'missing_information': ['address'], 'refinement_needed': True,
+                                                     'refined_query': "Entrapeer headquarters address"})
+
+
+class GraphStubs:
+    """
+    Stand-ins for the validator, retrieval and evaluator calls the graph nodes
+    make, in sync and async form, recording every call by name.
+    """
+
+    def __init__(self, monkeypatch, company_candidates=None, evaluations=None):
+        self.calls = []
+        # Candidates of the company before and after the user described it
+        self.company_candidates = company_candidates or (["Entrapeer"], ["Entrapeer"])
+        self.evaluations = list(evaluations or [ACCEPTED])
+        self.searches = 0
+        validator, retrieval = main.user_input_validator, main.data_retrieval
+        for target, name, func in [
+            (validator, "get_company_name_from_llm", self.company),
+            (validator, "get_intent", self.intent),
+            (validator, "intention_clearity", self.intent_clarity),
+            (retrieval, "create_search_input", self.search_input),
+            (retrieval, "create_alternative_search_input", self.alternative_search_input),
+            (retrieval, "data_retrieval_general", self.search),
+            (retrieval, "speculative_data_retrieval", self.speculative_search),
+            (main, "evaluate_and_refine", self.evaluate),
+        ]:
+            monkeypatch.setattr(target, name, func)
+            monkeypatch.setattr(target, "a" + name, self.asynchronous(func))
+
+    @staticmethod
+    def asynchronous(func):
+        async def afunc(*args):
+            return func(*args)
+        return afunc
+
+    def company(self, text, detail, company_name):
+        self.calls.append("company")
+        candidates = self.company_candidates[1 if detail.strip() else 0]
+        return "Entrapeer", candidates
+
+    def intent(self, text):
+        self.calls.append("intent")
+        return "Location"
+
+    def intent_clarity(self, text, intent):
+        self.calls.append("intent_clarity")
+        return "clear" if "headquarters" in text else "ambigious"
+
+    def search_input(self, company_name, intent, text, refined_query):
+        return f"{company_name} {intent} {refined_query}".strip()
+
+    def alternative_search_input(self, company_name, intent, text, refined_query):
+        return f"{company_name} official {intent}".strip()
+
+    def search(self, text, intent):
+        self.searches += 1
+        return "Crunchbase", f"Answer {self.searches}"
+
+    def speculative_search(self, text, alternative_text, intent):
+        self.searches += 1
+        return ("Crunchbase", f"Answer {self.searches}"), ("LinkedIn", f"Alternative answer {self.searches}")
+
+    def evaluate(self, query, answer, *context):
+        self.calls.append("evaluate")
+        return self.evaluations.pop(0) if len(self.evaluations) > 1 else self.evaluations[0]
+
+
+@pytest.fixture
+def graph():
+    """The conversation graph with its own in-memory checkpointer."""
+    return main.builder.compile(checkpointer=MemorySaver())
+
+
+def initial_state(text):
+    # Every state key starts out empty: "", [], False, 0 or 0.0
+    state = {key: hint() for key, hint in get_type_hints(main.State).items()}
+    state["input"] = text
+    return state
+
+
+async def run_turn(graph, graph_input, thread, use_async, nodes=None):
+    """Run the graph until it finishes or interrupts; returns the interrupt question or None."""
+    nodes = [] if nodes is None else nodes
+    question = None
+    if use_async:
+        events = [event async for event in graph.astream(graph_input, thread, stream_mode="updates")]
+    else:
+        events = list(graph.stream(graph_input, thread, stream_mode="updates"))
+    for event in events:
+        if "__interrupt__" in event:
+            question = event["__interrupt__"][0].value
+        nodes.extend(event)
+    return question
+
+
+def new_thread():
+    return {"configurable": {"thread_id": str(uuid.uuid4())}}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("use_async", [False, True])
+async def test_graph_answers_clear_question(graph, monkeypatch, use_async):
+    """Test that company and intent branches join once and a clear question is answered without interrupts."""
+    stubs = GraphStubs(monkeypatch)
+    thread = new_thread()
+    nodes = []
+
+    assert await run_turn(graph, initial_state("Where are Entrapeer's headquarters?"), thread, use_async, nodes) is None
+
+    values = graph.get_state(thread).values
+    assert values["final_answer"] == "Answer 1(Sources: Crunchbase)"
+    assert nodes.count("join_company_and_intent") == 1
+    # The branches run in parallel, so only the evaluation after the join has a fixed place
+    assert sorted(stubs.calls[:-1]) == ["company", "intent", "intent_clarity"]
+    assert stubs.calls[-1] == "evaluate"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("use_async", [False, True])
+async def test_graph_intent_clarification_reruns_intent_branch_only(graph, monkeypatch, use_async):
+    """Test that resuming an ambiguous intent re-runs only the intent branch and then answers."""
+    stubs = GraphStubs(monkeypatch)
+    thread = new_thread()
+
+    question = await run_turn(graph, initial_state("Where is Entrapeer?"), thread, use_async)
+    assert question.startswith("I found more than one location type")
+    assert stubs.calls.count("company") == 1
+
+    nodes = []
+    assert await run_turn(graph, Command(resume="headquarters"), thread, use_async, nodes) is None
+
+    values = graph.get_state(thread).values
+    assert values["final_answer"] == "Answer 1(Sources: Crunchbase)"
+    assert values["intent_detail"].strip() == "headquarters"
+    assert nodes.count("join_company_and_intent") == 1
+    assert stubs.calls.count("company") == 1
+    assert stubs.calls.count("intent") == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("use_async", [False, True])
+async def test_graph_asks_for_company_then_intent(graph, monkeypatch, use_async):
+    """Test that an ambiguous company is clarified first, then the still ambiguous intent."""
+    stubs = GraphStubs(monkeypatch, company_candidates=(["Entrapeer Inc.", "Entrapeer Labs"], ["Entrapeer Inc."]))
+    thread = new_thread()
+
+    question = await run_turn(graph, initial_state("Where is Entrapeer?"), thread, use_async)
+    assert question.startswith("I found multiple companies: Entrapeer Inc., Entrapeer Labs")
+
+    question = await run_turn(graph, Command(resume="the AI startup"), thread, use_async)
+    assert question.startswith("I found more than one location type")
+    assert stubs.calls.count("company") == 2
+    assert stubs.calls.count("intent") == 1
+    assert stubs.calls.count("intent_clarity") == 1
+
+    assert await run_turn(graph, Command(resume="headquarters"), thread, use_async) is None
+    values = graph.get_state(thread).values
+    assert values["company_name"] == "Entrapeer Inc."
+    assert values["final_answer"] == "Answer 1(Sources: Crunchbase)"
+    assert stubs.calls.count("company") == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("use_async", [False, True])
+async def test_speculative_result_used_after_rejection(graph, monkeypatch, use_async):
+    """Test that a rejected answer is replaced by the alternative search result without a new search."""
+    monkeypatch.setattr(config, "SPECULATIVE_SEARCH", True)
+    stubs = GraphStubs(monkeypatch, evaluations=[REJECTED, ACCEPTED])
+    thread = new_thread()
+
+    assert await run_turn(graph, initial_state("Where are Entrapeer's headquarters?"), thread, use_async) is None
+
+    values = graph.get_state(thread).values
+    assert values["final_answer"] == "Alternative answer 1(Sources: LinkedIn)"
+    assert values["search_input"] == "Entrapeer official Location"
+    assert stubs.searches == 1
+    assert stubs.calls.count("evaluate") == 2
+    assert values["speculative_output"] == ""
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("use_async", [False, True])
+async def test_speculative_result_discarded_when_accepted(graph, monkeypatch, use_async):
+    """Test that an unused alternative result does not stay in the conversation state."""
+    monkeypatch.setattr(config, "SPECULATIVE_SEARCH", True)
+    stubs = GraphStubs(monkeypatch, evaluations=[ACCEPTED])
+    thread = new_thread()
+
+    assert await run_turn(graph, initial_state("Where are Entrapeer's headquarters?"), thread, use_async) is None
+
+    values = graph.get_state(thread).values
+    assert values["final_answer"] == "Answer 1(Sources: Crunchbase)"
+    assert stubs.calls.count("evaluate") == 1
+    assert (values["speculative_search_input"], values["speculative_output"], values["speculative_url_summary"]) == ("", "", "")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("use_async", [False, True])
+async def test_exhausted_budget_returns_best_answer(graph, monkeypatch, use_async):
+    """Test that running out of refinement iterations answers with the best scoring answer, not the last one."""
+    monkeypatch.setattr(config, "MAX_REFINEMENT_ITERATIONS", 2)
+    monkeypatch.setattr(config, "SPECULATIVE_SEARCH", False)
+    fair = (True, "Entrapeer office address", {'relevance_score': 6, 'completeness_score': 4,
+                                               'missing_information': ['address'], 'refinement_needed': True,
+                                               'refined_query': "Entrapeer office address"})
+    stubs = GraphStubs(monkeypatch, evaluations=[fair, REJECTED])
+    thread = new_thread()
+
+    assert await run_turn(graph, initial_state("Where are Entrapeer's headquarters?"), thread, use_async) is None
+
+    values = graph.get_state(thread).values
+    assert stubs.searches == 2
+    assert values["final_answer"] == "Answer 1(Sources: Crunchbase)"
+    assert values["best_score"] == 10
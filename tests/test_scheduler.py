@@ -0,0 +1,157 @@
+import pytest
+import sys
+import os
+import asyncio
+import json
+import time
+import httpx
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from clients import estimate_openai_tokens, openai_retries, openai_usage, scheduled_transports, tavily_retries
+from metrics import metrics
+from scheduler import (BATCH, CONNECTION_ERRORS, AsyncScheduledTransport, ProviderLimiter, ScheduledTransport, TokenBucket,
+                       current_priority, priority, retry_after)
+
+
+def test_token_bucket_wait_time():
+    """Test refill rate, burst capacity and the reserve kept for interactive work."""
+    bucket = TokenBucket(per_minute=60, burst_seconds=10)
+    now = bucket.updated
+    assert bucket.capacity == 10
+    assert bucket.wait_time(10, now) == 0
+    bucket.take(10)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 1) == pytest.approx(0.0)
+    # 20% of 10 stays reserved, so 3 units need 5 in the bucket
+    assert bucket.wait_time(3, now + 1, reserve=0.2) == pytest.approx(4.0)
+    # Larger than the bucket: waits for a full bucket
+    assert bucket.wait_time(50, now + 1) == pytest.approx(9.0)
+
+
+def test_retry_after_headers():
+    """Test Retry-After in seconds and milliseconds."""
+    request = httpx.Request("POST", "https://api.test")
+    assert retry_after(httpx.Response(429, request=request, headers={"retry-after": "3"})) == 3.0
+    assert retry_after(httpx.Response(429, request=request, headers={"retry-after-ms": "250"})) == 0.25
+    assert retry_after(httpx.Response(429, request=request)) is None
+
+
+def test_priority_context():
+    """Test that priority() applies to its block only."""
+    with priority(BATCH):
+        assert current_priority.get() == BATCH
+    assert current_priority.get() == "interactive"
+
+
+def test_batch_waits_for_queued_interactive_requests():
+    """Test that batch requests hold back while interactive ones are queued."""
+    limiter = ProviderLimiter("test", requests_per_minute=600)
+    assert limiter._try_acquire(0, BATCH) == 0
+    limiter._queue("interactive", 1)
+    assert limiter._try_acquire(0, BATCH) > 0
+    assert limiter._try_acquire(0, "interactive") == 0
+    limiter._queue("interactive", -1)
+
+
+def test_transport_retries_rate_limits():
+    """Test that 429s are retried after Retry-After and usage settles the token bucket."""
+    metrics.reset()
+    responses = [
+        httpx.Response(429, headers={"retry-after-ms": "10"}),
+        httpx.Response(200, json={"usage": {"total_tokens": 40}}),
+    ]
+    transport = httpx.MockTransport(lambda request: responses.pop(0))
+    limiter = ProviderLimiter("openai", requests_per_minute=0, tokens_per_minute=6000, backoff_base=0.01, seed=1)
+    client = httpx.Client(transport=ScheduledTransport(transport, limiter, openai_retries,
+                                                       estimate=lambda request: 100, usage=openai_usage))
+
+    start = time.perf_counter()
+    assert client.post("https://api.test/v1/chat/completions").status_code == 200
+    assert time.perf_counter() - start >= 0.01
+    assert metrics.get("outbound_retries_total", provider="openai", status="429") == 1
+    # Charged 100 up front, 40 after the response: 1000 - 40 left, minus the refill since
+    assert limiter.tokens.level == pytest.approx(960, abs=5)
+
+
+@pytest.mark.asyncio
+async def test_async_transport_gives_up_after_max_retries():
+    """Test that the last failed response is returned once the retries are used up."""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(500)
+
+    limiter = ProviderLimiter("tavily", requests_per_minute=0, max_retries=2, backoff_base=0.001)
+    transport = AsyncScheduledTransport(httpx.MockTransport(handler), limiter, openai_retries)
+    async with httpx.AsyncClient(transport=transport) as client:
+        response = await client.post("https://tavily.test/search", content=b"{}")
+    assert response.status_code == 500
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_requests_per_minute_spreads_a_burst():
+    """Test that a burst beyond the bucket waits for the refill."""
+    limiter = ProviderLimiter("test", requests_per_minute=600)
+    limiter.requests = TokenBucket(600, burst_seconds=0.2)  # 2 requests of burst, then one per 0.1s
+    start = time.perf_counter()
+    await asyncio.gather(*(limiter.aacquire() for _ in range(4)))
+    assert time.perf_counter() - start >= 0.15
+
+
+def test_estimate_openai_tokens():
+    """Test the prompt size estimate of a chat completion request."""
+    body = json.dumps({"model": "gpt-4o", "messages": [{"role": "user", "content": "x" * 400}], "max_tokens": 50})
+    request = httpx.Request("POST", "https://api.test", content=body)
+    assert estimate_openai_tokens(request) == len(body) // 4 + 50
+
+
+def test_tavily_retry_rules():
+    """Test that Tavily retries rate limits and unavailability but not errors that may follow a billed search."""
+    request = httpx.Request("POST", "https://api.tavily.com/search")
+    assert tavily_retries(httpx.Response(429, request=request))
+    assert tavily_retries(httpx.Response(503, request=request))
+    assert not tavily_retries(httpx.Response(500, request=request))
+    assert not tavily_retries(httpx.Response(409, request=request, headers={"x-should-retry": "true"}))
+
+
+def test_transport_retries_only_connection_errors():
+    """Test that a timed out request is not resent when only connection errors are retryable."""
+    def run(error):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            if len(calls) == 1:
+                raise error("failed", request=request)
+            return httpx.Response(200, json={})
+
+        limiter = ProviderLimiter("tavily", requests_per_minute=0, backoff_base=0.001)
+        client = httpx.Client(transport=ScheduledTransport(httpx.MockTransport(handler), limiter, tavily_retries,
+                                                           retry_errors=CONNECTION_ERRORS))
+        try:
+            client.post("https://api.tavily.com/search", content=b"{}")
+        except httpx.TransportError:
+            pass
+        return len(calls)
+
+    assert run(httpx.ConnectError) == 2
+    assert run(httpx.ReadTimeout) == 1
+
+
+def test_scheduled_transports_per_provider(monkeypatch):
+    """Test that each provider gets its own retry rules and Tavily timeouts are opt-in."""
+    monkeypatch.setattr(config, "SCHEDULER_ENABLED", True)
+    openai_transport, _ = scheduled_transports("openai")
+    tavily_transport, _ = scheduled_transports("tavily")
+    assert openai_transport.retryable is openai_retries
+    assert openai_transport.retry_errors == (httpx.TransportError,)
+    assert tavily_transport.retryable is tavily_retries
+    assert tavily_transport.retry_errors == CONNECTION_ERRORS
+
+    monkeypatch.setattr(config, "TAVILY_RETRY_TIMEOUTS", True)
+    assert scheduled_transports("tavily")[0].retry_errors == (httpx.TransportError,)
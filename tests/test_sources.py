@@ -0,0 +1,49 @@
+import pytest
+import sys
+import os
+import json
+from unittest.mock import patch
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sources
+from sources import load_publishers, publisher_name, search_sources, source_names
+
+
+def test_publisher_name_from_table_and_domain():
+    """Test known publishers, subdomains and unknown sites."""
+    assert publisher_name("https://www.reuters.com/business/tesla") == "Reuters"
+    assert publisher_name("https://en.wikipedia.org/wiki/Apple_Inc.") == "Wikipedia"
+    assert publisher_name("https://ir.tesla.com/") == "Tesla"
+    assert publisher_name("https://www.bristol-post.co.uk/news") == "Bristol Post"
+    assert publisher_name("not a url") is None
+
+
+def test_source_names_are_distinct_and_ranked():
+    """Test that sources keep the result order, skip duplicates and fall back to titles."""
+    results = [
+        {"url": "https://www.reuters.com/a", "title": "A"},
+        {"url": "https://reuters.com/b", "title": "B"},
+        {"title": "Company filing"},
+        {"url": "https://techcrunch.com/c", "title": "C"},
+    ]
+    assert source_names(results) == ["Reuters", "Company filing", "TechCrunch"]
+    assert source_names(results, limit=1) == ["Reuters"]
+
+
+def test_search_sources_ignores_malformed_responses():
+    """Test responses without a result list."""
+    assert search_sources({"answer": "x"}) == ""
+    assert search_sources(None) == ""
+    assert search_sources({"results": [{"url": "https://www.bloomberg.com/x"}, {"url": "https://ft.com/y"}]}) == "Bloomberg\nFinancial Times"
+
+
+def test_load_publishers_extends_table(tmp_path):
+    """Test that a JSON file adds and overrides publisher names."""
+    path = tmp_path / "publishers.json"
+    path.write_text(json.dumps({"www.entrapeer.com": "Entrapeer Inc."}))
+    with patch.dict(sources.PUBLISHERS):
+        load_publishers(str(path))
+        assert publisher_name("https://entrapeer.com/customers") == "Entrapeer Inc."
+    assert publisher_name("https://entrapeer.com/customers") == "Entrapeer"
@@ -1,12 +1,13 @@
 import pytest
 import sys
 import os
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, AsyncMock, patch
 
 # Add the project root to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from text_analyze import UserInputValidator
+from company_index import CompanyIndex
+from text_analyze import UserInputValidator, load_nlp, INTENT_DISABLED_PIPES, company_from_entities, location_clarity_from_keywords
 
 @pytest.fixture
 def validator():
@@ -30,8 +31,20 @@ def validator():
         validator.nlp = mock_nlp
         validator.tavily_client = mock_tavily_instance
         validator.llm = mock_llm_instance
+        validator.company_index = CompanyIndex()
         return validator
 
+def test_nlp_loaded_lazily():
+    """Test that spaCy is loaded on first use rather than at construction."""
+    with patch('spacy.load') as mock_spacy_load:
+        validator = UserInputValidator()
+        mock_spacy_load.assert_not_called()
+        assert validator.nlp_loaded is False
+        
+        validator.warm_up()
+        mock_spacy_load.assert_called_once()
+        assert validator.nlp_loaded is True
+
 def test_input_validation_string(validator):
     """Test input validation with string input."""
     test_input = "test input"
@@ -80,6 +93,57 @@ def test_get_intent_success(validator):
         result = validator.get_intent("Where is the location?")
         assert result == "Location"
 
+def test_get_intent_skips_parser_and_ner(validator):
+    """Test that intent scoring runs the pipeline without parser and NER."""
+    mock_token = Mock()
+    mock_token.lemma_.lower.return_value = "location"
+    mock_token.text.lower.return_value = "location"
+    validator.nlp.return_value = [mock_token]
+    
+    validator.get_intent("Where is the location?")
+    validator.nlp.assert_called_with("Where is the location?", disable=INTENT_DISABLED_PIPES)
+
+def test_load_nlp_light_mode():
+    """Test that light mode loads the model without parser and NER."""
+    with patch('spacy.load') as mock_spacy_load:
+        load_nlp(mode="light", model="en_core_web_sm")
+        mock_spacy_load.assert_called_once_with("en_core_web_sm", exclude=INTENT_DISABLED_PIPES)
+
+def test_load_nlp_full_mode():
+    """Test that full mode loads the complete pipeline."""
+    with patch('spacy.load') as mock_spacy_load:
+        load_nlp(mode="full", model="en_core_web_trf")
+        mock_spacy_load.assert_called_once_with("en_core_web_trf")
+
+def test_load_nlp_unknown_mode():
+    """Test that an unknown pipeline mode is rejected."""
+    with pytest.raises(ValueError):
+        load_nlp(mode="tiny", model="en_core_web_sm")
+
+def test_classify_intents_batch(validator):
+    """Test bulk intent classification through nlp.pipe."""
+    def make_doc(word):
+        token = Mock()
+        token.lemma_.lower.return_value = word
+        token.text.lower.return_value = word
+        return [token]
+    validator.nlp.pipe.return_value = iter([make_doc("location"), make_doc("customer"), make_doc("hello")])
+    validator.get_intent_from_llm = Mock(return_value="None")
+    
+    with patch('utils.Utils.read_txt_file') as mock_read_file:
+        mock_read_file.return_value = {
+            "Location": ["location"],
+            "Business Model": [],
+            "Investments": [],
+            "Timeframe": [],
+            "Customers": ["customer"]
+        }
+        result = validator.classify_intents(["Where?", "Who buys?", None, "Hello"], batch_size=32, n_process=2)
+    
+    assert result == ["Location", "Customers", "Error: Please process text first using get_company_name", "None"]
+    validator.nlp.pipe.assert_called_once_with(["Where?", "Who buys?", "Hello"], batch_size=32, n_process=2, disable=INTENT_DISABLED_PIPES)
+    validator.get_intent_from_llm.assert_called_once_with("Hello")
+
 def test_get_intent_empty(validator):
     """Test intent detection with empty input."""
     result = validator.get_intent(None)
@@ -172,4 +236,76 @@ def test_intention_clearity_other(validator):
     result = validator.intention_clearity("What is the business model of Entrapeer?", "Business Model")
     assert result == "clear"
 
+@pytest.mark.asyncio
+async def test_aget_intent_from_llm(validator):
+    """Test async LLM-based intent detection."""
+    validator.llm.ainvoke = AsyncMock(return_value=Mock(content="Customers"))
+    
+    result = await validator.aget_intent_from_llm("Who buys from Entrapeer?")
+    assert result == "Customers"
+
+@pytest.mark.asyncio
+async def test_aget_company_name_from_llm_no_detail(validator):
+    """Test async company name extraction without detail."""
+    validator.llm.ainvoke = AsyncMock(return_value=Mock(content="Entrapeer"))
+    validator.alist_companies_with_same_name = AsyncMock(return_value=["Entrapeer"])
+    
+    result = await validator.aget_company_name_from_llm("Tell me about Entrapeer", "", "")
+    assert result == ("Entrapeer", ["Entrapeer"])
+
+@pytest.mark.asyncio
+async def test_aintention_clearity_location(validator):
+    """Test async intention clarity with Location intention."""
+    validator.llm.ainvoke = AsyncMock(return_value=Mock(content="clear"))
+    
+    result = await validator.aintention_clearity("Where is the headquarters?", "Location")
+    assert result == "clear"
+
+def make_doc(*ents):
+    return Mock(ents=[Mock(text=text, label_=label) for text, label in ents])
+
+def test_company_from_entities_single_org():
+    """Test that one ORG entity is a confident company name."""
+    assert company_from_entities(make_doc(("Tesla's", "ORG"), ("Berlin", "GPE"))) == ("Tesla", 1.0)
+
+def test_company_from_entities_not_decisive():
+    """Test that several or competing entities are not confident."""
+    assert company_from_entities(make_doc(("Tesla", "ORG"), ("SpaceX", "ORG"))) == (None, 0.0)
+    assert company_from_entities(make_doc(("SpaceX", "ORG"), ("Elon Musk", "PERSON")))[1] < 0.8
+
+def test_location_clarity_from_keywords():
+    """Test location type clarity decided from keywords."""
+    assert location_clarity_from_keywords("Where is the main office of Entrapeer?") == ("clear", 1.0)
+    assert location_clarity_from_keywords("Where are the factories and stores?")[0] == "ambigious"
+    assert location_clarity_from_keywords("Where is Entrapeer?") == (None, 0.0)
+
+def test_get_company_name_fast_path(validator):
+    """Test that a single ORG entity skips the company name LLM call."""
+    validator.nlp = Mock(return_value=make_doc(("Entrapeer", "ORG")), pipe_names=["tok2vec", "ner"])
+    validator.list_companies_with_same_name = Mock(return_value=["Entrapeer"])
+
+    result = validator.get_company_name_from_llm("Tell me about Entrapeer", "", "")
+    assert result == ("Entrapeer", ["Entrapeer"])
+    validator.llm.invoke.assert_not_called()
+
+def test_get_company_name_without_ner_uses_llm(validator):
+    """Test that a pipeline without NER (light mode) falls back to the LLM."""
+    validator.nlp = Mock(pipe_names=["tok2vec", "tagger"])
+    validator.llm.invoke.return_value = Mock(content="Entrapeer")
+    validator.list_companies_with_same_name = Mock(return_value=["Entrapeer"])
+
+    assert validator.get_company_name_from_llm("Tell me about Entrapeer", "", "") == ("Entrapeer", ["Entrapeer"])
+    validator.nlp.assert_not_called()
+
+def test_intention_clearity_fast_path(validator):
+    """Test that a single named location type skips the LLM."""
+    assert validator.intention_clearity("Where is the Entrapeer HQ?", "Location") == "clear"
+    validator.llm.invoke.assert_not_called()
+
+def test_list_companies_uses_company_index(validator):
+    """Test that a listing learned from the LLM is answered locally next time."""
+    validator.llm.invoke.return_value = Mock(content="1. Apple, Technology\n2. Apple, Records")
+    first = validator.list_companies_with_same_name("Apple")
 
+    assert validator.list_companies_with_same_name("apple inc.") == first
+    assert validator.llm.invoke.call_count == 1
@@ -0,0 +1,129 @@
+import pytest
+import sys
+import os
+import json
+import asyncio
+import httpx
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph.errors import GraphInterrupt
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from budget import token_counter
+from cache import LLMResponseCache, ResponseCache, SingleFlight
+from clients import count_openai_retry
+from metrics import MetricsRegistry, metrics
+from tracing import TraceStore, record, trace_request, traced, traces
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    metrics.reset()
+    traces.clear()
+    yield
+    metrics.reset()
+    traces.clear()
+
+
+def test_traced_node_adds_span_to_request_trace():
+    """Test that a node run records its time, tokens and counters in the request trace."""
+    search_cache = ResponseCache("tavily", maxsize=10, ttl=60)
+
+    def data_retrieval_general(state):
+        record("tavily_requests")
+        search_cache.cached(lambda query: {"results": []}, {"query": "q"})
+        search_cache.cached(lambda query: {"results": []}, {"query": "q"})
+        return {"data_retrieval_general_output": "answer", "tokens_used": 42}
+
+    with trace_request("conv-1", "start_conversation") as trace:
+        traced(data_retrieval_general)({})
+
+    data = trace.to_dict()
+    assert data["tokens"] == 42
+    assert data["nodes"]["data_retrieval_general"]["runs"] == 1
+    assert data["counters"] == {"tavily_requests": 1, "tavily_cache_miss": 1, "tavily_cache_hit": 1}
+    assert traces.get("conv-1")[0]["trace_id"] == trace.trace_id
+    assert metrics.histogram("graph_node_tokens", node="data_retrieval_general") == (1, 42)
+
+
+@pytest.mark.asyncio
+async def test_traced_async_node_interrupt_is_not_an_error():
+    """Test that an interrupt marks the span as interrupted without counting an error."""
+    async def additional_detail_for_intent(state):
+        raise GraphInterrupt()
+
+    with trace_request("conv-2", "stream_conversation") as trace:
+        with pytest.raises(GraphInterrupt):
+            await traced(additional_detail_for_intent)({})
+
+    assert trace.to_dict()["spans"][0]["status"] == "interrupted"
+    assert metrics.get("graph_node_errors_total", node="additional_detail_for_intent") == 0
+
+
+def test_record_outside_trace_is_ignored():
+    """Test that recording with no node running does nothing."""
+    record("tavily_requests")
+    assert traced(lambda state: {"intent": "Location"}, "extract_intent")({}) == {"intent": "Location"}
+
+
+def test_openai_retryable_responses_are_counted():
+    """Test that only responses the OpenAI SDK retries are counted."""
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    with trace_request("conv-3", "getResponse") as trace:
+        def evaluate_and_refine_answer(state):
+            count_openai_retry(httpx.Response(429, request=request))
+            count_openai_retry(httpx.Response(400, request=request))
+            count_openai_retry(httpx.Response(200, request=request, headers={"x-should-retry": "true"}))
+        traced(evaluate_and_refine_answer)({})
+    assert trace.to_dict()["counters"] == {"openai_retries": 2}
+
+
+@pytest.mark.asyncio
+async def test_llm_calls_count_only_sent_requests():
+    """Test that LLM cache hits and coalesced calls are not counted as LLM calls."""
+    llm = FakeListChatModel(responses=["Entrapeer"], sleep=0.01, cache=LLMResponseCache(maxsize=2, ttl=60),
+                            callbacks=[token_counter])
+    flight = SingleFlight("company_list", enabled=True)
+
+    async def list_companies_with_same_name(state):
+        await asyncio.gather(*(flight.ado("Entrapeer", llm.ainvoke, "Companies named Entrapeer?") for _ in range(3)))
+        await llm.ainvoke("Companies named Entrapeer?")
+
+    with trace_request("conv-4", "start_conversation") as trace:
+        await traced(list_companies_with_same_name)({})
+
+    assert trace.to_dict()["counters"] == {"llm_calls": 1, "llm_cache_miss": 1, "llm_cache_hit": 1,
+                                           "company_list_coalesced": 2}
+
+
+def test_trace_store_dumps_json_lines(tmp_path):
+    """Test that finished traces are kept per conversation and appended to the dump file."""
+    store = TraceStore(maxsize=1, dump_dir=str(tmp_path))
+    with trace_request("conv-a", "start_conversation") as first:
+        pass
+    store.add(first)
+    with trace_request("conv-b", "start_conversation") as second:
+        pass
+    store.add(second)
+
+    assert store.get("conv-a") is None
+    with open(tmp_path / "conv-a.jsonl") as f:
+        assert json.loads(f.readline())["trace_id"] == first.trace_id
+
+
+def test_prometheus_text_format():
+    """Test the exposition of counters and histograms."""
+    registry = MetricsRegistry()
+    registry.increment("cache_requests_total", cache="tavily", result="hit", tier="memory")
+    registry.observe("graph_node_duration_seconds", 0.3, node="extract_intent")
+    registry.observe("graph_node_duration_seconds", 100, node="extract_intent")
+
+    lines = registry.prometheus_text().splitlines()
+    assert "# TYPE cache_requests_total counter" in lines
+    assert 'cache_requests_total{cache="tavily",result="hit",tier="memory"} 1' in lines
+    assert 'graph_node_duration_seconds_bucket{node="extract_intent",le="0.5"} 1' in lines
+    assert 'graph_node_duration_seconds_bucket{node="extract_intent",le="+Inf"} 2' in lines
+    assert 'graph_node_duration_seconds_count{node="extract_intent"} 2' in lines
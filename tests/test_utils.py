@@ -0,0 +1,66 @@
+import pytest
+import sys
+import os
+from unittest.mock import Mock, patch
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import Utils, IntentKeywordIndex
+
+
+def make_token(lemma, text=None):
+    token = Mock()
+    token.lemma_ = lemma
+    token.text = text if text is not None else lemma
+    return token
+
+
+@pytest.fixture
+def keyword_file(tmp_path):
+    path = tmp_path / "intent_keywords.txt"
+    path.write_text("Location\ncity, office\n\nInvestments\nfund, stake\n\nCustomers\nclient, fund\n")
+    return str(path)
+
+
+def test_compile_maps_keyword_to_categories():
+    """Test that a keyword listed under several categories maps to all of them."""
+    index = IntentKeywordIndex.compile({"Investments": ["fund"], "Customers": ["fund", "client"]})
+    assert index["fund"] == {"Investments", "Customers"}
+    assert index["client"] == {"Customers"}
+
+
+def test_count_single_pass():
+    """Test counting matches on lemma or text, once per category per token."""
+    index = IntentKeywordIndex.compile({"Location": ["office"], "Investments": ["fund"], "Customers": ["client"]})
+    tokens = [make_token("office", "offices"), make_token("fund", "fund"), make_token("is"), make_token("client", "Clients")]
+    counts = IntentKeywordIndex.count(tokens, index)
+    assert counts == {"Location": 1, "Business Model": 0, "Investments": 1, "Timeframe": 0, "Customers": 1}
+
+
+def test_get_reads_file_once(keyword_file):
+    """Test that repeated lookups do not re-read an unchanged file."""
+    keyword_index = IntentKeywordIndex(keyword_file, check_interval=0)
+    with patch.object(Utils, "read_txt_file", wraps=Utils.read_txt_file) as mock_read:
+        keyword_index.get()
+        keyword_index.get()
+        assert mock_read.call_count == 1
+
+
+def test_get_reloads_when_file_changes(keyword_file):
+    """Test hot reload after the keyword file is modified."""
+    keyword_index = IntentKeywordIndex(keyword_file, check_interval=0)
+    assert "headquarter" not in keyword_index.get()
+
+    with open(keyword_file, "a") as f:
+        f.write("\nLocation\nheadquarter\n")
+    stat = os.stat(keyword_file)
+    os.utime(keyword_file, (stat.st_atime, stat.st_mtime + 10))
+
+    assert keyword_index.get()["headquarter"] == {"Location"}
+
+
+def test_get_missing_file_returns_empty(tmp_path):
+    """Test that an unreadable file yields an empty index."""
+    keyword_index = IntentKeywordIndex(str(tmp_path / "missing.txt"))
+    assert keyword_index.get() == {}
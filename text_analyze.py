@@ -1,19 +1,119 @@
-from langchain_openai import ChatOpenAI 
 from dotenv import load_dotenv
-from tavily import TavilyClient
+import asyncio
+import logging
 import os   
+import threading
 import spacy
-from utils import Utils
+from utils import Utils, IntentKeywordIndex
+from cache import search_cache, llm_cache, company_list_flight, normalize_text
+from clients import clients
+from company_index import CompanyIndex, create_company_index
+from metrics import metrics
+import config
 import re
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Intent scoring only reads lemmas, so the dependency parser and NER are
+# skipped for it in every mode.
+INTENT_DISABLED_PIPES = ["parser", "ner"]
+# Company names only need the entity recognizer
+COMPANY_DISABLED_PIPES = ["parser", "tagger", "attribute_ruler", "lemmatizer"]
+
+# Entity types that may also be the company the question is about, which
+# makes a single ORG entity an unsafe answer
+COMPETING_ENTITY_LABELS = {"PRODUCT", "PERSON", "FAC", "WORK_OF_ART"}
+
+# Location types the clarity check distinguishes. Longer phrases win over the
+# words they contain ("main office" is a headquarters, not an office).
+LOCATION_TYPE_KEYWORDS = {
+    "headquarters": ["headquarters", "headquarter", "headquartered", "hq", "head office", "main office", "registered office"],
+    "offices": ["office", "offices", "branch", "branches"],
+    "stores": ["store", "stores", "shop", "shops", "outlet", "outlets", "showroom", "showrooms", "dealership", "dealerships"],
+    "factories": ["factory", "factories", "gigafactory", "gigafactories", "plant", "plants", "manufacturing site", "manufacturing sites"],
+    "warehouses": ["warehouse", "warehouses", "distribution center", "distribution centers", "fulfillment center", "fulfillment centers"],
+    "data centers": ["data center", "data centers", "data centre", "data centres", "datacenter", "datacenters"],
+    "research centers": ["lab", "labs", "laboratory", "laboratories", "research center", "research centers", "r&d center"],
+}
+LOCATION_TYPE_PATTERN = re.compile(
+    r"(?<![\w&])(" + "|".join(sorted((re.escape(k) for keywords in LOCATION_TYPE_KEYWORDS.values() for k in keywords), key=len, reverse=True)) + r")(?![\w&])"
+)
+LOCATION_TYPE_BY_KEYWORD = {keyword: location_type for location_type, keywords in LOCATION_TYPE_KEYWORDS.items() for keyword in keywords}
+
+def company_from_entities(doc):
+    """
+    (company name, confidence) from the named entities of `doc`. Exactly one
+    distinct ORG entity is a confident answer unless another entity could be
+    the subject instead; anything else returns (None, 0.0).
+    """
+    orgs = []
+    competing = False
+    for ent in doc.ents:
+        if ent.label_ == "ORG":
+            name = re.sub(r"['’]s$", "", ent.text.strip())
+            if name and name not in orgs:
+                orgs.append(name)
+        elif ent.label_ in COMPETING_ENTITY_LABELS:
+            competing = True
+    if len(orgs) != 1:
+        return None, 0.0
+    return orgs[0], 0.5 if competing else 1.0
+
+def location_clarity_from_keywords(text):
+    """
+    ("clear" | "ambigious", confidence) from the location types named in
+    `text`, or (None, 0.0) when none is named and the LLM has to decide.
+    """
+    location_types = {LOCATION_TYPE_BY_KEYWORD[match.group(1)] for match in LOCATION_TYPE_PATTERN.finditer(text.lower())}
+    if len(location_types) == 1:
+        return "clear", 1.0
+    if len(location_types) > 1:
+        return "ambigious", 0.9
+    return None, 0.0
+
+def load_nlp(mode=None, model=None):
+    mode = mode or config.SPACY_PIPELINE_MODE
+    model = model or config.SPACY_MODEL
+    if mode == "light":
+        return spacy.load(model, exclude=INTENT_DISABLED_PIPES)
+    if mode == "full":
+        return spacy.load(model)
+    raise ValueError(f"Unknown spaCy pipeline mode: {mode}")
+
 class UserInputValidator:
     def __init__(self):
-        self.nlp = spacy.load("en_core_web_trf")
+        # spaCy (and torch for the transformer model) is loaded on first use or by warm_up()
+        self._nlp = None
+        self._nlp_lock = threading.Lock()
         self.doc = None
-        self.tavily_client = TavilyClient(os.getenv("TAVILY_API_KEY"))
+        self.tavily_client = clients.tavily()
         self.intent_file_path = os.path.join(os.path.dirname(__file__), "source", "intent_keywords.txt")
-        self.llm = ChatOpenAI(model="gpt-4")
+        self.intent_index = IntentKeywordIndex(self.intent_file_path)
+        self.company_index = create_company_index()
+        self.llm = clients.chat_model("gpt-4", cache=llm_cache)
+        
+    @property
+    def nlp(self):
+        if self._nlp is None:
+            with self._nlp_lock:
+                if self._nlp is None:
+                    self._nlp = load_nlp()
+        return self._nlp
+
+    @nlp.setter
+    def nlp(self, value):
+        self._nlp = value
+
+    @property
+    def nlp_loaded(self):
+        return self._nlp is not None
+
+    def warm_up(self):
+        self._intent_doc("warm up")
+
+    def _intent_doc(self, text):
+        return self.nlp(text, disable=INTENT_DISABLED_PIPES)
         
     def input_validation(self, text):
         if isinstance(text, dict):
@@ -27,93 +127,216 @@ class UserInputValidator:
         
     def get_intent(self, text):
         try:
-            intention_dict = Utils.read_txt_file(self.intent_file_path)
-            if not intention_dict:
+            keyword_index = self.intent_index.get()
+            if not keyword_index:
                 return "Error: Could not read intent keywords file"
                 
             if text is None:
                 return "Error: Please process text first using get_company_name"
                 
-            location_intent_count = 0 
-            investments_intent_count = 0
-            business_model_intent_count = 0
-            timeframe_intent_count = 0
-            customers_intent_count = 0
-            doc_text = self.nlp(text)
-            for token in doc_text:
-                if len(token.lemma_.lower()) > 2:
-                    if token.lemma_.lower() in intention_dict.get("Location", []) or token.text.lower() in intention_dict.get("Location", []):
-                        location_intent_count += 1
-                    if token.lemma_.lower() in intention_dict.get("Business Model", []) or token.text.lower() in intention_dict.get("Business Model", []):
-                        business_model_intent_count += 1
-                    if token.lemma_.lower() in intention_dict.get("Investments", []) or token.text.lower() in intention_dict.get("Investments", []):
-                        investments_intent_count += 1
-                    if token.lemma_.lower() in intention_dict.get("Timeframe", []) or token.text.lower() in intention_dict.get("Timeframe", []): 
-                        timeframe_intent_count += 1
-                    if token.lemma_.lower() in intention_dict.get("Customers", []) or token.text.lower() in intention_dict.get("Customers", []):
-                        customers_intent_count += 1
-            
-            counts = {
-                "Location": location_intent_count,
-                "Business Model": business_model_intent_count,
-                "Investments": investments_intent_count,
-                "Timeframe": timeframe_intent_count,
-                "Customers": customers_intent_count
-            }
-            
-            max_count = max(counts.values())
-            max_intents = [intent for intent, count in counts.items() if count == max_count]
+            max_intents = self._top_intents(self._intent_doc(text), keyword_index)
             if len(max_intents) == 1:
                 return max_intents[0]
             else:
                 return self.get_intent_from_llm(text)
         except Exception as e:
             return f"Error in intent analysis: {str(e)}"
+
+    async def aget_intent(self, text):
+        try:
+            keyword_index = self.intent_index.get()
+            if not keyword_index:
+                return "Error: Could not read intent keywords file"
+                
+            if text is None:
+                return "Error: Please process text first using get_company_name"
+
+            # spaCy is CPU bound (and may still need loading), keep it off the event loop
+            doc_text = await asyncio.to_thread(self._intent_doc, text)
+            max_intents = self._top_intents(doc_text, keyword_index)
+            if len(max_intents) == 1:
+                return max_intents[0]
+            else:
+                return await self.aget_intent_from_llm(text)
+        except Exception as e:
+            return f"Error in intent analysis: {str(e)}"
+
+    def classify_intents(self, texts, batch_size=None, n_process=None):
+        """
+        Intent labels for many texts at once, identical to calling get_intent on
+        each. spaCy runs over the texts in batches (and optionally in several
+        processes); only keyword ties are sent to the LLM, one text at a time.
+        """
+        texts = list(texts)
+        keyword_index = self.intent_index.get()
+        if not keyword_index:
+            return ["Error: Could not read intent keywords file"] * len(texts)
+
+        labels = [None] * len(texts)
+        positions = []
+        valid_texts = []
+        for position, text in enumerate(texts):
+            if text is None:
+                labels[position] = "Error: Please process text first using get_company_name"
+            else:
+                positions.append(position)
+                valid_texts.append(text)
+
+        docs = self.nlp.pipe(
+            valid_texts,
+            batch_size=batch_size or config.SPACY_BATCH_SIZE,
+            n_process=n_process or config.SPACY_N_PROCESS,
+            disable=INTENT_DISABLED_PIPES,
+        )
+        for position, text, doc_text in zip(positions, valid_texts, docs):
+            try:
+                max_intents = self._top_intents(doc_text, keyword_index)
+                labels[position] = max_intents[0] if len(max_intents) == 1 else self.get_intent_from_llm(text)
+            except Exception as e:
+                labels[position] = f"Error in intent analysis: {str(e)}"
+        return labels
+
+    def _fast_company_name(self, text):
+        """Company name from spaCy NER when it is confident enough, otherwise None."""
+        if not config.FAST_PATH_ENABLED:
+            return None
+        try:
+            if "ner" not in self.nlp.pipe_names:
+                # Light mode runs without the entity recognizer
+                return None
+            name, confidence = company_from_entities(self.nlp(text, disable=COMPANY_DISABLED_PIPES))
+        except Exception as e:
+            logger.exception("Error in company fast path")
+            name, confidence = None, 0.0
+        hit = name is not None and confidence >= config.FAST_PATH_MIN_CONFIDENCE
+        metrics.increment("fast_path_total", step="company", result="hit" if hit else "miss")
+        return name if hit else None
+
+    def _fast_location_clarity(self, text):
+        if not config.FAST_PATH_ENABLED:
+            return None
+        answer, confidence = location_clarity_from_keywords(text)
+        hit = answer is not None and confidence >= config.FAST_PATH_MIN_CONFIDENCE
+        metrics.increment("fast_path_total", step="location_clarity", result="hit" if hit else "miss")
+        return answer if hit else None
+
+    def _top_intents(self, doc_text, keyword_index):
+        counts = IntentKeywordIndex.count(doc_text, keyword_index)
+        max_count = max(counts.values())
+        return [intent for intent, count in counts.items() if count == max_count]
     
     def get_company_name_from_llm(self, text, detail, company_name):
         if detail.strip() == "":
-            prompt = f"""what is the name of the company in this sentence:
-            Analyze following :{text}
-            Return only the company name.
-            """
-            response = self.llm.invoke(prompt) 
-            list_companies_with_same_name = self.list_companies_with_same_name(response.content)
-            original_company_name = response.content
+            original_company_name = self._fast_company_name(text)
+            if original_company_name is None:
+                response = self.llm.invoke(self._company_name_prompt(text)) 
+                original_company_name = response.content
+            list_companies_with_same_name = self.list_companies_with_same_name(original_company_name)
             return original_company_name, list_companies_with_same_name
         else:
             tavily_search_for_company_detail = self.tavily_search_for_multiple_companies_detail(company_name, detail)
-            prompt = f"""
+            prompt = self._company_detail_prompt(company_name, detail, tavily_search_for_company_detail)
+            response = self.llm.invoke(prompt)   
+            return company_name, [response.content]
+
+    async def aget_company_name_from_llm(self, text, detail, company_name):
+        if detail.strip() == "":
+            original_company_name = await asyncio.to_thread(self._fast_company_name, text)
+            if original_company_name is None:
+                response = await self.llm.ainvoke(self._company_name_prompt(text))
+                original_company_name = response.content
+            list_companies_with_same_name = await self.alist_companies_with_same_name(original_company_name)
+            return original_company_name, list_companies_with_same_name
+        else:
+            tavily_search_for_company_detail = await self.atavily_search_for_multiple_companies_detail(company_name, detail)
+            prompt = self._company_detail_prompt(company_name, detail, tavily_search_for_company_detail)
+            response = await self.llm.ainvoke(prompt)
+            return company_name, [response.content]
+
+    def _company_name_prompt(self, text):
+        return f"""what is the name of the company in this sentence:
+            Analyze following :{text}
+            Return only the company name.
+            """
+
+    def _company_detail_prompt(self, company_name, detail, tavily_search_for_company_detail):
+        return f"""
             Consider the industry of the company: 
             Company name :{company_name}
             Company detail :{detail}
             Company search result from tavily :{tavily_search_for_company_detail}
             Return the actual company name using all the information. Your answer should be only the real full name of the company.
-            """            
-            response = self.llm.invoke(prompt)   
-            return company_name, [response.content]
+            """
     
     def tavily_search_for_multiple_companies_detail(self, company_name, detail):
         try:
             company_name = self.input_validation(company_name)
-            response = self.tavily_client.search(
-                query = f"Consider the industry of the company: {company_name} and {detail} Return only one full company name.",
-                search_depth="advanced",
-                include_answer=True,
-                include_domains=[],
-                max_results=5,
-            )
+            response = search_cache.cached(self.tavily_client.search, self._company_detail_search_params(company_name, detail))
             return response.get('answer', 'No answer found')
         except Exception as e:
             return {"error": f"Error searching for company: {str(e)}"}
+
+    async def atavily_search_for_multiple_companies_detail(self, company_name, detail):
+        try:
+            company_name = self.input_validation(company_name)
+            response = await search_cache.acached(self.tavily_client.asearch, self._company_detail_search_params(company_name, detail))
+            return response.get('answer', 'No answer found')
+        except Exception as e:
+            return {"error": f"Error searching for company: {str(e)}"}
+
+    def _company_detail_search_params(self, company_name, detail):
+        return dict(
+            query = f"Consider the industry of the company: {company_name} and {detail} Return only one full company name.",
+            search_depth="advanced",
+            include_answer=True,
+            include_domains=[],
+            max_results=5,
+        )
         
     def list_companies_with_same_name(self, company_name):
-        prompt = f"""List all the companies named {company_name}, if there is one and only one company return company name. 
+        # Concurrent conversations about the same company share one lookup
+        return company_list_flight.do(normalize_text(company_name), self._list_companies_with_same_name, company_name)
+
+    async def alist_companies_with_same_name(self, company_name):
+        return await company_list_flight.ado(normalize_text(company_name), self._alist_companies_with_same_name, company_name)
+
+    def _list_companies_with_same_name(self, company_name):
+        known = self._known_companies(company_name)
+        if known is not None:
+            return known
+        response = self.llm.invoke(self._same_name_prompt(company_name))
+        company_list = self._parse_company_list(response.content)
+        self._learn_companies(company_name, company_list)
+        return company_list
+
+    async def _alist_companies_with_same_name(self, company_name):
+        known = self._known_companies(company_name)
+        if known is not None:
+            return known
+        response = await self.llm.ainvoke(self._same_name_prompt(company_name))
+        company_list = self._parse_company_list(response.content)
+        self._learn_companies(company_name, company_list)
+        return company_list
+
+    def _known_companies(self, company_name):
+        if self.company_index is None:
+            return None
+        companies = self.company_index.lookup(company_name)
+        return None if companies is None else CompanyIndex.as_company_list(companies)
+
+    def _learn_companies(self, company_name, company_list):
+        if self.company_index is not None and config.COMPANY_INDEX_LEARN and company_list:
+            self.company_index.learn(company_name, company_list)
+
+    def _same_name_prompt(self, company_name):
+        return f"""List all the companies named {company_name}, if there is one and only one company return company name. 
         If there are more than one company with the same name, list each of the companies as Company Name, 
         Company Industry with comma. Do not write anything else.
         """
-        response = self.llm.invoke(prompt)
+
+    def _parse_company_list(self, content):
         result = []
-        for i in response.content.split("\n"):
+        for i in content.split("\n"):
             temp = re.sub(r'[\d.]', '', i)
             if temp != "":
                 result.append(temp.strip())
@@ -122,7 +345,15 @@ class UserInputValidator:
         
             
     def get_intent_from_llm(self, text):
-        prompt = f"""Analyze the following text and select the SINGLE most relevant subject from these five options:            
+        response = self.llm.invoke(self._intent_prompt(text))
+        return response.content
+
+    async def aget_intent_from_llm(self, text):
+        response = await self.llm.ainvoke(self._intent_prompt(text))
+        return response.content
+
+    def _intent_prompt(self, text):
+        return f"""Analyze the following text and select the SINGLE most relevant subject from these five options:            
         Text to analyze: "{text}"
         1. Location: Any geographical or place-related information (e.g., cities, countries, regions)
         2. Business Model: Any business structure, revenue model, or operational aspects (e.g., how a company operates)
@@ -133,18 +364,35 @@ class UserInputValidator:
         Return only one word: "Location", "Business Model", "Investments", "Timeframe", "Customers" or "None"
 
         """
-        response = self.llm.invoke(prompt)
-        return response.content
     
     def intention_clearity(self, text, intention_answer):
         if intention_answer == "None":
             return "ambiguous"
         elif intention_answer == "Location":
-            prompt = f"""{text} - control for this sentence how many location type (e.g. HQ, stores, factories) is related. if only one location type is related return 'clear', if more than one location type are related return 'ambigious'. Multiple locations does not mean ambigous, only multiple location types are ambigous. Answer just in one word ambigous or clear
-            """
+            clarity = self._fast_location_clarity(text)
+            if clarity is not None:
+                return clarity
+            prompt = self._location_clarity_prompt(text)
         else:
             return "clear"
         response = self.llm.invoke(prompt)
         return response.content
+
+    async def aintention_clearity(self, text, intention_answer):
+        if intention_answer == "None":
+            return "ambiguous"
+        elif intention_answer == "Location":
+            clarity = self._fast_location_clarity(text)
+            if clarity is not None:
+                return clarity
+            prompt = self._location_clarity_prompt(text)
+        else:
+            return "clear"
+        response = await self.llm.ainvoke(prompt)
+        return response.content
+
+    def _location_clarity_prompt(self, text):
+        return f"""{text} - control for this sentence how many location type (e.g. HQ, stores, factories) is related. if only one location type is related return 'clear', if more than one location type are related return 'ambigious'. Multiple locations does not mean ambigous, only multiple location types are ambigous. Answer just in one word ambigous or clear
+            """
     
             
@@ -0,0 +1,236 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from langgraph.errors import GraphBubbleUp
+
+import config
+from metrics import TOKEN_BUCKETS, metrics
+
+
+class Span:
+    """
+    One run of one graph node: wall time, the LLM tokens it spent and free
+    form counters recorded while it ran (tavily_requests, tavily_seconds,
+    llm_calls, llm_cache_hit, tavily_cache_miss, openai_retries, ...).
+    llm_calls counts only requests sent to the provider; cache hits and calls
+    coalesced onto another caller's are counted as llm_cache_hit and
+    <name>_coalesced instead.
+    """
+
+    def __init__(self, node: str):
+        self.node = node
+        self.started_at = time.time()
+        self.duration_seconds = 0.0
+        self.tokens = 0
+        self.status = "ok"
+        self.counters: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def add(self, name: str, value: float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self) -> Dict:
+        return {
+            "node": self.node,
+            "started_at": self.started_at,
+            "duration_seconds": round(self.duration_seconds, 6),
+            "tokens": self.tokens,
+            "status": self.status,
+            "counters": dict(self.counters),
+        }
+
+
+class RequestTrace:
+    """The spans of every node that ran while one API request drove the graph."""
+
+    def __init__(self, conversation_id: str, endpoint: str):
+        self.trace_id = uuid.uuid4().hex
+        self.conversation_id = conversation_id
+        self.endpoint = endpoint
+        self.started_at = time.time()
+        self.duration_seconds = 0.0
+        self.error: Optional[str] = None
+        self.spans: List[Span] = []
+        self.lock = threading.Lock()
+
+    def add_span(self, span: Span):
+        with self.lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            spans = [span.to_dict() for span in self.spans]
+        nodes: Dict[str, Dict] = {}
+        counters: Dict[str, float] = {}
+        for span in spans:
+            node = nodes.setdefault(span["node"], {"runs": 0, "duration_seconds": 0.0, "tokens": 0})
+            node["runs"] += 1
+            node["duration_seconds"] = round(node["duration_seconds"] + span["duration_seconds"], 6)
+            node["tokens"] += span["tokens"]
+            for name, value in span["counters"].items():
+                counters[name] = counters.get(name, 0) + value
+        return {
+            "trace_id": self.trace_id,
+            "conversation_id": self.conversation_id,
+            "endpoint": self.endpoint,
+            "started_at": self.started_at,
+            "duration_seconds": round(self.duration_seconds, 6),
+            "error": self.error,
+            "tokens": sum(span["tokens"] for span in spans),
+            "nodes": nodes,
+            "counters": counters,
+            "spans": spans,
+        }
+
+
+class TraceStore:
+    """
+    Finished request traces of the most recent conversations, oldest
+    conversation dropped first. With a dump directory every trace is also
+    appended as one JSON line to <dump_dir>/<conversation_id>.jsonl.
+    """
+
+    def __init__(self, maxsize: int, dump_dir: str = ""):
+        self.maxsize = maxsize
+        self.dump_dir = dump_dir
+        self.traces: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, trace: RequestTrace):
+        data = trace.to_dict()
+        with self.lock:
+            self.traces.setdefault(trace.conversation_id, []).append(data)
+            self.traces.move_to_end(trace.conversation_id)
+            while len(self.traces) > self.maxsize:
+                self.traces.popitem(last=False)
+        if self.dump_dir:
+            os.makedirs(self.dump_dir, exist_ok=True)
+            with open(os.path.join(self.dump_dir, f"{trace.conversation_id}.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(data) + "\n")
+
+    def get(self, conversation_id: str) -> Optional[List[Dict]]:
+        with self.lock:
+            traces = self.traces.get(conversation_id)
+            return list(traces) if traces is not None else None
+
+    def clear(self):
+        with self.lock:
+            self.traces.clear()
+
+
+traces = TraceStore(config.TRACE_HISTORY_SIZE, config.TRACE_DUMP_DIR)
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def trace_request(conversation_id: str, endpoint: str):
+    """
+    Collect the spans of the graph run inside the block into one RequestTrace.
+    Node tasks started inside the block inherit the trace through the context.
+    """
+    trace = RequestTrace(conversation_id, endpoint)
+    previous = current_trace.get()
+    current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    except Exception as e:
+        trace.error = str(e)
+        raise
+    finally:
+        # set() rather than reset(): a streamed response may be closed from
+        # another context when the client disconnects
+        current_trace.set(previous)
+        trace.duration_seconds = time.perf_counter() - start
+        metrics.observe("request_duration_seconds", trace.duration_seconds, endpoint=endpoint)
+        if config.TRACING_ENABLED:
+            traces.add(trace)
+
+
+def record(name: str, value: float = 1):
+    """Add to a counter of the node span running in this context; a no-op outside traced nodes."""
+    span = current_span.get()
+    if span is not None:
+        span.add(name, value)
+
+
+@contextmanager
+def timed_call(service: str):
+    """Time an outbound call: `<service>_request_duration_seconds` plus `<service>_requests`/`<service>_seconds` on the span."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.observe(f"{service}_request_duration_seconds", seconds)
+        record(f"{service}_requests")
+        record(f"{service}_seconds", seconds)
+
+
+def traced(func, name: Optional[str] = None):
+    """
+    Wrap a graph node so each run becomes a Span of the current request trace
+    and feeds the `graph_node_duration_seconds` and `graph_node_tokens`
+    histograms. Tokens are read from the `tokens_used` of the node's update,
+    so wrap the output of with_token_usage. Keeps the node's signature.
+    """
+    node = name or func.__name__
+
+    def finish(span, start, result):
+        span.duration_seconds = time.perf_counter() - start
+        if isinstance(result, dict):
+            span.tokens = result.get("tokens_used", 0)
+        metrics.observe("graph_node_duration_seconds", span.duration_seconds, node=node)
+        metrics.observe("graph_node_tokens", span.tokens, buckets=TOKEN_BUCKETS, node=node)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add_span(span)
+
+    def failed(span, error):
+        # interrupt() raises to pause the graph; that is not a node failure
+        span.status = "interrupted" if isinstance(error, GraphBubbleUp) else "error"
+        if span.status == "error":
+            metrics.increment("graph_node_errors_total", node=node)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def awrapper(*args, **kwargs):
+            span, start, result = Span(node), time.perf_counter(), None
+            token = current_span.set(span)
+            try:
+                result = await func(*args, **kwargs)
+                return result
+            except Exception as e:
+                failed(span, e)
+                raise
+            finally:
+                current_span.reset(token)
+                finish(span, start, result)
+        return awrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        span, start, result = Span(node), time.perf_counter(), None
+        token = current_span.set(span)
+        try:
+            result = func(*args, **kwargs)
+            return result
+        except Exception as e:
+            failed(span, e)
+            raise
+        finally:
+            current_span.reset(token)
+            finish(span, start, result)
+    return wrapper
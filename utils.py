@@ -1,3 +1,8 @@
+import os
+import threading
+import time
+
+
 class Utils:
     @staticmethod
     def read_txt_file(file_path):
@@ -22,3 +27,64 @@ class Utils:
             print(f"Error reading file: {str(e)}")
             return {} 
     
+
+
+class IntentKeywordIndex:
+    """
+    Keyword file compiled into a token -> categories hash map. The file is read
+    once and only re-read when its mtime changes (checked at most every
+    `check_interval` seconds), so scoring a question never touches the disk.
+    """
+
+    CATEGORIES = ("Location", "Business Model", "Investments", "Timeframe", "Customers")
+
+    def __init__(self, file_path, check_interval=5.0):
+        self.file_path = file_path
+        self.check_interval = check_interval
+        self.index = {}
+        self.mtime = None
+        self.last_check = 0.0
+        self.lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if self.index and now - self.last_check < self.check_interval:
+            return self.index
+        with self.lock:
+            self.last_check = now
+            try:
+                mtime = os.path.getmtime(self.file_path)
+            except OSError:
+                mtime = None
+            if not self.index or mtime != self.mtime:
+                index = self.compile(Utils.read_txt_file(self.file_path))
+                # A failed read keeps the previous index (if any) and retries next call
+                if index:
+                    self.index = index
+                    self.mtime = mtime
+        return self.index
+
+    @staticmethod
+    def compile(intention_dict):
+        index = {}
+        for category, keywords in (intention_dict or {}).items():
+            for keyword in keywords:
+                index.setdefault(keyword, set()).add(category)
+        return {keyword: frozenset(categories) for keyword, categories in index.items()}
+
+    @classmethod
+    def count(cls, tokens, index):
+        """Count, per category, the tokens whose lemma or text is one of its keywords."""
+        counts = dict.fromkeys(cls.CATEGORIES, 0)
+        for token in tokens:
+            lemma = token.lemma_.lower()
+            if len(lemma) <= 2:
+                continue
+            text = token.text.lower()
+            categories = index.get(lemma)
+            if text != lemma and text in index:
+                categories = index[text] if categories is None else categories | index[text]
+            if categories:
+                for category in categories:
+                    counts[category] += 1
+        return counts